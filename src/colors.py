@@ -1,7 +1,16 @@
 """Colors.
 
 Provides Colors from colorcet without needing to install colorcet.
+
+The colormaps are available as tuples of hex strings or RGB tuples, which Tk
+and single pixel writes use, and as [256, 3] uint8 lookup tables. With the
+tables, a whole array of activations is colored in one fancy-index instead of
+one tuple lookup per value.
 """
+from functools import lru_cache
+
+import numpy as np
+
 LINEAR = (
     '#000c7c', '#000c7e', '#000d80', '#000d82', '#000e83', '#000e85', '#000f87',
     '#000f89', '#00108b', '#00108c', '#00118e', '#001290', '#001292', '#001393',
@@ -138,3 +147,72 @@ DIVERGING = (
     '#c72b19', '#c62817', '#c62515', '#c52214', '#c41f12', '#c31c10', '#c3180e',
     '#c2140c', '#c10f09', '#c00907', '#bf0205 '
 )
+
+
+def _hex_to_lut(hex_colors) -> np.ndarray:
+    """Turns a tuple of hex strings into a [256, 3] uint8 table."""
+    lut = np.array([[int(c.strip()[i:i + 2], 16) for i in (1, 3, 5)]
+                    for c in hex_colors], dtype=np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+LINEAR_LUT = np.array(LINEAR_TUPLE, dtype=np.uint8)
+LINEAR_LUT.flags.writeable = False
+DIVERGING_LUT = _hex_to_lut(DIVERGING)
+
+_LUTS = {'linear': LINEAR_LUT, 'diverging': DIVERGING_LUT}
+
+
+def to_indices(values, vmin: float = 0., vmax: float = 1.) -> np.ndarray:
+    """Maps values in [vmin, vmax] to colormap indices in [0, 255].
+
+    Values outside the range are clipped.
+    """
+    values = (np.asarray(values, dtype=float) - vmin) * (255. / (vmax - vmin))
+    return np.clip(values, 0, 255).astype(np.intp)
+
+
+def apply_colormap(values, colormap: str = 'linear', vmin: float = 0.,
+                   vmax: float = 1.) -> np.ndarray:
+    """Colors a whole array of values in one call.
+
+    Args:
+        values: Array of any shape.
+        colormap: 'linear' or 'diverging'.
+        vmin: Value mapped to the first color.
+        vmax: Value mapped to the last color.
+
+    Returns:
+        uint8 array with the shape of values plus a last axis of 3 (RGB).
+    """
+    return _LUTS[colormap][to_indices(values, vmin, vmax)]
+
+
+@lru_cache(maxsize=64)
+def led_lut(brightness: float = 1., gamma: float = 1.,
+            colormap: str = 'linear') -> np.ndarray:
+    """Colormap with LED brightness and gamma correction folded in.
+
+    Each color channel c becomes 255 * brightness * (c / 255) ** gamma, so
+    the LED driver can be run at full brightness and the frame written as-is.
+    Tables are cached per brightness level.
+
+    Args:
+        brightness: Global brightness between 0 and 1.
+        gamma: Gamma correction exponent. 1 keeps the colors as they are.
+        colormap: 'linear' or 'diverging'.
+
+    Returns:
+        A read-only [256, 3] uint8 table.
+    """
+    lut = _LUTS[colormap] / 255.
+    lut = np.round(255. * brightness * lut ** gamma).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def led_colors(indices, brightness: float = 1., gamma: float = 1.,
+               colormap: str = 'linear') -> np.ndarray:
+    """Colors integer colormap indices for the LEDs in one fancy-index."""
+    return led_lut(brightness, gamma, colormap)[indices]
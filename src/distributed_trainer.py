@@ -0,0 +1,198 @@
+"""Distributed Trainer.
+
+Data-parallel training on the CPU using torch.distributed with the gloo
+backend on localhost. Each process trains on its own shard of the MNIST
+training set and gradients are all-reduced after every step. Rank 0 takes care
+of checkpointing and validation.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.optim import SGD, Adam
+from torch.nn import CrossEntropyLoss
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+
+from torchvision.datasets import MNIST
+from torchvision.transforms.transforms import ToTensor
+
+import os
+import socket
+from datetime import datetime
+from os.path import join
+from time import time
+
+from model import FCNetwork
+from trainer import Trainer
+
+
+def _free_port() -> int:
+    """Finds a free port on localhost for the process group."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _pin_cpus(rank: int, world_size: int) -> int:
+    """Pins the current process to its own slice of the available CPUs.
+
+    Returns:
+        The number of CPUs the process is pinned to.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        # Not supported on this platform, e.g. macOS or Windows
+        return max(1, (os.cpu_count() or 1) // world_size)
+    cpus = sorted(os.sched_getaffinity(0))
+    per_proc = max(1, len(cpus) // world_size)
+    start = (rank * per_proc) % len(cpus)
+    os.sched_setaffinity(0, cpus[start:start + per_proc])
+    return per_proc
+
+
+def _evaluate(network, test_loader) -> float:
+    """Validation accuracy of the network over the whole test loader."""
+    network.eval()
+    correct = 0
+    with torch.no_grad():
+        for img, cls in test_loader:
+            _, _, out = network(img)
+            correct += int((out.argmax(1) == cls).sum())
+    return correct / len(test_loader.dataset)
+
+
+def _train_worker(rank, world_size, port, root, result_dir, pin_cpus,
+                  batch_size, first_layer, second_layer, leaky, optimizer,
+                  optimizer_args, epochs, target_acc, stop_at_target,
+                  stats_queue):
+    """Training loop run by every process."""
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+
+    if pin_cpus:
+        torch.set_num_threads(_pin_cpus(rank, world_size))
+    else:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+
+    # Same seed everywhere so every replica starts with the same weights
+    torch.manual_seed(0)
+
+    train_data = MNIST(root, transform=ToTensor())
+    sampler = DistributedSampler(train_data, num_replicas=world_size,
+                                 rank=rank, shuffle=True)
+    # batch_size is the global batch size, so split it across processes
+    train_loader = DataLoader(train_data, max(1, batch_size // world_size),
+                              sampler=sampler)
+    if rank == 0:
+        test_data = MNIST(root, train=False, transform=ToTensor())
+        test_loader = DataLoader(test_data, 1000, shuffle=False)
+
+    network = FCNetwork(784, 10, first_layer, second_layer, leaky)
+    model = DistributedDataParallel(network)
+    if optimizer == 'sgd':
+        optimizer = SGD(model.parameters(), **optimizer_args)
+    elif optimizer == 'adam':
+        optimizer = Adam(model.parameters(), **optimizer_args)
+    loss_crit = CrossEntropyLoss()
+
+    samples = 0
+    train_time = 0.
+    time_to_target = None
+    validation_acc = 0.
+    epochs_run = 0
+    start_time = time()
+
+    for epoch in range(epochs):
+        sampler.set_epoch(epoch)
+        model.train()
+        epoch_start = time()
+        for i, (img, cls) in enumerate(train_loader):
+            optimizer.zero_grad()
+            _, _, out = model(img)
+            loss = loss_crit(out, cls)
+            loss.backward()  # DDP all-reduces the gradients here
+            optimizer.step()
+            samples += cls.shape[0]
+        train_time += time() - epoch_start
+        epochs_run += 1
+
+        stop = torch.zeros(1)
+        if rank == 0:
+            torch.save(network.state_dict(),
+                       join(result_dir, '{}.pth'.format(epoch + 1)))
+            validation_acc = _evaluate(network, test_loader)
+            print(f"Epoch {epoch + 1} validation accuracy: {validation_acc}")
+            if target_acc is not None and time_to_target is None \
+                    and validation_acc >= target_acc:
+                time_to_target = time() - start_time
+                if stop_at_target:
+                    stop[0] = 1
+        dist.broadcast(stop, 0)
+        if stop.item():
+            break
+
+    total_samples = torch.tensor([samples], dtype=torch.float64)
+    dist.all_reduce(total_samples)
+
+    if rank == 0:
+        stats_queue.put({
+            'processes': world_size,
+            'epochs': epochs_run,
+            'samples': int(total_samples.item()),
+            'train_time': train_time,
+            'samples_per_sec': total_samples.item() / train_time,
+            'time_to_target': time_to_target,
+            'validation_acc': validation_acc,
+            'wall_time': time() - start_time
+        })
+    dist.destroy_process_group()
+
+
+class DistributedTrainer(Trainer):
+    def train(self, batch_size: int, first_layer: int, second_layer: int,
+              leaky: tuple, optimizer: str, optimizer_args: dict,
+              epochs: int, num_procs: int = 2, pin_cpus: bool = True,
+              target_acc: float = None,
+              stop_at_target: bool = False) -> dict:
+        """Performs data-parallel training on the network.
+
+        Args:
+            batch_size: Global batch size. Each process uses
+                batch_size // num_procs.
+            first_layer: Number of nodes in the first layer.
+            second_layer: Number of nodes in the second layer.
+            leaky: Configuration of leaky ReLU.
+            optimizer: The optimizer to use. Either "sgd" or "adam".
+            optimizer_args: Arguments for the optimizer
+            epochs: Number of epochs to run for.
+            num_procs: Number of processes to train with.
+            pin_cpus: Whether to pin each process to its own set of CPUs.
+            target_acc: Validation accuracy to measure the time to.
+            stop_at_target: Whether to stop once target_acc is reached.
+
+        Returns:
+            Statistics of the run, with samples/sec and time to target_acc.
+        """
+        print(f"Initializing training on {num_procs} processes...")
+        print(f"Results saved in {self.result_dir}")
+        ctx = mp.get_context('spawn')
+        stats_queue = ctx.SimpleQueue()
+        mp.spawn(_train_worker,
+                 args=(num_procs, _free_port(), self.root, self.result_dir,
+                       pin_cpus, batch_size, first_layer, second_layer,
+                       leaky, optimizer, optimizer_args, epochs, target_acc,
+                       stop_at_target, stats_queue),
+                 nprocs=num_procs, join=True)
+        return stats_queue.get()
+
+
+if __name__ == '__main__':
+    current_time_str = datetime.now().strftime('%Y-%m-%d-%H_%M_%S')
+    t = DistributedTrainer('MNIST', join('work_dir', current_time_str))
+    print(t.train(50, 10, 15, (False, False, False), 'sgd',
+                  {'momentum': 0.9409782496856666,
+                   'lr': 0.0038795787201773}, 20, num_procs=4))
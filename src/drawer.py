@@ -1,24 +1,189 @@
 """Drawer.
 
 Allows the user to draw the number instead of using the MNIST dataset.
+
+The 280 x 280 drawing is downsampled to the 28 x 28 network input, and the
+number is classified again while it is being drawn. A stroke only changes a
+few input pixels, so the input is fed to an IncrementalModel, which only
+adds the change of those pixels to the first layer.
+
+Usage, from the src directory:
+    python drawer.py MODEL
+
+Draw with the left mouse button, clear with the right one.
 """
 import tkinter as tk
-from PIL import Image, ImageTk
+from argparse import ArgumentParser
+from time import perf_counter
+
 import numpy as np
-from skimage.draw import circle_perimeter_aa
+
+from model import IncrementalModel
+from utils.state_dict import load_state_dict
 
 
 class DrawFrame(tk.Frame):
-    def __init__(self, master=None, width=280, height=280):
+    def __init__(self, master=None, model: IncrementalModel = None,
+                 width=280, height=280, brush_radius: float = 12.,
+                 on_predict=None):
+        """Creates the frame to draw in.
+
+        Args:
+            master: Parent widget.
+            model: The model to classify the drawing with, or None to only
+                draw.
+            width: Width of the drawing, a multiple of 28.
+            height: Height of the drawing, a multiple of 28.
+            brush_radius: Radius of the brush in drawing pixels.
+            on_predict: Function called with (h1, h2, pred) every time the
+                drawing changes the network input.
+        """
         super().__init__(master=master, width=width, height=height)
-        self.img_array =  np.array([28, 28], int)
-        self.img = ImageTk.PhotoImage(image=Image.new('L', (280, 280)))
+        self.model = model
+        self.on_predict = on_predict
+        self.brush_radius = brush_radius
+        self.scale = width // 28
+        self.drawing = np.zeros([height, width], np.uint8)
+        self.img_array = np.zeros([28, 28], np.uint8)
+        self._last = None
+
+        # Brush with antialiased edges, as values between 0 and 255
+        r = int(np.ceil(brush_radius))
+        yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+        self._brush = (np.clip(brush_radius + 0.5 - np.hypot(yy, xx), 0, 1)
+                       * 255).astype(np.uint8)
+
+        # Statistics of the time from a mouse event to a new prediction
+        self.strokes = 0
+        self.stroke_time = 0.
+        self.max_stroke_time = 0.
 
         # Set up canvas
-        self.canvas = tk.Canvas(self, width=280, height=280)
-        self.canvas_image = self.canvas.create_image(0, 0, anchor="nw",
-                                                     image=self.img)
+        self.canvas = tk.Canvas(self, width=width, height=height,
+                                background='black', highlightthickness=0)
         self.canvas.pack()
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.bind('<B1-Motion>', self.on_drag)
+        self.canvas.bind('<ButtonRelease-1>', self.on_release)
+        self.canvas.bind('<Button-3>', lambda event: self.clear())
 
     def on_click(self, event):
         """On click action."""
+        self._last = (event.x, event.y)
+        self.draw_segment(event.x, event.y, event.x, event.y)
+
+    def on_drag(self, event):
+        if self._last is None:
+            self._last = (event.x, event.y)
+        self.draw_segment(*self._last, event.x, event.y)
+        self._last = (event.x, event.y)
+
+    def on_release(self, event):
+        self._last = None
+
+    def draw_segment(self, x0: int, y0: int, x1: int, y1: int):
+        """Draws a stroke segment and classifies the drawing again."""
+        start = perf_counter()
+        self._stamp(x0, y0, x1, y1)
+        changed = self._downsample(x0, y0, x1, y1)
+        if changed and self.model is not None:
+            h1, h2, out = self.model.outputs()
+            pred = int(out.argmax())
+            elapsed = perf_counter() - start
+            self.strokes += 1
+            self.stroke_time += elapsed
+            self.max_stroke_time = max(self.max_stroke_time, elapsed)
+            if self.on_predict is not None:
+                self.on_predict(h1, h2, pred)
+
+        d = self.brush_radius
+        self.canvas.create_oval(x1 - d, y1 - d, x1 + d, y1 + d,
+                                fill='white', outline='')
+        if (x0, y0) != (x1, y1):
+            self.canvas.create_line(x0, y0, x1, y1, width=2 * d,
+                                    fill='white')
+
+    def _stamp(self, x0: int, y0: int, x1: int, y1: int):
+        """Stamps the brush along the segment into the drawing."""
+        r = self._brush.shape[0] // 2
+        h, w = self.drawing.shape
+        steps = max(int(np.hypot(x1 - x0, y1 - y0) / (r / 2)), 1)
+        for t in np.linspace(0, 1, steps + 1):
+            x = int(round(x0 + (x1 - x0) * t))
+            y = int(round(y0 + (y1 - y0) * t))
+            # Clip the brush to the drawing
+            top, left = max(y - r, 0), max(x - r, 0)
+            bottom, right = min(y + r + 1, h), min(x + r + 1, w)
+            if top >= bottom or left >= right:
+                continue
+            region = self.drawing[top:bottom, left:right]
+            np.maximum(region, self._brush[top - y + r:bottom - y + r,
+                                           left - x + r:right - x + r],
+                       out=region)
+
+    def _downsample(self, x0: int, y0: int, x1: int, y1: int) -> bool:
+        """Downsamples the blocks the segment touched into img_array.
+
+        Returns:
+            Whether any input pixel changed.
+        """
+        r = self._brush.shape[0] // 2
+        s = self.scale
+        top = max(min(y0, y1) - r, 0) // s
+        left = max(min(x0, x1) - r, 0) // s
+        bottom = min((max(y0, y1) + r) // s + 1, 28)
+        right = min((max(x0, x1) + r) // s + 1, 28)
+        if top >= bottom or left >= right:
+            return False
+
+        blocks = self.drawing[top * s:bottom * s, left * s:right * s]
+        blocks = blocks.reshape(bottom - top, s, right - left, s).mean((1, 3))
+        blocks = blocks.round().astype(np.uint8)
+        old = self.img_array[top:bottom, left:right]
+        rows, cols = np.nonzero(blocks != old)
+        if len(rows) == 0:
+            return False
+        values = blocks[rows, cols]
+        old[rows, cols] = values
+        if self.model is not None:
+            self.model.update((rows + top) * 28 + cols + left, values / 255.)
+        return True
+
+    def clear(self):
+        """Clears the drawing."""
+        self.drawing[:] = 0
+        self.img_array[:] = 0
+        self.canvas.delete('all')
+        if self.model is not None:
+            self.model.reset()
+            if self.on_predict is not None:
+                self.on_predict(*self.model.outputs()[:2],
+                                self.model.predict())
+
+    def report(self) -> str:
+        mean = self.stroke_time / self.strokes if self.strokes else 0.
+        return "{} stroke updates, {:.3f}ms mean, {:.3f}ms max latency." \
+            .format(self.strokes, mean * 1000, self.max_stroke_time * 1000)
+
+
+def parse_args():
+    p = ArgumentParser(description='classifies a number drawn by the user')
+    p.add_argument('MODEL', type=str, help='path to the NN model')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    window = tk.Tk()
+    window.title('Draw a number')
+    label = tk.Label(window, text='Prediction: -', font=('Helvetica', 24))
+
+    def show_prediction(h1, h2, pred):
+        label.configure(text=f'Prediction: {pred}')
+
+    frame = DrawFrame(window, IncrementalModel(load_state_dict(args.MODEL)),
+                      on_predict=show_prediction)
+    frame.pack()
+    label.pack()
+    window.mainloop()
+    print(frame.report())
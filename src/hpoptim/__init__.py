@@ -1,3 +1,13 @@
-from .search_worker import SearchWorker
+# The training dependencies of SearchWorker are optional, so that the sweep
+# and result tools can be used without them
+OPTIONAL_DEPENDENCIES = ('torch', 'torchvision', 'ConfigSpace', 'hpbandster')
 
-__all__ = ['SearchWorker']
\ No newline at end of file
+__all__ = []
+
+try:
+    from .search_worker import SearchWorker
+except ImportError as e:
+    if e.name is None or e.name.split('.')[0] not in OPTIONAL_DEPENDENCIES:
+        raise
+else:
+    __all__.append('SearchWorker')
@@ -0,0 +1,267 @@
+"""ASHA.
+
+Asynchronous successive halving (ASHA) on a local process pool. Unlike the
+synchronous brackets of BOHB, promotions are decided as soon as results arrive:
+whenever a worker is free it gets the best not yet promoted config of the
+highest rung that has one in its top 1/eta, and otherwise a new config at the
+lowest rung. No worker waits at a rung barrier.
+
+Trials are run with SearchWorker.compute() on configs sampled from
+SearchWorker.get_configspace(). With a checkpoint store, promoted configs
+resume from their lower rung.
+
+Usage, from the src directory:
+    python -m hpoptim.asha DATA OUT MIN_BUDGET MAX_BUDGET --workers 4 \
+        --trials 100
+
+References:
+    A System for Massively Parallel Hyperparameter Tuning
+        <https://arxiv.org/abs/1810.05934>
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from os.path import join
+from pathlib import Path
+from time import time
+
+import torch
+import torch.multiprocessing as mp
+
+from hpoptim.search_worker import SearchWorker
+from hpoptim.shared_data import load_shared_mnist
+from hpoptim.checkpoint_store import CheckpointStore
+
+
+class ASHA:
+    def __init__(self, configspace, min_budget: float, max_budget: float,
+                 eta: int = 3, max_trials: int = None, seed: int = None):
+        """Creates the scheduler.
+
+        Args:
+            configspace: ConfigSpace to sample new configs from.
+            min_budget: Budget of the lowest rung.
+            max_budget: Budget of the highest rung.
+            eta: Reduction factor. The top 1/eta of a rung gets promoted.
+            max_trials: Maximum number of configs to start. None for no limit.
+            seed: Seed of the config space sampler.
+        """
+        self.configspace = configspace
+        if seed is not None:
+            self.configspace.seed(seed)
+        self.eta = eta
+        self.max_trials = max_trials
+
+        self.budgets = []
+        budget = min_budget
+        while budget < max_budget:
+            self.budgets.append(budget)
+            budget *= eta
+        self.budgets.append(max_budget)
+
+        self.configs = dict()  # config_id -> config
+        self.rungs = [dict() for _ in self.budgets]  # config_id -> loss
+        self.promoted = [set() for _ in self.budgets]
+
+    def get_job(self):
+        """Decides what to run next.
+
+        Returns:
+            (config_id, config, rung) or None if no new trials may start.
+        """
+        for k in reversed(range(len(self.budgets) - 1)):
+            rung = self.rungs[k]
+            top = sorted(rung, key=rung.get)[:len(rung) // self.eta]
+            for config_id in top:
+                if config_id not in self.promoted[k]:
+                    self.promoted[k].add(config_id)
+                    return config_id, self.configs[config_id], k + 1
+
+        if self.max_trials is not None \
+                and len(self.configs) >= self.max_trials:
+            return None
+        # Same shape as hpbandster config ids, so the checkpoint store works
+        config_id = (0, 0, len(self.configs))
+        config = self.configspace.sample_configuration().get_dictionary()
+        self.configs[config_id] = config
+        return config_id, config, 0
+
+    def report(self, config_id, rung: int, loss: float):
+        """Registers the result of a trial."""
+        if loss is None:
+            # Crashed trials should never be promoted
+            loss = float('inf')
+        self.rungs[rung][config_id] = loss
+
+    def incumbent(self):
+        """Best config of the highest rung reached so far."""
+        for k in reversed(range(len(self.budgets))):
+            if self.rungs[k]:
+                config_id = min(self.rungs[k], key=self.rungs[k].get)
+                return config_id, self.budgets[k], self.rungs[k][config_id]
+        return None
+
+
+def scheduling_report(jobs: list, n_workers: int, best_finish: float) -> str:
+    """Worker utilization and time to the best config.
+
+    Used for both ASHA and bohb.py so the two can be compared.
+
+    Args:
+        jobs: (started, finished) timestamps of every trial.
+        n_workers: Number of workers.
+        best_finish: Timestamp the final best result finished at.
+    """
+    start = min(j[0] for j in jobs)
+    wall = max(j[1] for j in jobs) - start
+    busy = sum(j[1] - j[0] for j in jobs)
+    return ("{} trials in {:.1f}s on {} workers. Worker utilization: {:.1f}%."
+            " Time to best config: {:.1f}s.".format(
+                len(jobs), wall, n_workers,
+                100. * busy / (n_workers * wall) if wall > 0 else 100.,
+                best_finish - start))
+
+
+_worker = None
+
+
+def _init_worker(data_path, logging_path, datasets, threads, checkpoint_dir,
+                 checkpoint_quota):
+    """Builds the SearchWorker of a pool process once."""
+    global _worker
+    torch.set_num_threads(threads)
+    store = CheckpointStore(checkpoint_dir,
+                            int(checkpoint_quota * 1024 ** 2)) \
+        if checkpoint_quota > 0 else None
+    # Only compute() is used, so the worker never connects to a nameserver
+    _worker = SearchWorker(data_path, logging_path, datasets=datasets,
+                           checkpoint_store=store, run_id='asha')
+
+
+def _run_job(config_id, config, rung, budget):
+    started = time()
+    try:
+        result = _worker.compute(config, budget, config_id=config_id)
+    except Exception as e:
+        result = {'loss': None, 'info': {'exception': repr(e)}}
+    return config_id, rung, budget, result, started, time()
+
+
+def run_asha(data_path, output_dir, min_budget, max_budget, n_workers=1,
+             max_trials=100, eta=3, threads=None, checkpoint_quota=1024,
+             time_limit=None, seed=None):
+    """Runs ASHA on a local process pool.
+
+    Args:
+        data_path: Path to the data folder.
+        output_dir: Directory for the results.
+        min_budget: Budget of the lowest rung, in epochs.
+        max_budget: Budget of the highest rung, in epochs.
+        n_workers: Number of worker processes.
+        max_trials: Number of configs to start.
+        eta: Reduction factor.
+        threads: Torch threads per worker. Defaults to cpus // n_workers.
+        checkpoint_quota: Disk quota of the checkpoint store in MB. 0
+            disables resuming promoted configs.
+        time_limit: Stop starting new trials after this many seconds.
+        seed: Seed of the config sampler.
+
+    Returns:
+        The scheduler, holding all results.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    scheduler = ASHA(SearchWorker.get_configspace(), min_budget, max_budget,
+                     eta, max_trials, seed)
+    datasets = load_shared_mnist(data_path)
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    jobs = []
+    best = (float('inf'), None)
+    start_time = time()
+    pool = ProcessPoolExecutor(
+        n_workers, mp.get_context('spawn'), initializer=_init_worker,
+        initargs=(data_path, join(output_dir, 'logging'), datasets, threads,
+                  join(output_dir, 'checkpoints'), checkpoint_quota))
+    with pool, open(join(output_dir, 'results.jsonl'), 'a') as store:
+        pending = set()
+        accepting = True
+        while True:
+            while accepting and len(pending) < n_workers:
+                if time_limit is not None \
+                        and time() - start_time > time_limit:
+                    accepting = False
+                    break
+                job = scheduler.get_job()
+                if job is None:
+                    # Only promotions are left, which depend on results
+                    break
+                config_id, config, rung = job
+                pending.add(pool.submit(_run_job, config_id, config, rung,
+                                        scheduler.budgets[rung]))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                config_id, rung, budget, result, started, finished = \
+                    future.result()
+                loss = result['loss']
+                scheduler.report(config_id, rung, loss)
+                jobs.append((started, finished))
+                # Best at the highest rung wins, ties go to the earliest
+                key = (-rung, loss if loss is not None else float('inf'))
+                if best[1] is None or key < best[1]:
+                    best = (finished, key)
+                store.write(json.dumps({
+                    'config_id': list(config_id), 'rung': rung,
+                    'budget': budget, 'loss': loss, 'info': result['info'],
+                    'config': scheduler.configs[config_id],
+                    'started': started - start_time,
+                    'finished': finished - start_time}) + '\n')
+                store.flush()
+                print("Trial {} rung {} (budget {}) finished: loss {}".format(
+                    config_id, rung, budget, loss))
+
+    if jobs:
+        print(scheduling_report(jobs, n_workers, best[0]))
+    return scheduler
+
+
+def parse_args():
+    p = ArgumentParser(description='runs an asynchronous successive halving '
+                                   'search for hyperparameters')
+    p.add_argument('data_path', type=str, help='path to the data folder')
+    p.add_argument('output_dir', type=str,
+                   help='directory for the result output')
+    p.add_argument('min_budget', type=float, help='minimum budget in epochs')
+    p.add_argument('max_budget', type=float, help='maximum budget in epochs')
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--trials', type=int, default=100,
+                   help='number of configs to start')
+    p.add_argument('--eta', type=int, default=3)
+    p.add_argument('--threads', type=int, default=None)
+    p.add_argument('--checkpoint_quota', type=float, default=1024)
+    p.add_argument('--time_limit', type=float, default=None)
+    p.add_argument('--seed', type=int, default=None)
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    output_dir = join(args.output_dir,
+                      datetime.now().strftime('%Y_%m_%d--%H_%M_%S'))
+    scheduler = run_asha(args.data_path, output_dir, args.min_budget,
+                         args.max_budget, args.workers, args.trials, args.eta,
+                         args.threads, args.checkpoint_quota, args.time_limit,
+                         args.seed)
+    incumbent = scheduler.incumbent()
+    if incumbent is not None:
+        config_id, budget, loss = incumbent
+        print("Best found configuration (budget {}, loss {:.4f}): {}".format(
+            budget, loss, scheduler.configs[config_id]))
@@ -11,15 +11,26 @@ References:
 """
 import argparse
 import datetime
+import json
 import os
 import pickle
 import traceback
 
+import torch
+import torch.multiprocessing as mp
+
 import hpbandster.core.nameserver as hpns
 import hpbandster.core.result as hpres
 
 from hpbandster.optimizers import BOHB as BOHB
 from hpoptim import SearchWorker
+from hpoptim.shared_data import load_shared_mnist
+from hpoptim.checkpoint_store import CheckpointStore
+from hpoptim.memo import ResultMemo
+from hpoptim.latency import LatencyTable, pareto_front
+from hpoptim.asha import scheduling_report
+from hpoptim.pruners import (NoPruner, MedianPruner, DivergencePruner,
+                             CombinedPruner)
 
 import logging
 
@@ -34,55 +45,265 @@ def parse_args():
                         help='path to the data folder')
     parser.add_argument('output_dir', metavar='O', type=str,
                         help='directory for the result output')
-    parser.add_argument('min_budget', metavar='L', type=int,
-                        help='minimum budget to use during optimization')
-    parser.add_argument('max_budget', metavar='M', type=int,
-                        help='maximum budget to use during optimization')
+    parser.add_argument('min_budget', metavar='L', type=float,
+                        help='minimum budget to use during optimization. '
+                             'Its meaning depends on --fidelity')
+    parser.add_argument('max_budget', metavar='M', type=float,
+                        help='maximum budget to use during optimization. '
+                             'Its meaning depends on --fidelity')
     parser.add_argument('iterations', metavar='I', type=int,
                         help='number of iterations to perform')
+    parser.add_argument('--pruner', type=str, default='none',
+                        choices=['none', 'median', 'divergence', 'both'],
+                        help='pruner used to stop hopeless trials early. The '
+                             'median pruner compares against the trials of '
+                             'all workers')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes to run in parallel')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='torch threads per worker. Defaults to the '
+                             'number of CPUs divided by the number of '
+                             'workers')
+    parser.add_argument('--checkpoint_quota', type=float, default=1024,
+                        help='disk quota in MB of the checkpoint store used '
+                             'to resume promoted configs. 0 disables it')
+    parser.add_argument('--fidelity', type=str, default='epochs',
+                        choices=['epochs', 'fraction', 'epochs_fraction'],
+                        help='what the budget means: epochs, fraction of the '
+                             'training set (e.g. L=0.01 M=1), or passes over '
+                             'the training set where a budget below 1 is a '
+                             'single epoch on that fraction. Epoch budgets '
+                             'are rounded to whole epochs, at least 1')
+    parser.add_argument('--previous', type=str, nargs='+', default=[],
+                        help='output directories of previous runs to warm '
+                             'start from and reuse results of')
+    parser.add_argument('--no_memo', action='store_true',
+                        help='train configs again even if they were already '
+                             'evaluated at the same budget, in this run by '
+                             'any worker or in a previous run with the same '
+                             'fidelity, pruner and latency settings')
+    parser.add_argument('--latency_table', type=str, default=None,
+                        help='JSON latency table of the NumpyModel, built '
+                             'with hpoptim/latency.py. Missing shapes are '
+                             'measured on the worker')
+    parser.add_argument('--latency_weight', type=float, default=0.,
+                        help='loss added per ms of batch 1 latency')
+    parser.add_argument('--fraction_epochs', type=int, default=1,
+                        help='epochs to train for when --fidelity fraction')
 
     return parser.parse_args()
 
 
-def run_optimization(args):
+# Settings that change what the loss of a trial at a budget means. Results of
+# previous runs are only memoized if these were the same.
+OBJECTIVE_SETTINGS = ('fidelity', 'fraction_epochs', 'pruner',
+                      'latency_weight', 'latency_table')
+RUN_SETTINGS_FILE = 'run_settings.json'
+
+
+def make_pruner(name, median_history=None):
+    """Creates the pruner with the given name.
+
+    Args:
+        name (str): One of the --pruner choices.
+        median_history (dict): History of the MedianPruner, shared between
+            the workers, or None for a history of this worker only.
+    """
+    if name == 'median':
+        return MedianPruner(history=median_history)
+    elif name == 'divergence':
+        return DivergencePruner()
+    elif name == 'both':
+        return CombinedPruner(MedianPruner(history=median_history),
+                              DivergencePruner())
+    return NoPruner()
+
+
+def load_previous_runs(run_dirs):
+    """Loads the results of previous runs.
+
+    Args:
+        run_dirs (list): Output directories of previous runs, each containing
+            the results.json and configs.json of the json_result_logger.
+
+    Returns:
+        list: The hpbandster Result of each run.
+        hpres.Result: All runs merged into one Result to warm start from, or
+            None if there are no previous runs.
+    """
+    results = [hpres.logged_results_to_HBS_result(d) for d in run_dirs]
+    if not results:
+        return results, None
+
+    # Config ids restart at (0, 0, 0) for every run, so move each run to its
+    # own range of iteration numbers before merging.
+    merged = dict()
+    offset = 0
+    for res in results:
+        max_iteration = -1
+        for config_id, datum in res.data.items():
+            merged[(config_id[0] + offset,) + tuple(config_id[1:])] = datum
+            max_iteration = max(max_iteration, config_id[0])
+        offset += max_iteration + 1
+
+    hb_config = dict(results[0].HB_config)
+    if 'budgets' in hb_config:
+        hb_config['budgets'] = sorted({b for res in results
+                                       for b in res.HB_config['budgets']})
+    combined = hpres.Result([], hb_config)
+    combined.data = merged
+    return results, combined
+
+
+def objective_settings(args) -> dict:
+    """The OBJECTIVE_SETTINGS of a run, as saved in RUN_SETTINGS_FILE."""
+    return {k: getattr(args, k) for k in OBJECTIVE_SETTINGS}
+
+
+def matching_runs(run_dirs, results, settings):
+    """The results of the previous runs that had the same objective settings.
+
+    Runs without a RUN_SETTINGS_FILE, e.g. from before it was written, don't
+    match, since their losses may be on a different scale.
+    """
+    matching = []
+    for run_dir, res in zip(run_dirs, results):
+        try:
+            with open(os.path.join(run_dir, RUN_SETTINGS_FILE)) as file:
+                previous = json.load(file)
+        except (OSError, ValueError):
+            previous = None
+        if previous == settings:
+            matching.append(res)
+        else:
+            print("Not reusing the results of {}: its {} with this run's."
+                  .format(run_dir, 'settings are unknown' if previous is None
+                          else 'settings differ ({})'.format(', '.join(
+                              k for k in settings
+                              if previous.get(k) != settings[k]))))
+    return matching
+
+
+def run_worker(worker_id, args, output_dir, datasets, threads, memo,
+               median_history, run_id, ns_host, ns_port):
+    """Runs a single search worker. Used as a worker process target."""
+    # Cap the threads so N workers don't oversubscribe the CPU
+    torch.set_num_threads(threads)
+    if args.checkpoint_quota > 0:
+        store = CheckpointStore(os.path.join(output_dir, "checkpoints"),
+                                int(args.checkpoint_quota * 1024 ** 2))
+    else:
+        store = None
+    if args.latency_table is not None or args.latency_weight > 0:
+        latency_table = LatencyTable(args.latency_table)
+    else:
+        latency_table = None
+    w = SearchWorker(args.data_path, os.path.join(output_dir, "logging"),
+                     pruner=make_pruner(args.pruner, median_history),
+                     datasets=datasets, checkpoint_store=store,
+                     fidelity=args.fidelity,
+                     fraction_epochs=args.fraction_epochs,
+                     memo=memo, latency_table=latency_table,
+                     latency_weight=args.latency_weight,
+                     nameserver=ns_host, nameserver_port=ns_port,
+                     run_id=run_id, id=worker_id)
+    w.run(background=False)
+
+
+def latency_pareto_front(res):
+    """Pareto front of accuracy vs. batch 1 latency over all configs.
+
+    Each config is represented by its run with the largest budget.
+    """
+    id2config = res.get_id2config_mapping()
+    largest = dict()
+    for r in res.get_all_runs():
+        if r.info is None or r.loss is None:
+            continue
+        if r.config_id not in largest \
+                or r.budget > largest[r.config_id].budget:
+            largest[r.config_id] = r
+    points = []
+    for config_id, r in largest.items():
+        latency_keys = sorted((k for k in r.info
+                               if k.startswith('latency batch ')),
+                              key=lambda k: int(k.split()[2]))
+        if not latency_keys:
+            continue
+        points.append({'config_id': config_id,
+                       'budget': r.budget,
+                       'accuracy': r.info['validation accuracy'],
+                       'latency': r.info[latency_keys[0]],
+                       'latencies': {k: r.info[k] for k in latency_keys},
+                       'config': id2config[config_id]['config']})
+    return pareto_front(points)
+
+
+def run_optimization(args, output_dir):
     """Runs the optimization process."""
     print("Starting name server.")
     date_time = datetime.datetime.now().strftime('%Y-%m-%d-%H_%M_%S')
 
     # First start nameserver
     NS = hpns.NameServer(run_id=date_time, host='127.0.0.1', port=None)
-    NS.start()
+    ns_host, ns_port = NS.start()
 
-    print("Preparing result logger and loading previous run, if it exists.")
+    print("Preparing result logger and loading previous runs, if given.")
 
     # Also start result logger
-    output_dir = os.path.join(args.output_dir,
-                              datetime.datetime.now()
-                              .strftime('%Y_%m_%d--%H_%M_%S'))
-    result_logger_path = os.path.join(output_dir, 'results_log.json')
     best_result_path = os.path.join(output_dir, 'best_config.txt')
 
-    print("Result logger will be written to %s" % result_logger_path)
-    if os.path.exists(result_logger_path):
-        previous_run = hpres.logged_results_to_HBS_result(result_logger_path)
+    print("Result logger will be written to %s" % output_dir)
+    settings = objective_settings(args)
+    with open(os.path.join(output_dir, RUN_SETTINGS_FILE), 'w') as file:
+        json.dump(settings, file, indent=2)
+    previous_results, previous_run = load_previous_runs(args.previous)
+    ctx = mp.get_context('spawn')
+    # The memo and the median pruner history are kept in a manager process,
+    # so what one worker stores is seen by all the others
+    manager = ctx.Manager()
+    if args.pruner in ('median', 'both'):
+        median_history = manager.dict()
+    else:
+        median_history = None
+    if args.no_memo:
+        memo = None
     else:
-        previous_run = None
+        memo = ResultMemo(manager.dict(ResultMemo.from_hpbandster(
+            matching_runs(args.previous, previous_results, settings))
+            .results))
+    if previous_run is not None:
+        print("Warm starting from {} previous run(s) with {} configs, {} "
+              "memoized results.".format(len(previous_results),
+                                         len(previous_run.data),
+                                         len(memo) if memo else 0))
 
     result_logger = hpres.json_result_logger(directory=output_dir,
                                              overwrite=True)
 
-    print("Starting search worker.\n")
+    print("Starting {} search worker(s).\n".format(args.workers))
 
-    # Then start worker
-    w = SearchWorker(args.data_path, os.path.join(output_dir, "logging"),
-                     nameserver='127.0.0.1', run_id=date_time)
-    w.run(background=True)
+    # Load the data once into shared memory, then start the workers
+    datasets = load_shared_mnist(args.data_path)
+    threads = args.threads
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    workers = []
+    for i in range(args.workers):
+        p = ctx.Process(target=run_worker,
+                        args=(i, args, output_dir, datasets, threads, memo,
+                              median_history, date_time, ns_host, ns_port),
+                        daemon=True)
+        p.start()
+        workers.append(p)
 
     print("Initializing optimizer.")
     # Run the optimizer
-    bohb = BOHB(configspace=w.get_configspace(),
+    bohb = BOHB(configspace=SearchWorker.get_configspace(),
                 run_id=date_time,
-                nameserver='127.0.0.1',
+                nameserver=ns_host,
+                nameserver_port=ns_port,
                 result_logger=result_logger,
                 min_budget=args.min_budget,
                 max_budget=args.max_budget,
@@ -90,14 +311,34 @@ def run_optimization(args):
 
     print("Initialization complete. Starting optimization run.")
 
-    res = bohb.run(n_iterations=args.iterations)
+    # Wait for all workers so every one of them is kept busy from the start
+    res = bohb.run(n_iterations=args.iterations, min_n_workers=args.workers)
 
     print("Optimization complete.")
+    infos = [r.info for r in res.get_all_runs() if r.info is not None]
+    print("Epochs run: {}, epochs saved by pruning: {}, epochs reused from "
+          "checkpoints: {}".format(
+              sum(i.get('epochs run', 0) for i in infos),
+              sum(i.get('epochs saved', 0) for i in infos),
+              sum(i.get('epochs reused', 0) for i in infos)))
+    print("Trials avoided through memoization: {}".format(
+        sum(1 for i in infos if i.get('memoized', False))))
     output_fp = os.path.join(output_dir, 'results.pkl')
 
     id2config = res.get_id2config_mapping()
     incumbent = res.get_incumbent_id()
 
+    # Same measurements as hpoptim/asha.py, to compare the two schedulers
+    runs = [r for r in res.get_all_runs() if r.time_stamps]
+    if runs:
+        incumbent_run = max((r for r in res.get_runs_by_id(incumbent)
+                             if r.time_stamps),
+                            key=lambda r: r.budget)
+        print(scheduling_report([(r.time_stamps['started'],
+                                  r.time_stamps['finished']) for r in runs],
+                                args.workers,
+                                incumbent_run.time_stamps['finished']))
+
     print("Results will be saved at:\n{}".format(output_fp))
     print("Best found configuration: ", id2config[incumbent]['config'])
 
@@ -109,8 +350,20 @@ def run_optimization(args):
     with open(output_fp, mode='wb') as file:
         pickle.dump(res, file)
 
+    front = latency_pareto_front(res)
+    if front:
+        print("Pareto front of accuracy vs. latency:")
+        for point in front:
+            print("    {:.4f}% at {:.4f}ms: {}".format(
+                point['accuracy'] * 100, point['latency'], point['config']))
+        with open(os.path.join(output_dir, 'pareto_front.json'), 'w') as file:
+            json.dump([{**p, 'config_id': list(p['config_id'])}
+                       for p in front], file, indent=2)
+
     # Shutdown after completion
     bohb.shutdown(shutdown_workers=True)
+    for p in workers:
+        p.join(timeout=10)
     NS.shutdown()
 
 
@@ -129,7 +382,14 @@ if __name__ == '__main__':
                  "    Output dir:     {}\n".format(output_dir),
                  "    Minimum budget: {}\n".format(args.min_budget),
                  "    Maximum budget: {}\n".format(args.max_budget),
-                 "    Iterations:     {}\n".format(args.iterations)]
+                 "    Iterations:     {}\n".format(args.iterations),
+                 "    Pruner:         {}\n".format(args.pruner),
+                 "    Workers:        {}\n".format(args.workers),
+                 "    Ckpt quota MB:  {}\n".format(args.checkpoint_quota),
+                 "    Fidelity:       {}\n".format(args.fidelity),
+                 "    Latency weight: {}\n".format(args.latency_weight),
+                 "    Previous runs:  {}\n".format(
+                     ', '.join(args.previous) or 'none')]
         with open(os.path.join(output_dir, 'optimizer_configuration.txt'),
                   'w') as file:
             # Write configuration to file so we remember what happened
@@ -139,7 +399,7 @@ if __name__ == '__main__':
             # Print out of the current configuration
             print(line, end='')
 
-        run_optimization(args)
+        run_optimization(args, output_dir)
     finally:
         exception_encountered = traceback.format_exc(0)
         if "SystemExit" in exception_encountered \
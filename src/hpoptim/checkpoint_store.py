@@ -0,0 +1,135 @@
+"""Checkpoint Store.
+
+Stores model and optimizer states keyed by config id and budget so that a
+configuration promoted by BOHB to a higher budget can resume training from the
+lower budget instead of starting again from epoch 0.
+
+The store is a plain directory, so it can be shared by several worker
+processes. The least recently used checkpoints are evicted once the directory
+grows past the disk quota.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import torch
+
+import os
+from os.path import join, exists, getsize, getmtime
+from pathlib import Path
+
+
+class CheckpointStore:
+    def __init__(self, directory: str, max_bytes: int = 1024 ** 3):
+        """Creates the checkpoint store.
+
+        Args:
+            directory: Directory to store the checkpoints in.
+            max_bytes: Disk quota of the store. Defaults to 1 GiB.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _key(config_id) -> str:
+        """Turns an hpbandster config id tuple into a file name prefix."""
+        if isinstance(config_id, (tuple, list)):
+            return '_'.join(str(i) for i in config_id)
+        return str(config_id)
+
+    def _path(self, config_id, budget: int) -> str:
+        return join(self.directory,
+                    '{}__{}.pth'.format(self._key(config_id), int(budget)))
+
+    def save(self, config_id, budget: int, model_state: dict,
+             optimizer_state: dict, extra: dict = None):
+        """Saves a checkpoint then evicts old ones if over the quota.
+
+        Args:
+            config_id: The config id given by hpbandster.
+            budget: The budget, i.e. number of epochs, trained for.
+            model_state: The network state dict.
+            optimizer_state: The optimizer state dict.
+            extra: Any other values to keep, e.g. the validation history.
+        """
+        path = self._path(config_id, budget)
+        tmp_path = path + '.tmp'
+        torch.save({'model_state_dict': model_state,
+                    'optimizer_state_dict': optimizer_state,
+                    'budget': int(budget),
+                    'extra': extra if extra is not None else dict()},
+                   tmp_path)
+        # Rename so other workers never see a half written checkpoint
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def load(self, config_id, budget: int) -> dict:
+        """Loads the checkpoint with the largest budget below the given one.
+
+        Args:
+            config_id: The config id given by hpbandster.
+            budget: The budget about to be trained for.
+
+        Returns:
+            The checkpoint dict, or None if there is nothing to resume from.
+        """
+        prefix = self._key(config_id) + '__'
+        budgets = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.pth'):
+                b = int(name[len(prefix):-len('.pth')])
+                if b < int(budget):
+                    budgets.append(b)
+
+        for b in sorted(budgets, reverse=True):
+            path = self._path(config_id, b)
+            try:
+                checkpoint = torch.load(path, map_location='cpu')
+            except (OSError, RuntimeError, EOFError):
+                # Evicted by another worker in the meantime or corrupted
+                continue
+            # Touch the file so it counts as recently used
+            os.utime(path)
+            return checkpoint
+        return None
+
+    def size(self) -> int:
+        """Total size of the store in bytes."""
+        return sum(getsize(join(self.directory, f))
+                   for f in os.listdir(self.directory))
+
+    def evict(self, keep: str = None):
+        """Deletes the least recently used checkpoints until under quota.
+
+        Checkpoints other workers are still writing (.tmp files) count
+        towards the quota, but are never deleted.
+
+        Args:
+            keep: Path of a checkpoint that must not be deleted, e.g. the one
+                just saved.
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            path = join(self.directory, name)
+            try:
+                files.append((getmtime(path), getsize(path), path))
+            except OSError:
+                continue
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if not path.endswith('.pth') or path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Deletes every checkpoint in the store."""
+        for name in os.listdir(self.directory):
+            path = join(self.directory, name)
+            if exists(path):
+                os.remove(path)
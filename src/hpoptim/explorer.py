@@ -6,6 +6,7 @@ Author:
     Yvan Satyawan <y_satyawan@hotmail.com>
 """
 import json
+from hpoptim.results_db import connect, query
 
 
 def load_json_as_lists():
@@ -45,6 +46,25 @@ def load_json_as_lists():
 
     return results_list
 
+
+def load_db_as_lists(db_path, min_budget=23):
+    """Same as load_json_as_lists, but over every run in a results database.
+
+    The database is built with results_db.py.
+    """
+    conn = connect(db_path)
+    results_list = []
+    for i, row in enumerate(query(conn, min_budget=min_budget)):
+        results_list.append({
+            'run_number': i,
+            'iter_number': json.loads(row['config_id']),
+            'validation_acc': row['validation_acc'],
+            'config': json.loads(row['config_json'])
+        })
+    conn.close()
+    return results_list
+
+
 def filter_below(threshold, results):
     """Filters items below a certain threshold out."""
     out_list = []
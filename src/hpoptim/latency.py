@@ -0,0 +1,187 @@
+"""Latency.
+
+Measures, caches and predicts the inference latency of the NumpyModel for a
+given architecture, which is what actually runs on the Pi. Latency only
+depends on the layer sizes, not on the trained weights, so it can be measured
+with random weights before a config is even trained.
+
+The cached latency table is a JSON file. Building it on the target device
+(`python -m hpoptim.latency table.json` on the Pi) and copying it to the
+search machine lets the search use the target's latencies. Measuring on a
+machine that is busy training other trials gives noisy numbers, so a
+prebuilt table is preferred.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+import os
+from argparse import ArgumentParser
+from os.path import exists
+from statistics import median
+from time import perf_counter
+
+import numpy as np
+
+from model import NumpyModel
+
+
+def benchmark_numpy_model(first_layer: int, second_layer: int,
+                          batch_size: int = 1, repeats: int = 200,
+                          warmup: int = 20) -> float:
+    """Measures the forward pass latency of a NumpyModel.
+
+    Args:
+        first_layer: Number of nodes in the first layer.
+        second_layer: Number of nodes in the second layer.
+        batch_size: Number of images per forward pass.
+        repeats: Number of timed forward passes.
+        warmup: Number of untimed forward passes before timing.
+
+    Returns:
+        The median latency of a forward pass in seconds.
+    """
+    rng = np.random.default_rng(0)
+    model = NumpyModel(784, 10, first_layer, second_layer)
+    for layer in (model.fc0.layers[0], model.fc1.layers[0], model.fc2):
+        layer.weight = rng.standard_normal(layer.weight.shape)
+        layer.bias = rng.standard_normal(layer.bias.shape)
+    # Same dtype and shape as AI.infer_next() uses
+    x = rng.random([batch_size, 1, 28, 28])
+
+    for _ in range(warmup):
+        model(x)
+    times = []
+    for _ in range(repeats):
+        start_time = perf_counter()
+        model(x)
+        times.append(perf_counter() - start_time)
+    return median(times)
+
+
+class LatencyTable:
+    def __init__(self, path: str = None, batch_sizes: tuple = (1, 100),
+                 measure_missing: bool = True):
+        """Per-shape latency table.
+
+        Args:
+            path: JSON file the table is loaded from and saved to. None keeps
+                the table in memory only.
+            batch_sizes: Batch sizes to measure each shape at.
+            measure_missing: Whether shapes not in the table are measured on
+                this machine. If False, they are predicted with a linear fit
+                over the number of multiply-adds of the measured shapes.
+        """
+        self.path = path
+        self.batch_sizes = tuple(batch_sizes)
+        self.measure_missing = measure_missing
+        self.table = dict()
+        if path is not None and exists(path):
+            with open(path) as fp:
+                self.table = json.load(fp)
+
+    @staticmethod
+    def _key(first_layer: int, second_layer: int, batch_size: int) -> str:
+        return '{}-{}-{}'.format(first_layer, second_layer, batch_size)
+
+    @staticmethod
+    def _macs(first_layer: int, second_layer: int) -> int:
+        """Multiply-adds of one forward pass of a single image."""
+        return 784 * first_layer + first_layer * second_layer \
+            + second_layer * 10
+
+    def _predict(self, first_layer: int, second_layer: int,
+                 batch_size: int) -> float:
+        """Least squares fit of latency = a + b * macs at a batch size."""
+        xs, ys = [], []
+        for key, latency in self.table.items():
+            f, s, b = (int(i) for i in key.split('-'))
+            if b == batch_size:
+                xs.append(self._macs(f, s))
+                ys.append(latency)
+        if len(xs) < 2:
+            return benchmark_numpy_model(first_layer, second_layer,
+                                         batch_size)
+        x_mean, y_mean = sum(xs) / len(xs), sum(ys) / len(ys)
+        var = sum((x - x_mean) ** 2 for x in xs)
+        b = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / var \
+            if var > 0 else 0.
+        return y_mean + b * (self._macs(first_layer, second_layer) - x_mean)
+
+    def get(self, first_layer: int, second_layer: int) -> dict:
+        """Latency of a shape in seconds at each batch size.
+
+        Returns:
+            Dictionary of batch size to latency.
+        """
+        out = dict()
+        changed = False
+        for batch_size in self.batch_sizes:
+            key = self._key(first_layer, second_layer, batch_size)
+            if key not in self.table:
+                if not self.measure_missing:
+                    out[batch_size] = self._predict(first_layer, second_layer,
+                                                    batch_size)
+                    continue
+                self.table[key] = benchmark_numpy_model(first_layer,
+                                                        second_layer,
+                                                        batch_size)
+                changed = True
+            out[batch_size] = self.table[key]
+        if changed:
+            self.save()
+        return out
+
+    def save(self):
+        if self.path is not None:
+            # Several workers may share the table, so never leave it half
+            # written.
+            tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(tmp_path, 'w') as fp:
+                json.dump(self.table, fp, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def build(self, first_layers, second_layers):
+        """Measures every combination of the given layer sizes."""
+        for f in first_layers:
+            for s in second_layers:
+                self.get(f, s)
+        self.save()
+
+
+def pareto_front(points: list, accuracy_key: str = 'accuracy',
+                 latency_key: str = 'latency') -> list:
+    """Finds the points not dominated in accuracy (max) and latency (min).
+
+    Args:
+        points: List of dicts, each with an accuracy and a latency.
+
+    Returns:
+        The Pareto optimal points, sorted by latency.
+    """
+    front = []
+    best_acc = float('-inf')
+    for p in sorted(points, key=lambda p: (p[latency_key],
+                                           -p[accuracy_key])):
+        if p[accuracy_key] > best_acc:
+            front.append(p)
+            best_acc = p[accuracy_key]
+    return front
+
+
+if __name__ == '__main__':
+    p = ArgumentParser(description='builds a latency table for the NumpyModel '
+                                   'on this machine')
+    p.add_argument('TABLE', type=str, help='path of the JSON table')
+    p.add_argument('--first', type=int, nargs=2, default=[4, 64],
+                   help='range of first layer sizes')
+    p.add_argument('--second', type=int, nargs=2, default=[4, 64],
+                   help='range of second layer sizes')
+    p.add_argument('--step', type=int, default=4)
+    p.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 100])
+    args = p.parse_args()
+
+    table = LatencyTable(args.TABLE, args.batch_sizes)
+    table.build(range(args.first[0], args.first[1] + 1, args.step),
+                range(args.second[0], args.second[1] + 1, args.step))
+    print(f"{len(table.table)} entries in {args.TABLE}")
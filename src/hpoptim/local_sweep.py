@@ -0,0 +1,305 @@
+"""Local Sweep.
+
+Offline replacement for the wandb sweep agent. Runs a random, grid or bayesian
+search over the search space of wandb_sweep.py (hyperparameter_defaults and
+sweep_parameters) on a pool of pre-warmed worker processes (hpoptim.warm_pool)
+that load MNIST only once. Each trial calls wandb_sweep.train() in-process
+with the local stand-in for wandb, and the results are appended to
+results.jsonl in the output directory.
+
+Usage, from the src directory:
+    python -m hpoptim.local_sweep ROOT OUT --method bayes --trials 50 \
+        --parallel 4
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import itertools
+import json
+import random
+from argparse import ArgumentParser
+from datetime import datetime
+from math import log, exp, prod
+from os.path import join
+from pathlib import Path
+from time import time
+
+
+class Param:
+    def __init__(self, name: str, spec: dict):
+        """A single parameter of a wandb style sweep configuration.
+
+        Args:
+            name: Name of the parameter.
+            spec: Either {'values': [...]} or {'min': a, 'max': b} with an
+                optional 'distribution'. Distributions starting with 'log' are
+                sampled log-uniformly. If min and max are ints, so is the
+                parameter.
+        """
+        self.name = name
+        self.values = spec.get('values')
+        self.low = spec.get('min')
+        self.high = spec.get('max')
+        self.log = spec.get('distribution', '').startswith('log')
+        self.is_int = isinstance(self.low, int) \
+            and isinstance(self.high, int)
+
+    def from_unit(self, u: float):
+        """Maps a value in [0, 1] to a parameter value."""
+        u = min(max(u, 0.), 1.)
+        if self.values is not None:
+            return self.values[min(int(u * len(self.values)),
+                                   len(self.values) - 1)]
+        if self.log:
+            value = exp(log(self.low) + u * (log(self.high) - log(self.low)))
+        else:
+            value = self.low + u * (self.high - self.low)
+        return int(round(value)) if self.is_int else value
+
+    def to_unit(self, value) -> float:
+        """Maps a parameter value to [0, 1]."""
+        if self.values is not None:
+            return (self.values.index(value) + 0.5) / len(self.values)
+        if self.log:
+            return (log(value) - log(self.low)) \
+                / (log(self.high) - log(self.low))
+        return (value - self.low) / (self.high - self.low)
+
+    def grid(self, n: int) -> list:
+        """Grid points of the parameter. n is used for ranges."""
+        if self.values is not None:
+            return list(self.values)
+        points = [self.from_unit(i / (n - 1)) for i in range(n)] if n > 1 \
+            else [self.from_unit(0.5)]
+        # Ints can collapse onto the same value
+        return list(dict.fromkeys(points))
+
+
+class Sampler:
+    def __init__(self, parameters: dict, method: str = 'random',
+                 grid_points: int = 3, n_startup: int = 10,
+                 gamma: float = 0.25, n_candidates: int = 64,
+                 seed: int = 0):
+        """Proposes configurations.
+
+        The bayesian method is a tree-structured Parzen estimator: after
+        n_startup random trials, the results are split into the best gamma
+        fraction and the rest, and of n_candidates drawn around the good
+        trials the one with the highest ratio of good to bad density wins.
+
+        Args:
+            parameters: wandb style sweep parameters.
+            method: 'random', 'grid' or 'bayes'.
+            grid_points: Number of grid points for ranges with 'grid'.
+            n_startup: Random trials before the bayesian model is used.
+            gamma: Fraction of trials considered good.
+            n_candidates: Candidates scored per bayesian proposal.
+            seed: Random seed.
+        """
+        self.params = [Param(k, v) for k, v in parameters.items()]
+        self.method = method
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.rng = random.Random(seed)
+        self.observations = []  # (unit vector, metric)
+        if method == 'grid':
+            self._grid = itertools.product(*[p.grid(grid_points)
+                                             for p in self.params])
+
+    def _to_config(self, units: list) -> dict:
+        return {p.name: p.from_unit(u) for p, u in zip(self.params, units)}
+
+    def _parzen(self, u: float, points: list, bandwidth: float) -> float:
+        # Uniform prior mixed in so the density is never 0
+        density = sum(exp(-0.5 * ((u - p) / bandwidth) ** 2)
+                      for p in points) / (len(points) * bandwidth * 2.5066)
+        return density + 0.1
+
+    def propose(self) -> dict:
+        """Returns the next config, or None if the grid is exhausted."""
+        if self.method == 'grid':
+            values = next(self._grid, None)
+            if values is None:
+                return None
+            return {p.name: v for p, v in zip(self.params, values)}
+
+        if self.method == 'random' \
+                or len(self.observations) < self.n_startup:
+            return self._to_config([self.rng.random() for _ in self.params])
+
+        ranked = sorted(self.observations, key=lambda o: o[1], reverse=True)
+        n_good = max(1, int(self.gamma * len(ranked)))
+        good = [o[0] for o in ranked[:n_good]]
+        bad = [o[0] for o in ranked[n_good:]] or good
+        bandwidth = max(0.05, 1. / len(ranked) ** 0.5)
+
+        best_score, best = float('-inf'), None
+        for _ in range(self.n_candidates):
+            center = self.rng.choice(good)
+            candidate = [min(max(self.rng.gauss(c, bandwidth), 0.), 1.)
+                         for c in center]
+            score = prod(self._parzen(u, [g[d] for g in good], bandwidth)
+                         / self._parzen(u, [b[d] for b in bad], bandwidth)
+                         for d, u in enumerate(candidate))
+            if score > best_score:
+                best_score, best = score, candidate
+        return self._to_config(best)
+
+    def observe(self, config: dict, metric: float):
+        """Registers the result of a trial."""
+        if metric is None:
+            return
+        self.observations.append(
+            ([p.to_unit(config[p.name]) for p in self.params], metric))
+
+
+def run_trial(root: str, out_dir: str, trial_id: int, config: dict,
+              latency_table: str = None, latency_weight: float = 1.):
+    """Runs a single trial. Used as the warm pool target."""
+    from hpoptim.wandb_sweep import train
+    from hpoptim import local_wandb
+    from hpoptim.latency import LatencyTable
+    from hpoptim.warm_pool import shared_datasets
+
+    run_dir = join(out_dir, 'trial_{:04d}'.format(trial_id))
+    run = local_wandb.init(config=config, project="fully_connected_mnist",
+                           dir=run_dir)
+    start_time = time()
+    table = LatencyTable(latency_table) if latency_table is not None \
+        else None
+    metrics = train(root, run_dir, run=run, latency_table=table,
+                    latency_weight=latency_weight, datasets=shared_datasets(),
+                    **config)
+    run.finish()
+    return trial_id, config, metrics, time() - start_time
+
+
+def sweep(root: str, out_dir: str, method: str = 'random',
+          trials: int = 20, parallel: int = 1,
+          metric: str = 'maximization_criterion', epochs: int = None,
+          threads: int = None, seed: int = 0, latency_table: str = None,
+          latency_weight: float = 1., preload: bool = True) -> list:
+    """Runs the sweep.
+
+    Args:
+        root: Path to the MNIST data root.
+        out_dir: Directory to write the trials and results.jsonl to.
+        method: 'random', 'grid' or 'bayes'.
+        trials: Maximum number of trials.
+        parallel: Number of trials to run at the same time.
+        metric: Metric returned by train() to maximize.
+        epochs: Epochs per trial. Defaults to hyperparameter_defaults.
+        threads: Torch threads per worker. Defaults to cpus // parallel.
+        seed: Random seed of the sampler.
+        latency_table: Path of a latency table. If given, the maximization
+            criterion penalizes NumpyModel latency instead of model size.
+        latency_weight: Penalty per ms of latency.
+        preload: Whether the workers load MNIST into shared memory once
+            instead of every trial parsing it.
+
+    Returns:
+        The results of all trials, best first.
+    """
+    from hpoptim.wandb_sweep import hyperparameter_defaults, sweep_parameters
+    from hpoptim.warm_pool import WarmPool
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    sampler = Sampler(sweep_parameters, method, seed=seed)
+    fixed = {k: v for k, v in hyperparameter_defaults.items()
+             if k not in sweep_parameters}
+    if epochs is not None:
+        fixed['epochs'] = epochs
+
+    results = []
+    started = 0
+    with WarmPool(parallel, root if preload else None, threads) as pool, \
+            open(join(out_dir, 'results.jsonl'), 'a') as store:
+        print(pool.report())
+        exhausted = False
+        while pool.pending or (started < trials and not exhausted):
+            # Keep every worker busy
+            while pool.pending < parallel and started < trials:
+                config = sampler.propose()
+                if config is None:
+                    exhausted = True
+                    break
+                pool.submit(run_trial, root, out_dir, started,
+                            {**fixed, **config}, latency_table,
+                            latency_weight)
+                started += 1
+            if not pool.pending:
+                break
+
+            done = pool.get()
+            if done['error'] is not None:
+                print("Trial {} failed:\n{}".format(done['task_id'],
+                                                    done['error']))
+                continue
+            trial_id, config, metrics, duration = done['result']
+            sampler.observe(config, metrics.get(metric))
+            line = {'trial': trial_id, 'method': method,
+                    'config': config, 'metrics': metrics,
+                    'duration': duration,
+                    'dispatch_latency': done['dispatch_latency']}
+            store.write(json.dumps(line) + '\n')
+            store.flush()
+            results.append(line)
+            setup_time = metrics.get('setup_time')
+            print("Trial {}: {}={:.4f} in {:.1f}s ({:.2f}s startup, {} "
+                  "setup)".format(trial_id, metric, metrics.get(metric),
+                                  duration, done['dispatch_latency'],
+                                  'no' if setup_time is None
+                                  else '{:.2f}s'.format(setup_time)))
+        print(pool.report())
+
+    return sorted(results, key=lambda r: r['metrics'].get(metric),
+                  reverse=True)
+
+
+def parse_args():
+    p = ArgumentParser(description='runs an offline hyperparameter sweep')
+    p.add_argument('ROOT', type=str, help='path to the MNIST data root')
+    p.add_argument('OUT', type=str, help='directory for the sweep output')
+    p.add_argument('--method', type=str, default='random',
+                   choices=['random', 'grid', 'bayes'])
+    p.add_argument('--trials', type=int, default=20)
+    p.add_argument('--parallel', type=int, default=1,
+                   help='number of trials to run at the same time')
+    p.add_argument('--metric', type=str, default='maximization_criterion')
+    p.add_argument('--epochs', type=int, default=None)
+    p.add_argument('--threads', type=int, default=None,
+                   help='torch threads per worker process')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--latency_table', type=str, default=None,
+                   help='latency table built with hpoptim/latency.py')
+    p.add_argument('--latency_weight', type=float, default=1.,
+                   help='penalty per ms of latency')
+    p.add_argument('--no_preload', action='store_true',
+                   help='parse MNIST in every trial instead of loading it '
+                        'into shared memory once')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    out_dir = join(args.OUT, datetime.now().strftime('%Y_%m_%d--%H_%M_%S'))
+    results = sweep(args.ROOT, out_dir, args.method, args.trials,
+                    args.parallel, args.metric, args.epochs, args.threads,
+                    args.seed, args.latency_table, args.latency_weight,
+                    not args.no_preload)
+    print("\nBest configurations:")
+    for r in results[:5]:
+        print(r['metrics'], r['config'])
+
+    if args.latency_table is not None:
+        from hpoptim.latency import pareto_front
+        front = pareto_front([{'accuracy': r['metrics']['accuracy'],
+                               'latency': r['metrics']['latency'],
+                               'config': r['config']} for r in results])
+        print("\nPareto front of accuracy vs. latency:")
+        for point in front:
+            print("    {:.4f} at {:.4f}ms: {}".format(
+                point['accuracy'], point['latency'], point['config']))
+        with open(join(out_dir, 'pareto_front.json'), 'w') as fp:
+            json.dump(front, fp, indent=2)
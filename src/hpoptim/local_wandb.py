@@ -0,0 +1,54 @@
+"""Local Weights and Biases.
+
+A local stand-in for the parts of wandb used by wandb_sweep.py, for machines
+without network access. Metrics are written as JSON lines to the run
+directory instead of being sent to the wandb servers.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+from os.path import join
+from pathlib import Path
+
+
+class LocalRun:
+    def __init__(self, config: dict = None, project: str = None,
+                 dir: str = '.'):
+        """Creates a local run, with the same interface as wandb.init().
+
+        Args:
+            config: Configuration of the run.
+            project: Name of the project. Only recorded.
+            dir: Directory the config and metrics are written to.
+        """
+        self.config = dict(config) if config is not None else dict()
+        self.project = project
+        self.dir = dir
+        self.summary = dict()
+        Path(dir).mkdir(parents=True, exist_ok=True)
+
+        with open(join(dir, 'config.json'), 'w') as fp:
+            json.dump({'project': project, 'config': self.config}, fp)
+        self._fp = open(join(dir, 'metrics.jsonl'), 'a')
+
+    def log(self, data: dict, step: int = None):
+        """Logs a dictionary of metrics at the given step."""
+        line = dict(data)
+        if step is not None:
+            line['_step'] = step
+        self._fp.write(json.dumps(line) + '\n')
+        self.summary.update(data)
+
+    def finish(self):
+        """Flushes and closes the metrics file."""
+        if not self._fp.closed:
+            self._fp.close()
+            with open(join(self.dir, 'summary.json'), 'w') as fp:
+                json.dump(self.summary, fp)
+
+
+def init(config: dict = None, project: str = None, dir: str = '.',
+         **kwargs) -> LocalRun:
+    """Drop in replacement for wandb.init()."""
+    return LocalRun(config, project, dir)
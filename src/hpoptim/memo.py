@@ -0,0 +1,65 @@
+"""Memo.
+
+Memoizes trial results by configuration and budget, so that a config which was
+already evaluated at a budget, in this run or in a previous one, is not trained
+again.
+
+BOHB samples continuous hyperparameters, so it almost never proposes the same
+config at the same budget twice by chance. The memo is mainly a guard for
+restarts, when a run is started again with --previous, and against duplicate
+trials. The key doesn't include how the loss was computed, so bohb.py only
+fills it from previous runs with the same objective settings.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+
+
+class ResultMemo:
+    def __init__(self, results: dict = None):
+        """Creates the memo.
+
+        Args:
+            results: Optional initial mapping of memo key to result dict. A
+                multiprocessing Manager dict shares the memo between worker
+                processes.
+        """
+        self.results = results if results is not None else dict()
+        self.hits = 0
+
+    @staticmethod
+    def key(config: dict, budget: float) -> str:
+        """Canonical key of a config and budget."""
+        return json.dumps([sorted(config.items()), float(budget)])
+
+    def get(self, config: dict, budget: float) -> dict:
+        """Returns the stored result or None if the trial wasn't run yet."""
+        result = self.results.get(self.key(config, budget))
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def put(self, config: dict, budget: float, result: dict):
+        self.results[self.key(config, budget)] = result
+
+    def __len__(self):
+        return len(self.results)
+
+    @classmethod
+    def from_hpbandster(cls, results: list):
+        """Builds a memo from hpbandster Result objects.
+
+        Args:
+            results: List of hpbandster.core.result.Result, e.g. previous runs.
+        """
+        memo = cls()
+        for res in results:
+            id2config = res.get_id2config_mapping()
+            for run in res.get_all_runs():
+                if run.loss is None:
+                    # Crashed runs are not memoized so they get another try
+                    continue
+                memo.put(id2config[run.config_id]['config'], run.budget,
+                         {'loss': run.loss, 'info': run.info})
+        return memo
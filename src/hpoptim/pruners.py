@@ -0,0 +1,112 @@
+"""Pruners.
+
+Pruners decide, based on the intermediate validation results reported after
+each epoch, whether a trial in the SearchWorker should be stopped early.
+
+Every pruner implements the same two methods:
+    should_prune(epoch, accuracy, loss): Returns True if the trial should stop.
+    complete(history, start_epoch): Called with the per-epoch accuracies of a
+        finished (or pruned) trial so the pruner can learn from it. Epochs
+        before start_epoch were already reported by an earlier, resumed
+        trial.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from math import isnan, isinf
+from statistics import median
+
+
+class NoPruner:
+    def should_prune(self, epoch: int, accuracy: float, loss: float) -> bool:
+        """Never prunes a trial."""
+        return False
+
+    def complete(self, history: list, start_epoch: int = 0):
+        pass
+
+
+class MedianPruner:
+    def __init__(self, warmup_epochs: int = 1, min_trials: int = 5,
+                 history=None):
+        """Median stopping rule.
+
+        A trial is stopped if its validation accuracy at an epoch is below the
+        median of the accuracies that past trials had at the same epoch.
+
+        Args:
+            warmup_epochs: Number of epochs a trial is always allowed to run.
+            min_trials: Minimum number of past trials that must have reached
+                an epoch before that epoch is used for pruning.
+            history: Mapping of epoch to the list of accuracies of the past
+                trials. Pass a multiprocessing Manager dict to share the
+                history between the pruners of several workers. None starts
+                an empty history of this pruner only.
+        """
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+        self.history = dict() if history is None else history
+
+    def should_prune(self, epoch: int, accuracy: float, loss: float) -> bool:
+        if epoch < self.warmup_epochs:
+            return False
+        past = self.history.get(epoch, [])
+        if len(past) < self.min_trials:
+            return False
+        return accuracy < median(past)
+
+    def complete(self, history: list, start_epoch: int = 0):
+        for epoch, accuracy in enumerate(history[start_epoch:], start_epoch):
+            # Assigned instead of appended in place, as changes to the lists
+            # inside a Manager dict are not sent back to the manager
+            self.history[epoch] = self.history.get(epoch, []) + [accuracy]
+
+
+class DivergencePruner:
+    def __init__(self, max_loss: float = None, patience: int = 2,
+                 chance_accuracy: float = 0.11):
+        """Stops trials whose loss is NaN/inf, or that are stuck at chance.
+
+        Args:
+            max_loss: Loss above which a trial counts as diverged. None only
+                checks for NaN and inf.
+            patience: Number of consecutive epochs at or below chance accuracy
+                before the trial is stopped.
+            chance_accuracy: Accuracy considered no better than guessing.
+        """
+        self.max_loss = max_loss
+        self.patience = patience
+        self.chance_accuracy = chance_accuracy
+        self._bad_epochs = 0
+
+    def should_prune(self, epoch: int, accuracy: float, loss: float) -> bool:
+        if epoch == 0:
+            self._bad_epochs = 0
+        if isnan(loss) or isinf(loss):
+            return True
+        if self.max_loss is not None and loss > self.max_loss:
+            return True
+        if accuracy <= self.chance_accuracy:
+            self._bad_epochs += 1
+        else:
+            self._bad_epochs = 0
+        return self._bad_epochs >= self.patience
+
+    def complete(self, history: list, start_epoch: int = 0):
+        self._bad_epochs = 0
+
+
+class CombinedPruner:
+    def __init__(self, *pruners):
+        """Prunes if any of the given pruners decides to prune."""
+        self.pruners = pruners
+
+    def should_prune(self, epoch: int, accuracy: float, loss: float) -> bool:
+        # Ask every pruner so each can keep its own state up to date
+        results = [p.should_prune(epoch, accuracy, loss)
+                   for p in self.pruners]
+        return any(results)
+
+    def complete(self, history: list, start_epoch: int = 0):
+        for p in self.pruners:
+            p.complete(history, start_epoch)
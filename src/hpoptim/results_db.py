@@ -0,0 +1,246 @@
+"""Results DB.
+
+Ingests the results of any number of hpbandster runs into an indexed SQLite
+database so they can be queried together.
+
+A run directory can contain the `results.json` and `configs.json` written by
+the hpbandster json_result_logger, and/or the pickled `results.pkl` written by
+bohb.py. Re-ingesting a directory only reads the lines that were appended to
+the json files since the last ingest.
+
+Usage:
+    python hpoptim/results_db.py DB ingest RUN_DIR [RUN_DIR ...]
+    python hpoptim/results_db.py DB query --min_acc 0.9 --max_nodes 64
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+import pickle
+import sqlite3
+from argparse import ArgumentParser
+from os.path import join, exists, abspath, getsize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_dir TEXT PRIMARY KEY,
+    results_offset INTEGER NOT NULL DEFAULT 0,
+    configs_offset INTEGER NOT NULL DEFAULT 0,
+    pickle_ingested INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS configs (
+    run_dir TEXT NOT NULL,
+    config_id TEXT NOT NULL,
+    lr REAL,
+    optimizer TEXT,
+    momentum REAL,
+    epsilon REAL,
+    bs INTEGER,
+    first_layer INTEGER,
+    second_layer INTEGER,
+    leaky1 INTEGER,
+    leaky2 INTEGER,
+    leaky3 INTEGER,
+    config_json TEXT NOT NULL,
+    PRIMARY KEY (run_dir, config_id)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_dir TEXT NOT NULL,
+    config_id TEXT NOT NULL,
+    budget REAL NOT NULL,
+    loss REAL,
+    validation_acc REAL,
+    validation_loss REAL,
+    training_acc REAL,
+    training_loss REAL,
+    info_json TEXT,
+    PRIMARY KEY (run_dir, config_id, budget)
+);
+CREATE INDEX IF NOT EXISTS results_acc ON results (validation_acc);
+CREATE INDEX IF NOT EXISTS results_budget ON results (budget, validation_acc);
+CREATE INDEX IF NOT EXISTS configs_layers ON configs (first_layer,
+                                                      second_layer);
+CREATE INDEX IF NOT EXISTS configs_nodes ON configs (first_layer
+                                                     + second_layer);
+CREATE INDEX IF NOT EXISTS configs_optimizer ON configs (optimizer);
+"""
+
+CONFIG_KEYS = ('lr', 'optimizer', 'momentum', 'epsilon', 'bs', 'first_layer',
+               'second_layer', 'leaky1', 'leaky2', 'leaky3')
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Opens the database and creates the tables if necessary."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _config_row(run_dir, config_id, config) -> tuple:
+    return (run_dir, json.dumps(list(config_id)),
+            *[config.get(k) for k in CONFIG_KEYS],
+            json.dumps(config))
+
+
+def _result_row(run_dir, config_id, budget, result) -> tuple:
+    loss = None
+    info = dict()
+    if result is not None:
+        loss = result.get('loss')
+        info = result.get('info') or dict()
+    return (run_dir, json.dumps(list(config_id)), float(budget), loss,
+            info.get('validation accuracy'), info.get('validation loss'),
+            info.get('training accuracy'), info.get('training loss'),
+            json.dumps(info))
+
+
+def _read_new_lines(path: str, offset: int) -> (list, int):
+    """Reads the complete lines written to a file after the given offset.
+
+    Returns:
+        The parsed json lines and the offset to continue from next time.
+    """
+    if not exists(path) or getsize(path) <= offset:
+        return [], offset
+    lines = []
+    with open(path, 'rb') as fp:
+        fp.seek(offset)
+        for line in fp:
+            if not line.endswith(b'\n'):
+                # Still being written. Pick it up on the next ingest.
+                break
+            offset += len(line)
+            if line.strip():
+                lines.append(json.loads(line))
+    return lines, offset
+
+
+def ingest(conn: sqlite3.Connection, run_dir: str) -> int:
+    """Ingests a single run directory.
+
+    Returns:
+        Number of rows changed in the database.
+    """
+    run_dir = abspath(run_dir)
+    conn.execute("INSERT OR IGNORE INTO runs (run_dir) VALUES (?)",
+                 (run_dir,))
+    state = conn.execute("SELECT * FROM runs WHERE run_dir = ?",
+                         (run_dir,)).fetchone()
+    before = conn.total_changes
+
+    configs, configs_offset = _read_new_lines(join(run_dir, 'configs.json'),
+                                              state['configs_offset'])
+    conn.executemany(
+        "INSERT OR REPLACE INTO configs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, "
+        "?, ?, ?)",
+        [_config_row(run_dir, c[0], c[1]) for c in configs])
+
+    results, results_offset = _read_new_lines(join(run_dir, 'results.json'),
+                                              state['results_offset'])
+    conn.executemany(
+        "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [_result_row(run_dir, r[0], r[1], r[3]) for r in results])
+
+    pickle_ingested = state['pickle_ingested']
+    pkl_path = join(run_dir, 'results.pkl')
+    if not pickle_ingested and exists(pkl_path):
+        # Unpickling needs hpbandster to be importable
+        with open(pkl_path, 'rb') as fp:
+            res = pickle.load(fp)
+        id2config = res.get_id2config_mapping()
+        conn.executemany(
+            "INSERT OR IGNORE INTO configs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, "
+            "?, ?, ?, ?)",
+            [_config_row(run_dir, k, v['config'])
+             for k, v in id2config.items()])
+        conn.executemany(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [_result_row(run_dir, r.config_id, r.budget,
+                         {'loss': r.loss, 'info': r.info})
+             for r in res.get_all_runs()])
+        pickle_ingested = 1
+
+    conn.execute("UPDATE runs SET results_offset = ?, configs_offset = ?, "
+                 "pickle_ingested = ? WHERE run_dir = ?",
+                 (results_offset, configs_offset, pickle_ingested, run_dir))
+    conn.commit()
+    return conn.total_changes - before
+
+
+def query(conn: sqlite3.Connection, min_acc: float = None,
+          max_nodes: int = None, min_budget: float = None,
+          optimizer: str = None, limit: int = None) -> list:
+    """Explorer style query over all ingested runs.
+
+    Args:
+        min_acc: Only return results with a validation accuracy above this.
+        max_nodes: Only return configs with fewer first + second layer nodes.
+        min_budget: Only return results with a budget above this.
+        optimizer: Only return configs using this optimizer.
+        limit: Maximum number of rows to return.
+
+    Returns:
+        Rows sorted by validation accuracy, best first.
+    """
+    where = []
+    params = []
+    if min_acc is not None:
+        where.append("r.validation_acc > ?")
+        params.append(min_acc)
+    if max_nodes is not None:
+        where.append("c.first_layer + c.second_layer < ?")
+        params.append(max_nodes)
+    if min_budget is not None:
+        where.append("r.budget > ?")
+        params.append(min_budget)
+    if optimizer is not None:
+        where.append("c.optimizer = ?")
+        params.append(optimizer)
+
+    sql = ("SELECT r.run_dir, r.config_id, r.budget, r.validation_acc, "
+           "r.validation_loss, c.config_json FROM results r "
+           "JOIN configs c ON c.run_dir = r.run_dir "
+           "AND c.config_id = r.config_id")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY r.validation_acc DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def parse_args():
+    p = ArgumentParser(description='ingests and queries hpbandster results')
+    p.add_argument('DB', type=str, help='path to the SQLite database')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    i = sub.add_parser('ingest', help='ingests run directories')
+    i.add_argument('RUN_DIR', type=str, nargs='+')
+
+    q = sub.add_parser('query', help='queries the ingested results')
+    q.add_argument('--min_acc', type=float, default=None)
+    q.add_argument('--max_nodes', type=int, default=None)
+    q.add_argument('--min_budget', type=float, default=None)
+    q.add_argument('--optimizer', type=str, default=None)
+    q.add_argument('--limit', type=int, default=20)
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    from time import time
+    args = parse_args()
+    conn = connect(args.DB)
+
+    if args.command == 'ingest':
+        for run_dir in args.RUN_DIR:
+            print(f"{run_dir}: {ingest(conn, run_dir)} rows changed")
+    else:
+        start_time = time()
+        rows = query(conn, args.min_acc, args.max_nodes, args.min_budget,
+                     args.optimizer, args.limit)
+        time_del = time() - start_time
+        for row in rows:
+            print(dict(row))
+        print(f"{len(rows)} rows in {time_del * 1000:.2f}ms")
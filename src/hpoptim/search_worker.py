@@ -52,25 +52,33 @@ References:
 # Torch imports
 import torch
 from torch.nn import CrossEntropyLoss
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Subset
 from torch.optim import Adam, SGD
 
 from torchvision.datasets import MNIST
 from torchvision.transforms import ToTensor
 
 from model import FCNetwork
+from hpoptim.pruners import NoPruner
+from hpoptim.subsets import (stratified_subset, stratified_order,
+                             dataset_targets)
 
 import ConfigSpace as CS
 # import ConfigSpace.hyperparameters as CSH
 from hpbandster.core.worker import Worker
 from datetime import datetime
+from math import floor
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
 
 class SearchWorker(Worker):
-    def __init__(self, data_path, logging_path, **kwargs):
+    def __init__(self, data_path, logging_path, pruner=None, datasets=None,
+                 checkpoint_store=None, eval_batch_size=1000,
+                 train_eval='subset', train_eval_size=10000,
+                 fidelity='epochs', fraction_epochs=1, memo=None,
+                 latency_table=None, latency_weight=0., **kwargs):
         """Initializes the search worker.
 
         Args:
@@ -81,21 +89,104 @@ class SearchWorker(Worker):
             logging_dir (str): Path to the logging directory. Used for logging
                 configuration, loss, accuracy. Ideally, this is a subdirectory
                 from the output directory.
+            pruner: Pruner from hpoptim.pruners used to end hopeless trials
+                early. Defaults to NoPruner, which never prunes.
+            datasets (tuple): Optional (train, test) datasets to use instead of
+                loading MNIST from data_path, e.g. the shared memory tensors
+                from hpoptim.shared_data.load_shared_mnist().
+            checkpoint_store (CheckpointStore): Optional store used to resume
+                promoted configs from their previous budget.
+            eval_batch_size (int): Batch size used for evaluation,
+                independent of the batch size of the trial.
+            train_eval (str): How the training loss and accuracy are
+                computed. 'subset' evaluates on a fixed class stratified
+                subset of train_eval_size samples, 'running' uses the running
+                statistics of the last training epoch and 'full' evaluates on
+                the entire training set.
+            train_eval_size (int): Size of the subset for 'subset'.
+            fidelity (str): What the budget means. 'epochs' trains for budget
+                epochs, rounded to a whole number and at least 1, on the full
+                training set. 'fraction' trains for
+                fraction_epochs epochs on a budget sized fraction (0, 1] of
+                the training set. 'epochs_fraction' treats the budget as a
+                number of passes over the training set, where a budget below 1
+                is a single epoch over that fraction of the set.
+            fraction_epochs (int): Epochs to train for with 'fraction'.
+            memo (ResultMemo): Optional memo of results by config and budget.
+                Trials found in it are not trained again.
+            latency_table (LatencyTable): Optional table used to look up the
+                NumpyModel inference latency of each config. The latencies
+                are reported in the info dict.
+            latency_weight (float): Loss added per ms of batch 1 latency, so
+                BOHB trades accuracy off against latency. Needs
+                latency_table.
             **kwargs:
         """
         super().__init__(**kwargs)
         self.run_count = 0
+        self.pruner = pruner if pruner is not None else NoPruner()
+        self.epochs_run = 0
+        self.epochs_saved = 0
+        self.epochs_reused = 0
+        self.checkpoint_store = checkpoint_store
+        self.memo = memo
+        self.latency_table = latency_table
+        self.latency_weight = latency_weight
 
         self.logging_path = logging_path
-        self.train_data = MNIST(data_path, download=True, transform=ToTensor())
-        self.test_data = MNIST(data_path, download=True,train=False,
-                               transform=ToTensor())
+        if datasets is not None:
+            self.train_data, self.test_data = datasets
+        else:
+            self.train_data = MNIST(data_path, download=True,
+                                    transform=ToTensor())
+            self.test_data = MNIST(data_path, download=True, train=False,
+                                   transform=ToTensor())
+
+        # Class stratified order of the training set. Taking a prefix of it
+        # gives nested subsets, so a larger budget contains the smaller ones.
+        self.fidelity = fidelity
+        self.fraction_epochs = fraction_epochs
+        self.train_order = stratified_order(dataset_targets(self.train_data))
+
+        # Evaluation loaders don't depend on the config so only build them once
+        self.train_eval = train_eval
+        self.test_eval_loader = DataLoader(self.test_data, eval_batch_size,
+                                           shuffle=False)
+        if train_eval == 'subset':
+            self.train_eval_loader = DataLoader(
+                stratified_subset(self.train_data, train_eval_size),
+                eval_batch_size, shuffle=False)
+        elif train_eval == 'full':
+            self.train_eval_loader = DataLoader(self.train_data,
+                                                eval_batch_size, shuffle=False)
+        else:
+            self.train_eval_loader = None
 
         if torch.cuda.is_available():
             self.device = torch.device('cuda')
         else:
             self.device = torch.device('cpu')
 
+    def budget_to_schedule(self, budget: float) -> (int, int):
+        """Converts a budget to a number of epochs and training samples.
+
+        Args:
+            budget: The budget given by BOHB, interpreted according to the
+                fidelity set for this worker.
+
+        Budgets counting epochs are rounded to the nearest whole epoch, and
+        at least 1 epoch is always trained.
+
+        Returns:
+            The number of epochs and the number of training samples to use.
+        """
+        n = len(self.train_data)
+        if self.fidelity == 'fraction':
+            return self.fraction_epochs, max(1, min(n, round(budget * n)))
+        elif self.fidelity == 'epochs_fraction' and budget < 1:
+            return 1, max(1, round(budget * n))
+        return max(1, floor(budget + 0.5)), n
+
     def compute(self, config, budget, **kwargs):
         """Runs the training session.
 
@@ -105,7 +196,11 @@ class SearchWorker(Worker):
         Args:
             config (dict): Dictionary containing the configuration by the
                 optimizer
-            budget (int): Amount of epochs the model can use to train.
+            budget (float): Budget of the run. Amount of epochs the model can
+                use to train, or a fraction of the training set, depending
+                on the fidelity of the worker.
+            **kwargs: Contains the 'config_id' given by hpbandster, which is
+                used as the checkpoint store key.
 
         Returns:
             dict: dictionary with fields 'loss' (float) and 'info' (dict)
@@ -123,9 +218,29 @@ class SearchWorker(Worker):
         print("    Leaky config: {}, {}, {}".format(config['leaky1'],
                                                     config['leaky2'],
                                                     config['leaky3']))
+        if self.memo is not None:
+            cached = self.memo.get(config, budget)
+            if cached is not None:
+                print("Identical config already evaluated at budget {}. "
+                      "Using memoized result ({} trials avoided so far)."
+                      .format(budget, self.memo.hits))
+                info = dict(cached['info'] or dict())
+                info['memoized'] = True
+                # Nothing was trained, so don't count the epochs again
+                info['epochs run'] = 0
+                info['epochs reused'] = 0
+                return {'loss': cached['loss'], 'info': info}
+
         # Set network, dataloader, optimizer, and loss criterion
-        train_loader = DataLoader(self.train_data, config['bs'], shuffle=True)
-        test_loader = DataLoader(self.test_data, config['bs'], shuffle=True)
+        epochs, num_samples = self.budget_to_schedule(budget)
+        if num_samples < len(self.train_data):
+            print("    Training on {} samples for {} epochs".format(
+                num_samples, epochs))
+            train_set = Subset(self.train_data,
+                               self.train_order[:num_samples].tolist())
+        else:
+            train_set = self.train_data
+        train_loader = DataLoader(train_set, config['bs'], shuffle=True)
 
         network = FCNetwork(784, 10, config['first_layer'],
                             config['second_layer'],
@@ -140,14 +255,37 @@ class SearchWorker(Worker):
                              eps=config['epsilon'])
         loss_crit = CrossEntropyLoss()
 
+        # Resume from a lower budget of the same config if one was stored.
+        # Only possible if the budget is a number of full epochs.
+        config_id = kwargs.get('config_id')
+        use_checkpoints = self.checkpoint_store is not None \
+            and config_id is not None \
+            and num_samples == len(self.train_data) \
+            and self.fidelity != 'fraction'
+        history = []
+        start_epoch = 0
+        if use_checkpoints:
+            checkpoint = self.checkpoint_store.load(config_id, epochs)
+            if checkpoint is not None:
+                network.load_state_dict(checkpoint['model_state_dict'])
+                optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+                history = checkpoint['extra'].get('history', [])
+                start_epoch = checkpoint['budget']
+                print("Resuming from budget {}.".format(start_epoch))
+        self.epochs_reused += start_epoch
+
         # Increment run count number
         self.run_count += 1
 
         # Start actual training loop
-        for epoch in range(int(budget)):
+        pruned = False
+        for epoch in range(start_epoch, epochs):
 
             # Do training loop
             network.train()
+            running_loss = torch.zeros(1, device=self.device)
+            running_correct = torch.zeros(1, device=self.device)
+            running_total = 0
             for i, (img, cls) in enumerate(train_loader):
                 img = img.to(self.device)
                 cls = cls.to(self.device)
@@ -164,59 +302,124 @@ class SearchWorker(Worker):
                                   self.calc_batch_accuracy(out, cls) * 100))
                 loss.backward()
                 optimizer.step()
-
-        train_loss, train_acc = self.evaluate_network(
-            network, loss_crit, train_loader
-        )
-        validation_loss, validation_accuracy = self.evaluate_network(
-            network, loss_crit, test_loader)
+                if self.train_eval == 'running':
+                    running_loss += loss.detach() * cls.shape[0]
+                    running_correct += (out.argmax(1) == cls).sum()
+                    running_total += cls.shape[0]
+
+            # Report intermediate validation results to the pruner
+            validation_loss, validation_accuracy = self.evaluate_network(
+                network, loss_crit, self.test_eval_loader)
+            history.append(validation_accuracy)
+            print("Epoch {} validation accuracy: {:.4f}%, loss: {:.4f}"
+                  .format(epoch + 1, validation_accuracy * 100,
+                          validation_loss))
+            if self.pruner.should_prune(epoch, validation_accuracy,
+                                        validation_loss):
+                pruned = True
+                break
+
+        self.pruner.complete(history, start_epoch)
+        epochs_run = len(history) - start_epoch
+        epochs_saved = epochs - len(history)
+        self.epochs_run += epochs_run
+        self.epochs_saved += epochs_saved
+
+        if use_checkpoints and not pruned:
+            self.checkpoint_store.save(config_id, epochs,
+                                       network.state_dict(),
+                                       optimizer.state_dict(),
+                                       {'history': history})
+
+        if self.train_eval == 'running':
+            # Statistics of the last epoch trained, collected on the fly
+            if epochs_run > 0:
+                train_loss = running_loss.item() / running_total
+                train_acc = running_correct.item() / running_total
+            else:
+                train_loss, train_acc = float('nan'), float('nan')
+        else:
+            train_loss, train_acc = self.evaluate_network(
+                network, loss_crit, self.train_eval_loader
+            )
 
         # Print out results
         print("================================================================"
               "=======")
+        if pruned:
+            print("Pruned after {} of {} epochs.".format(len(history),
+                                                        epochs))
+        print("Epochs saved this run: {}, total: {} ({:.1f}% of {} epochs)"
+              .format(epochs_saved, self.epochs_saved,
+                      100. * self.epochs_saved
+                      / (self.epochs_run + self.epochs_saved),
+                      self.epochs_run + self.epochs_saved))
+        print("Epochs reused from checkpoints this run: {}, total: {}"
+              .format(start_epoch, self.epochs_reused))
         print("Validation accuracy: {:.4f}%".format(validation_accuracy
                                                      * 100.))
         print("Validation loss:     {:.4f}".format(validation_loss))
         print("Training accuracy:   {:.4f}%".format(train_acc * 100))
         print("Training loss:       {:.4f}".format(train_loss))
 
-        return {'loss': 1 - validation_accuracy,
-                'info': {'validation accuracy': validation_accuracy,
-                         'validation loss': validation_loss,
-                         'training loss': train_loss,
-                         'training accuracy': train_acc
-                         }
-                }
+        loss = 1 - validation_accuracy
+        latency_info = dict()
+        if self.latency_table is not None:
+            latencies = self.latency_table.get(config['first_layer'],
+                                               config['second_layer'])
+            for bs, latency in latencies.items():
+                latency_info['latency batch {} ms'.format(bs)] = \
+                    latency * 1000.
+            latency_ms = latencies[min(latencies)] * 1000.
+            loss += self.latency_weight * latency_ms
+            print("Latency:             {:.4f}ms".format(latency_ms))
+
+        result = {'loss': loss,
+                  'info': {'validation accuracy': validation_accuracy,
+                           'validation loss': validation_loss,
+                           'training loss': train_loss,
+                           'training accuracy': train_acc,
+                           'pruned': pruned,
+                           'epochs run': epochs_run,
+                           'epochs saved': epochs_saved,
+                           'epochs reused': start_epoch,
+                           'training samples': num_samples,
+                           **latency_info
+                           }
+                  }
+        if self.memo is not None:
+            self.memo.put(config, budget, result)
+        return result
 
     def evaluate_network(self, network, criterion, data_loader):
-        """Evaluate network accuracy on a specific data set.
+        """Evaluate network loss and accuracy on a specific data set.
+
+        Both are computed in a single pass and stay on the device until the
+        end, so there is only one sync per evaluation.
 
         Returns:
-            list: Element-wise accuracy
-            float: Average loss
+            float: Average loss per sample
+            float: Accuracy
         """
         # Set to eval and set up variables
         network.eval()
-        loss_val = 0
-        acc_val = 0
+        loss_val = torch.zeros(1, device=self.device)
+        correct = torch.zeros(1, device=self.device)
+        total = 0
 
         # Use network but without updating anything
         with torch.no_grad():
-            for i, (img, cls) in enumerate(data_loader):
+            for img, cls in data_loader:
                 img = img.to(self.device)
                 cls = cls.to(self.device)
                 h1, h2, out = network(img)
                 out = out.softmax(1)
-                loss_val += criterion(out, cls).item()
-
-                correct = (out.argmax(1) == cls).sum()
-
-                acc_val += float(correct) / float(cls.shape[0])
+                loss_val += criterion(out, cls) * cls.shape[0]
+                correct += (out.argmax(1) == cls).sum()
+                total += cls.shape[0]
 
-        # Average accuracy and loss
-        loss_val /= i
-        acc_val /= i
-        return loss_val, acc_val
+        # Average accuracy and loss over samples
+        return loss_val.item() / total, correct.item() / total
 
     def calc_batch_accuracy(self, output: torch.Tensor,
                             target: torch.tensor)-> float:
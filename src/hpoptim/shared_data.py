@@ -0,0 +1,40 @@
+"""Shared Data.
+
+Loads MNIST once as tensors in shared memory so that several worker processes
+can train on the same copy instead of each loading the torchvision dataset.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import torch
+from torch.utils.data import TensorDataset
+from torchvision.datasets import MNIST
+
+
+def _to_tensors(dataset: MNIST) -> (torch.Tensor, torch.Tensor):
+    """Converts a torchvision MNIST dataset to the same values as ToTensor."""
+    images = dataset.data.to(torch.float).div_(255.).unsqueeze_(1)
+    return images, dataset.targets.clone()
+
+
+def load_shared_mnist(data_path: str) -> (TensorDataset, TensorDataset):
+    """Loads the MNIST train and test set into shared memory.
+
+    The tensors only have to be loaded once in the parent process. When passed
+    to processes started with torch.multiprocessing, only a handle to the
+    shared memory is sent, not the data itself.
+
+    Args:
+        data_path: Path to the data directory.
+
+    Returns:
+        The train and test set as TensorDatasets that yield the same
+        (image, class) pairs as MNIST with the ToTensor transform.
+    """
+    out = []
+    for train in (True, False):
+        images, targets = _to_tensors(MNIST(data_path, train=train,
+                                            download=True))
+        out.append(TensorDataset(images.share_memory_(),
+                                 targets.share_memory_()))
+    return out[0], out[1]
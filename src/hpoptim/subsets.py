@@ -0,0 +1,59 @@
+"""Subsets.
+
+Class-stratified subsets of a dataset. The indices are ordered such that every
+prefix of the order is (as close as possible to) class balanced, which means
+that a smaller subset is always contained in a larger one.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import torch
+from torch.utils.data import Subset
+
+
+def dataset_targets(dataset) -> torch.Tensor:
+    """Gets the class targets of an MNIST or TensorDataset dataset."""
+    if hasattr(dataset, 'targets'):
+        return torch.as_tensor(dataset.targets)
+    return dataset.tensors[1]
+
+
+def stratified_order(targets: torch.Tensor, seed: int = 0) -> torch.Tensor:
+    """Orders the indices of a dataset so every prefix is class stratified.
+
+    The indices of each class are shuffled, then the classes are interleaved
+    in proportion to their frequency.
+
+    Args:
+        targets: Class of each sample.
+        seed: Seed for the shuffle, so the order is the same every time.
+
+    Returns:
+        A permutation of range(len(targets)).
+    """
+    generator = torch.Generator().manual_seed(seed)
+    n = targets.shape[0]
+    keys = torch.empty(n, dtype=torch.float64)
+    for c in targets.unique():
+        idx = (targets == c).nonzero(as_tuple=True)[0]
+        idx = idx[torch.randperm(idx.shape[0], generator=generator)]
+        # The k-th sample of a class is placed at its relative position k / m
+        # so all classes advance at the same rate along the order.
+        keys[idx] = (torch.arange(idx.shape[0], dtype=torch.float64) + 0.5) \
+            / idx.shape[0]
+    return keys.argsort()
+
+
+def stratified_subset(dataset, size: int, seed: int = 0) -> Subset:
+    """Takes a class stratified subset of a dataset.
+
+    Subsets taken with the same seed are nested, i.e. a subset of size n is
+    contained in every subset of size m > n.
+
+    Args:
+        dataset: MNIST or TensorDataset.
+        size: Number of samples in the subset.
+        seed: Seed for the order.
+    """
+    order = stratified_order(dataset_targets(dataset), seed)
+    return Subset(dataset, order[:size].tolist())
@@ -1,9 +1,15 @@
 """Weights and Biases.
 
 Uses a Weights and Biases sweep to find the optimal hyperparameters which
-minimizes number of parameters while maximizing the accuracy
+minimizes number of parameters while maximizing the accuracy.
+
+train() can also be called in-process with a local stand-in for wandb, which
+is what hpoptim.local_sweep does on machines without network access.
 """
-import wandb
+try:
+    import wandb
+except ImportError:
+    wandb = None
 
 import torch
 from torch.optim import SGD
@@ -14,11 +20,14 @@ from torchvision.datasets import MNIST
 from torchvision.transforms.transforms import ToTensor
 
 from datetime import datetime as dt
+from time import perf_counter
 from os.path import join, exists
 from pathlib import Path
 from argparse import ArgumentParser
 
 from model import FCNetwork
+from hpoptim import local_wandb
+from utils.metric_sink import MetricSink, WandbBackend
 
 hyperparameter_defaults = {
     'batch_size': 16,
@@ -30,7 +39,15 @@ hyperparameter_defaults = {
     'epochs': 250,
 }
 
-wandb.init(config=hyperparameter_defaults, project="fully_connected_mnist")
+# Search ranges in the same format as a wandb sweep configuration
+sweep_parameters = {
+    'batch_size': {'values': [8, 16, 32, 64, 128]},
+    'first_layer': {'min': 4, 'max': 32},
+    'second_layer': {'min': 4, 'max': 32},
+    'lr': {'min': 1e-5, 'max': 1e-1, 'distribution': 'log_uniform_values'},
+    'momentum': {'min': 0.5, 'max': 0.99},
+    'decay': {'min': 0., 'max': 0.1},
+}
 
 
 def parse_args():
@@ -43,6 +60,8 @@ def parse_args():
     p.add_argument("--momentum", type=float)
     p.add_argument("--decay", type=float)
     p.add_argument("--epochs", type=int)
+    p.add_argument("--offline", action='store_true',
+                   help="log to the local stand-in instead of wandb")
     return p.parse_args()
 
 
@@ -62,7 +81,9 @@ def calc_batch_accuracy(output: torch.Tensor,
 
 def train(root: str, results_dir: str, batch_size: int, first_layer: int,
           second_layer: int, lr: float, momentum: float, decay: float,
-          epochs: int):
+          epochs: int, run=None, log_interval: int = 50,
+          latency_table=None, latency_weight: float = 1.,
+          datasets=None) -> dict:
     """Performs training on the network.
 
     Args:
@@ -75,7 +96,25 @@ def train(root: str, results_dir: str, batch_size: int, first_layer: int,
         momentum: Momentum of the optimizer
         decay: Decay of the optimizer
         epochs: Number of epochs to train for.
+        run: The run to log metrics to, either from wandb.init() or
+            local_wandb.init(). If None, a local run is created in the results
+            directory.
+        log_interval: Number of steps the step loss is averaged over before
+            it is sent to the run.
+        latency_table: Optional hpoptim.latency.LatencyTable. If given, the
+            model size penalty in the maximization criterion is replaced by
+            latency_weight times the batch 1 NumpyModel latency in ms.
+        latency_weight: Penalty per ms of latency.
+        datasets: Optional preloaded (train, test) datasets, e.g. from
+            hpoptim.warm_pool.shared_datasets(). If None, MNIST is loaded
+            from root.
+
+    Returns:
+        The best validation accuracy and maximization criterion of the run,
+        and the setup time (until the first training step) and training
+        time in seconds.
     """
+    start_time = perf_counter()
     epochs = 150 if epochs is None else epochs
 
     # Create results directory first
@@ -86,10 +125,22 @@ def train(root: str, results_dir: str, batch_size: int, first_layer: int,
         r_dir = join(results_dir, dt.now().strftime('%y-%m-%d__%H-%M-%S'))
     Path(r_dir).mkdir(parents=True, exist_ok=True)
 
+    own_run = run is None
+    if own_run:
+        run = local_wandb.init(
+            config={'batch_size': batch_size, 'first_layer': first_layer,
+                    'second_layer': second_layer, 'lr': lr,
+                    'momentum': momentum, 'decay': decay, 'epochs': epochs},
+            project="fully_connected_mnist", dir=r_dir)
+    sink = MetricSink(WandbBackend(run), log_interval)
+
     # Then load data in
-    train_data = MNIST(root, transform=ToTensor())
+    if datasets is not None:
+        train_data, test_data = datasets
+    else:
+        train_data = MNIST(root, transform=ToTensor())
+        test_data = MNIST(root, train=False, transform=ToTensor())
     train_loader = DataLoader(train_data, batch_size, shuffle=True)
-    test_data = MNIST(root, train=False, transform=ToTensor())
     test_loader = DataLoader(test_data, batch_size, shuffle=False)
 
     steps_per_epoch = len(train_loader)
@@ -98,14 +149,25 @@ def train(root: str, results_dir: str, batch_size: int, first_layer: int,
     model = FCNetwork(784, 10, first_layer, second_layer, (False, False))
 
     layer_crit = (first_layer + second_layer) / 80
+    latency = None
+    if latency_table is not None:
+        latencies = latency_table.get(first_layer, second_layer)
+        latency = latencies[min(latencies)] * 1000.
+        layer_crit = latency_weight * latency
+        run.log({'latency': latency}, step=0)
 
     # Optimizer and loss function
     optimizer = SGD(model.parameters(), lr, momentum, weight_decay=decay)
     loss_criterion = CrossEntropyLoss()
 
+    best = {'accuracy': 0., 'maximization_criterion': float('-inf')}
+    setup_time = None
+
     for epoch in range(epochs):
         steps_done = steps_per_epoch * epoch
         for i, data in enumerate(train_loader):
+            if setup_time is None:
+                setup_time = perf_counter() - start_time
             model.train()
             optimizer.zero_grad()
             img, cls = data
@@ -119,8 +181,8 @@ def train(root: str, results_dir: str, batch_size: int, first_layer: int,
                                                 str(epoch + 1) + ",",
                                                 loss.item(),
                                                 calc_batch_accuracy(out, cls)))
-            # Send metrics
-            wandb.log({'loss': loss.item()}, step=steps_done + i + 1)
+            # Send metrics. Stays on the device until the sink flushes.
+            sink.log_step({'loss': loss.detach()}, step=steps_done + i + 1)
             # Do backprop
             loss.backward()
             # Do grad clip
@@ -138,9 +200,12 @@ def train(root: str, results_dir: str, batch_size: int, first_layer: int,
             validation_acc /= len(test_loader)
             print("Epoch{} validation accuracy: {}".format(epoch,
                                                            validation_acc))
-        wandb.log({'accuracy': validation_acc,
-                   'maximization_criterion': validation_acc - layer_crit},
-                  step=steps_per_epoch * (epoch + 1))  # + 1 since end of epoch
+        sink.log({'accuracy': validation_acc,
+                  'maximization_criterion': validation_acc - layer_crit},
+                 step=steps_per_epoch * (epoch + 1))  # + 1 since end of epoch
+        best['accuracy'] = max(best['accuracy'], validation_acc)
+        best['maximization_criterion'] = max(best['maximization_criterion'],
+                                             validation_acc - layer_crit)
 
         torch.save({
             'model_state_dict': model.state_dict(),
@@ -148,9 +213,32 @@ def train(root: str, results_dir: str, batch_size: int, first_layer: int,
             join(r_dir, 'epoch_{}.pth'.format(epoch))
         )
 
+    sink.close()
+    print(sink.report())
+    if own_run:
+        run.finish()
+    if latency is not None:
+        best['latency'] = latency
+    best['setup_time'] = setup_time
+    best['train_time'] = perf_counter() - start_time - (setup_time or 0.)
+    return best
+
 
 if __name__ == '__main__':
-    args = parse_args()
+    args = vars(parse_args())
     root = 'MNIST/'
     results_dir = 'workdir/'
-    train(root, results_dir, **vars(args))
+    if args.pop('offline') or wandb is None:
+        run_dir = join(results_dir, 'local_runs',
+                       dt.now().strftime('%y-%m-%d__%H-%M-%S'))
+        run = local_wandb.init(config=hyperparameter_defaults,
+                               project="fully_connected_mnist", dir=run_dir)
+    else:
+        run = wandb.init(config=hyperparameter_defaults,
+                         project="fully_connected_mnist")
+    # Values not given on the command line come from the run config, which
+    # the wandb agent fills in for each trial.
+    args = {k: run.config[k] if v is None else v for k, v in args.items()}
+    train(root, results_dir, run=run, **args)
+    # train only finishes runs it started itself
+    run.finish()
@@ -0,0 +1,197 @@
+"""Warm Pool.
+
+Persistent pool of pre-warmed worker processes. Each worker imports torch and
+the given modules and gets the MNIST tensors in shared memory once, when the
+pool starts. Trials are then sent to the workers over a local queue, so a
+trial only pays for its own setup and training instead of interpreter startup,
+imports and parsing MNIST.
+
+Trial functions get the preloaded datasets with shared_datasets().
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import importlib
+import os
+import traceback
+from queue import Empty
+from statistics import mean
+from time import time
+
+import torch
+import torch.multiprocessing as mp
+
+from hpoptim.shared_data import load_shared_mnist
+
+
+_datasets = None
+
+
+def shared_datasets():
+    """The (train, test) TensorDatasets of this worker or None.
+
+    None if not called in a pool worker or the pool was not preloaded.
+    """
+    return _datasets
+
+
+def _worker_main(worker_id, tasks, results, datasets, threads, modules,
+                 created):
+    """Main loop of a worker process."""
+    global _datasets
+    torch.set_num_threads(threads)
+    for module in modules:
+        importlib.import_module(module)
+    _datasets = datasets
+    results.put(('ready', worker_id, time() - created))
+
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        task_id, target, args, kwargs, submitted = item
+        started = time()
+        try:
+            out, error = target(*args, **kwargs), None
+        except Exception:
+            out, error = None, traceback.format_exc()
+        results.put(('done', worker_id, task_id, out, error, submitted,
+                     started, time()))
+
+
+class WarmPool:
+    def __init__(self, n_workers: int, data_path: str = None,
+                 threads: int = None,
+                 modules: tuple = ('hpoptim.wandb_sweep',),
+                 poll_interval: float = 1.):
+        """Starts the workers and waits until all of them are warm.
+
+        Args:
+            n_workers: Number of worker processes.
+            data_path: Path to the MNIST data. If None, no data is preloaded.
+            threads: Torch threads per worker. Defaults to cpus // n_workers.
+            modules: Modules each worker imports before accepting trials.
+            poll_interval: Seconds between checks that the workers are still
+                alive while waiting for them.
+
+        Raises:
+            RuntimeError: If a worker died before it was warm.
+        """
+        ctx = mp.get_context('spawn')
+        if threads is None:
+            threads = max(1, (os.cpu_count() or 1) // n_workers)
+        start_time = time()
+        datasets = load_shared_mnist(data_path) \
+            if data_path is not None else None
+        self.data_load_time = time() - start_time
+
+        self.poll_interval = poll_interval
+        self._tasks = ctx.SimpleQueue()
+        # Not a SimpleQueue, so waiting on it can time out
+        self._results = ctx.Queue()
+        self._next_id = 0
+        self.pending = 0
+        self.workers = [ctx.Process(target=_worker_main,
+                                    args=(i, self._tasks, self._results,
+                                          datasets, threads, modules,
+                                          time()),
+                                    daemon=True)
+                        for i in range(n_workers)]
+        for w in self.workers:
+            w.start()
+
+        # Startup cost, paid once per worker
+        self.worker_startup = []
+        while len(self.worker_startup) < n_workers:
+            _, _, startup = self._next_result()
+            self.worker_startup.append(startup)
+        self.startup_time = time() - start_time
+
+        # Per trial (dispatch latency, run time)
+        self.trial_times = []
+
+    def _next_result(self) -> tuple:
+        """Waits for the next message of a worker.
+
+        Raises:
+            RuntimeError: If a worker died, e.g. from an import error, the
+                OOM killer or a segfault. Workers only exit on close(), so
+                its task would never finish.
+        """
+        while True:
+            try:
+                return self._results.get(timeout=self.poll_interval)
+            except Empty:
+                pass
+            dead = [(i, w.exitcode) for i, w in enumerate(self.workers)
+                    if not w.is_alive()]
+            if dead:
+                # It may still have sent a message before dying
+                try:
+                    return self._results.get(timeout=self.poll_interval)
+                except Empty:
+                    raise RuntimeError(
+                        'Pool worker(s) died: ' + ', '.join(
+                            '{} (exit code {})'.format(i, code)
+                            for i, code in dead))
+
+    def submit(self, target, *args, **kwargs) -> int:
+        """Queues a call of target(*args, **kwargs) on a free worker.
+
+        target must be a module level function so it can be pickled.
+
+        Returns:
+            The id of the task.
+        """
+        task_id = self._next_id
+        self._next_id += 1
+        self._tasks.put((task_id, target, args, kwargs, time()))
+        self.pending += 1
+        return task_id
+
+    def get(self) -> dict:
+        """Blocks until the next task finishes.
+
+        Raises:
+            RuntimeError: If a worker died.
+
+        Returns:
+            Dictionary with the task_id, worker, result and error (a
+            traceback or None) of the task, its dispatch latency (time from
+            submit() until a worker started it) and its run time, both in
+            seconds.
+        """
+        _, worker_id, task_id, out, error, submitted, started, finished = \
+            self._next_result()
+        self.pending -= 1
+        self.trial_times.append((started - submitted, finished - started))
+        return {'task_id': task_id, 'worker': worker_id, 'result': out,
+                'error': error, 'dispatch_latency': started - submitted,
+                'run_time': finished - started}
+
+    def close(self):
+        """Stops the workers once they have finished their current task."""
+        for _ in self.workers:
+            self._tasks.put(None)
+        for w in self.workers:
+            w.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def report(self) -> str:
+        """Startup latencies, reported separately from the trial run times."""
+        lines = ["Pool startup: {:.2f}s ({:.2f}s loading data, {:.2f}s mean "
+                 "worker startup).".format(self.startup_time,
+                                           self.data_load_time,
+                                           mean(self.worker_startup))]
+        if self.trial_times:
+            lines.append("{} trials: {:.4f}s mean dispatch latency, {:.2f}s "
+                         "mean run time.".format(
+                             len(self.trial_times),
+                             mean(t[0] for t in self.trial_times),
+                             mean(t[1] for t in self.trial_times)))
+        return '\n'.join(lines)
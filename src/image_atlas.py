@@ -0,0 +1,93 @@
+"""Image Atlas.
+
+Pre-renders the display images of the test set once into a memory-mapped
+atlas, so physical.py doesn't have to run PIL for every sample shown. The
+atlas stores the images already rotated, either compactly at 28 x 28 (about
+8 MB for the test set) with a nearest-neighbour upscale at draw time, or at
+full display size (about 1 GB).
+
+Images are handed to Tk as PGM data, which Tk decodes natively.
+
+Usage, from the src directory:
+    python image_atlas.py MNIST atlas.npy
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from argparse import ArgumentParser
+
+import numpy as np
+
+DISPLAY_SIZE = 320
+
+
+def nearest_index(src: int, dst: int) -> np.ndarray:
+    """Source row/column of every destination row/column, like NEAREST."""
+    return ((np.arange(dst) + 0.5) * src / dst).astype(np.intp)
+
+
+def build_atlas(root: str, path: str, full: bool = False):
+    """Builds the atlas of the MNIST test set.
+
+    Args:
+        root: Path to the MNIST data root.
+        path: Path of the .npy atlas file.
+        full: Whether to store the images at display size instead of 28 x 28.
+    """
+    from inference import MNIST
+
+    images = np.asarray(MNIST(root, train=False).data, dtype=np.uint8)
+    # Same orientation as PIL's rotate(90), counter clockwise
+    images = np.rot90(images, 1, axes=(1, 2))
+    size = DISPLAY_SIZE if full else images.shape[1]
+    atlas = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                      shape=(len(images), size, size))
+    if full:
+        idx = nearest_index(images.shape[1], size)
+        for i in range(len(images)):
+            atlas[i] = images[i][idx[:, None], idx]
+    else:
+        atlas[:] = images
+    atlas.flush()
+
+
+class ImageAtlas:
+    def __init__(self, path: str, size: int = DISPLAY_SIZE):
+        """Opens an atlas built with build_atlas().
+
+        Args:
+            path: Path of the .npy atlas file.
+            size: Size of the displayed images.
+        """
+        self.atlas = np.load(path, mmap_mode='r')
+        self.size = size
+        self._header = 'P5 {} {} 255\n'.format(size, size).encode()
+        if self.atlas.shape[1] != size:
+            self._idx = nearest_index(self.atlas.shape[1], size)
+        else:
+            self._idx = None
+
+    def __len__(self):
+        return len(self.atlas)
+
+    def image(self, index: int) -> np.ndarray:
+        """The rotated display image as a [size, size] uint8 array."""
+        img = self.atlas[index]
+        if self._idx is not None:
+            img = img[self._idx[:, None], self._idx]
+        return img
+
+    def pgm(self, index: int) -> bytes:
+        """The display image as binary PGM data for tk.PhotoImage."""
+        return self._header + np.ascontiguousarray(self.image(index)).tobytes()
+
+
+if __name__ == '__main__':
+    p = ArgumentParser(description='pre-renders the display images of the '
+                                   'MNIST test set')
+    p.add_argument('ROOT', type=str, help='path to the MNIST data root')
+    p.add_argument('ATLAS', type=str, help='path of the .npy atlas')
+    p.add_argument('--full', action='store_true',
+                   help='store the images at display size instead of 28 x 28')
+    args = p.parse_args()
+    build_atlas(args.ROOT, args.ATLAS, args.full)
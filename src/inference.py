@@ -34,6 +34,24 @@ def parse_args():
     return parser.parse_args()
 
 
+def connection_activations(h: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """Activations flowing through each connection of a layer.
+
+    Args:
+        h: Outputs of the previous layer with shape [n, prev].
+        weight: Weight of the layer with shape [next, prev].
+
+    Returns:
+        Array with shape [n, prev, next], scaled per sample to [-0.5, 0.5].
+        Flattening the last two axes gives the same order the visualizer
+        creates its connections in.
+    """
+    activations = h[:, :, None] * weight.T[None]
+    scale = np.abs(activations).reshape(len(activations), -1).max(1)
+    scale[scale == 0] = 1.
+    return activations / (scale[:, None, None] * 2)
+
+
 class AI:
     def __init__(self, root, state_dict_path):
         """Initializes the AI.
@@ -60,6 +78,9 @@ class AI:
             self.fc2_weight = state_dict['fc2.weight'].detach().cpu()
             self.fc1_weight = self.fc1_weight.numpy()
             self.fc2_weight = self.fc2_weight.numpy()
+        else:
+            self.fc1_weight = state_dict['fc1.0.weight']
+            self.fc2_weight = state_dict['fc2.weight']
 
         in_connections = state_dict['fc0.0.weight'].shape[1]
         out_connections = state_dict['fc2.bias'].shape[0]
@@ -111,6 +132,37 @@ class AI:
         self.counter += 1
         return image, int(out[0]), h1, h2
 
+    def infer_batch(self, start: int, count: int) -> (np.ndarray, np.ndarray,
+                                                      np.ndarray, np.ndarray):
+        """Infers a range of the test set in one forward pass.
+
+        Args:
+            start: Index of the first image.
+            count: Number of images.
+
+        Returns:
+            The images as a [n, 28, 28] uint8 array, the predictions and the
+            outputs of the first and second layers as numpy arrays. The
+            connection activations can be calculated from these with
+            connection_activations().
+        """
+        images = np.asarray(self.data.data[start:start + count],
+                            dtype=np.uint8)
+        if USE_NUMPY:
+            h1, h2, out = self.model(images.astype(float) / 255.)
+        else:
+            with torch.no_grad():
+                h1, h2, out = self.model(
+                    torch.tensor(images, dtype=torch.float) / 255.)
+            h1, h2, out = h1.numpy(), h2.numpy(), out.numpy()
+        return images, out.argmax(1), h1, h2
+
+    def connection_activations(self, h1: np.ndarray,
+                               h2: np.ndarray) -> (np.ndarray, np.ndarray):
+        """Connection activations of both hidden layers for a batch."""
+        return (connection_activations(h1, self.fc1_weight),
+                connection_activations(h2, self.fc2_weight))
+
 
 if __name__ == '__main__':
     args = parse_args()
@@ -0,0 +1,375 @@
+"""Inference Benchmark.
+
+Measures the inference latency of every backend (NumpyModel, FCNetwork and
+the IncrementalModel used by the drawer) over batch sizes and dtypes.
+
+Warm latency is measured per call after warmup calls, for at least a minimum
+number of calls and a minimum time, and reported as p50/p95/p99. This is
+repeated in fresh models and the repeat with the median p50 is kept, as the
+p50 of single runs varies by up to about 25% on a busy machine. Cold start
+is measured in fresh processes, from before numpy is imported to the first
+result, so it includes importing the framework and loading the weights.
+
+Results are written as JSON together with the machine they were measured on.
+Given a baseline JSON from an earlier run, the benchmark exits with an error
+if any p50 got slower by more than the threshold, 25% by default, and by more
+than the spread of the repeats.
+
+Usage, from the src directory:
+    python inference_benchmark.py ../best-model.npy --out bench.json
+    python inference_benchmark.py ../best-model.npy --baseline bench.json
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from time import perf_counter
+# Taken before anything else is imported, for the cold start measurement
+_PROCESS_START = perf_counter()
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+
+import numpy as np
+
+from utils.state_dict import load_state_dict
+
+BACKENDS = ('numpy', 'torch', 'incremental')
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+DTYPES = ('float32', 'float64')
+# Input pixels changed by each incremental update, about one stroke segment
+STROKE_PIXELS = 20
+
+
+def available_backends() -> list:
+    """The backends that can run here, as torch may not be installed."""
+    try:
+        import torch
+    except ImportError:
+        return [b for b in BACKENDS if b != 'torch']
+    return list(BACKENDS)
+
+
+def supports(backend: str, batch_size: int, dtype: str) -> bool:
+    """Whether a backend runs a configuration.
+
+    The incremental model updates a single input, in float64.
+    """
+    if backend == 'incremental':
+        return batch_size == 1 and dtype == 'float64'
+    return True
+
+
+def load_backend(backend: str, model_path: str, dtype: str):
+    """Loads a model and makes its inputs.
+
+    Args:
+        backend: One of BACKENDS.
+        model_path: Path to the .npy or .pth state dict.
+        dtype: Name of the dtype to run in.
+
+    Returns:
+        (infer, make_input). make_input(batch_size, rng) returns an input and
+        infer(x) runs the model on it.
+    """
+    state_dict = load_state_dict(model_path)
+    sizes = (state_dict['fc0.0.weight'].shape[1],
+             state_dict['fc2.bias'].shape[0],
+             state_dict['fc0.0.bias'].shape[0],
+             state_dict['fc1.0.bias'].shape[0])
+
+    if backend == 'numpy':
+        from model import NumpyModel
+
+        model = NumpyModel(*sizes)
+        model.load_state_dict({k: np.asarray(v, dtype=dtype)
+                               for k, v in state_dict.items()})
+
+        def make_input(batch_size, rng):
+            return rng.random((batch_size, 28, 28)).astype(dtype)
+
+        return model, make_input
+
+    if backend == 'torch':
+        import torch
+        from model import FCNetwork
+
+        model = FCNetwork(*sizes)
+        model.load_state_dict({k: torch.as_tensor(np.asarray(v))
+                               for k, v in state_dict.items()})
+        model = model.to(getattr(torch, dtype)).eval()
+
+        def infer(x):
+            with torch.no_grad():
+                return model(x)
+
+        def make_input(batch_size, rng):
+            return torch.as_tensor(rng.random((batch_size, 28, 28)),
+                                   dtype=getattr(torch, dtype))
+
+        return infer, make_input
+
+    if backend == 'incremental':
+        from model import IncrementalModel
+
+        model = IncrementalModel(state_dict)
+
+        def infer(x):
+            model.update(*x)
+            return model.outputs()
+
+        def make_input(batch_size, rng):
+            return (rng.choice(model.in_connections, STROKE_PIXELS,
+                               replace=False),
+                    rng.random(STROKE_PIXELS))
+
+        return infer, make_input
+
+    raise ValueError(f'unknown backend {backend}')
+
+
+def percentiles(times) -> dict:
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {'p50': p50, 'p95': p95, 'p99': p99, 'mean': float(np.mean(times)),
+            'min': float(np.min(times))}
+
+
+def warm_latency(backend: str, model_path: str, batch_size: int, dtype: str,
+                 warmup: int = 10, min_calls: int = 30,
+                 min_time: float = 0.5, seed: int = 0) -> dict:
+    """Measures the latency of every call after warming up.
+
+    Every call gets a fresh input, made before its timer starts, so each
+    incremental update changes STROKE_PIXELS pixels. min_time only counts
+    the timed calls, not making the inputs.
+
+    Returns:
+        The latency percentiles in seconds and the throughput.
+    """
+    rng = np.random.default_rng(seed)
+    infer, make_input = load_backend(backend, model_path, dtype)
+    for _ in range(warmup):
+        infer(make_input(batch_size, rng))
+
+    times = []
+    while len(times) < min_calls or sum(times) < min_time:
+        x = make_input(batch_size, rng)
+        t = perf_counter()
+        infer(x)
+        times.append(perf_counter() - t)
+
+    result = {'backend': backend, 'dtype': dtype, 'batch_size': batch_size,
+              'calls': len(times)}
+    result.update(percentiles(times))
+    result['samples_per_sec'] = batch_size / result['p50']
+    return result
+
+
+def median_run(runs: list) -> dict:
+    """The run with the median p50, with the p50 of every run added."""
+    runs = sorted(runs, key=lambda r: r['p50'])
+    result = dict(runs[len(runs) // 2])
+    result['p50_runs'] = [r['p50'] for r in runs]
+    return result
+
+
+def _cold_start_child(backend: str, model_path: str, dtype: str):
+    """Runs in the fresh process, printing the cold start as JSON."""
+    infer, make_input = load_backend(backend, model_path, dtype)
+    infer(make_input(1, np.random.default_rng(0)))
+    print(json.dumps({'first_result': perf_counter() - _PROCESS_START}))
+
+
+def cold_start(backend: str, model_path: str, dtype: str,
+               trials: int = 5) -> dict:
+    """Measures the cold start in fresh processes.
+
+    Returns:
+        Percentiles in seconds of the time from the start of the process to
+        the first result, and of the whole process including the interpreter
+        starting and exiting.
+    """
+    first, total = [], []
+    for _ in range(trials):
+        start = perf_counter()
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__),
+             os.path.abspath(model_path), '--cold_start_child', backend,
+             dtype],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        total.append(perf_counter() - start)
+        first.append(json.loads(out.stdout.splitlines()[-1])['first_result'])
+
+    result = {'backend': backend, 'dtype': dtype, 'trials': trials}
+    result.update(percentiles(first))
+    result['process'] = percentiles(total)
+    return result
+
+
+def metadata() -> dict:
+    """The machine and software the benchmark ran on."""
+    meta = {'time': datetime.now().isoformat(timespec='seconds'),
+            'hostname': platform.node(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'threads': {k: os.environ.get(k) for k in
+                        ('OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                         'OPENBLAS_NUM_THREADS')}}
+    try:
+        import torch
+        meta['torch'] = torch.__version__
+        meta['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        meta['torch'] = None
+    try:
+        meta['commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        meta['commit'] = None
+    return meta
+
+
+def run(model_path: str, backends=None, batch_sizes=BATCH_SIZES,
+        dtypes=DTYPES, warmup: int = 10, min_calls: int = 30,
+        min_time: float = 0.5, cold_trials: int = 5,
+        repeats: int = 3) -> dict:
+    """Runs the whole benchmark.
+
+    Every warm measurement is repeated and the repeat with the median p50
+    is kept, see median_run().
+
+    Returns:
+        The results, with 'metadata', 'warm' and 'cold' entries.
+    """
+    backends = backends or available_backends()
+    warm, cold = [], []
+    for backend in backends:
+        for dtype in dtypes:
+            if not any(supports(backend, b, dtype) for b in batch_sizes):
+                continue
+            if cold_trials:
+                cold.append(cold_start(backend, model_path, dtype,
+                                       cold_trials))
+            for batch_size in batch_sizes:
+                if supports(backend, batch_size, dtype):
+                    warm.append(median_run([
+                        warm_latency(backend, model_path, batch_size, dtype,
+                                     warmup, min_calls, min_time, seed)
+                        for seed in range(repeats)]))
+                    print("{backend:<12} {dtype:<8} batch {batch_size:>6}: "
+                          "p50 {p50:.6f}s, p99 {p99:.6f}s".format(**warm[-1]))
+    return {'metadata': metadata(), 'warm': warm, 'cold': cold}
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.25) -> list:
+    """Compares the p50 latencies of two runs.
+
+    A p50 only counts as a regression if it is slower than the threshold
+    allows and even the fastest of its repeats is slower than the slowest
+    repeat of the baseline, so noise between repeats isn't reported.
+
+    Args:
+        results: Results of this run.
+        baseline: Results of the baseline run.
+        threshold: Relative slowdown above which a p50 is a regression.
+
+    Returns:
+        (name, baseline p50, p50, ratio, regressed) of every measurement
+        both runs have.
+    """
+    rows = []
+    for kind, key in (('warm', ('backend', 'dtype', 'batch_size')),
+                      ('cold', ('backend', 'dtype'))):
+        base = {tuple(r[k] for k in key): r for r in baseline.get(kind, [])}
+        for r in results[kind]:
+            k = tuple(r[k] for k in key)
+            if k not in base:
+                continue
+            name = ' '.join([kind] + [str(v) for v in k])
+            ratio = r['p50'] / base[k]['p50']
+            beyond_noise = min(r.get('p50_runs', [r['p50']])) \
+                > max(base[k].get('p50_runs', [base[k]['p50']]))
+            rows.append((name, base[k]['p50'], r['p50'], ratio,
+                         ratio > 1 + threshold and beyond_noise))
+    return rows
+
+
+def parse_args():
+    p = ArgumentParser(description='benchmarks the inference backends')
+    p.add_argument('MODEL', type=str, help='path to the NN model')
+    p.add_argument('--backends', type=str, nargs='+', choices=BACKENDS,
+                   default=None, help='backends to benchmark, all available '
+                                      'ones by default')
+    p.add_argument('--batch_sizes', type=int, nargs='+', default=BATCH_SIZES)
+    p.add_argument('--dtypes', type=str, nargs='+', choices=DTYPES,
+                   default=DTYPES)
+    p.add_argument('--warmup', type=int, default=10,
+                   help='calls before measuring')
+    p.add_argument('--min_calls', type=int, default=30,
+                   help='minimum number of measured calls')
+    p.add_argument('--min_time', type=float, default=0.5,
+                   help='minimum seconds of measured calls')
+    p.add_argument('--repeats', type=int, default=3,
+                   help='times to repeat every warm measurement, keeping the '
+                        'one with the median p50')
+    p.add_argument('--cold_trials', type=int, default=5,
+                   help='fresh processes to measure the cold start in, 0 to '
+                        'skip it')
+    p.add_argument('--out', type=str, default=None,
+                   help='path to write the results JSON to')
+    p.add_argument('--baseline', type=str, default=None,
+                   help='results JSON to compare against')
+    p.add_argument('--threshold', type=float, default=0.25,
+                   help='relative p50 slowdown that counts as a regression. '
+                        'Below about 0.25, noise between runs gives false '
+                        'regressions')
+    p.add_argument('--cold_start_child', type=str, nargs=2, default=None,
+                   metavar=('BACKEND', 'DTYPE'), help='internal, measures '
+                                                      'one cold start')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.cold_start_child is not None:
+        _cold_start_child(args.cold_start_child[0], args.MODEL,
+                          args.cold_start_child[1])
+        sys.exit()
+
+    results = run(args.MODEL, args.backends, args.batch_sizes, args.dtypes,
+                  args.warmup, args.min_calls, args.min_time,
+                  args.cold_trials, args.repeats)
+    for c in results['cold']:
+        print("{backend:<12} {dtype:<8} cold start: p50 {p50:.3f}s, "
+              "process p50 {:.3f}s".format(c['process']['p50'], **c))
+    if args.out is not None:
+        with open(args.out, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        rows = compare(results, baseline, args.threshold)
+        print("\n| Measurement                    | Baseline p50 |"
+              "          p50 |  Ratio |")
+        print("|--------------------------------|--------------|"
+              "--------------|--------|")
+        for name, base, p50, ratio, regressed in rows:
+            print("| {:<30} | {:>11.6f}s | {:>11.6f}s | {:>5.2f}x |{}".format(
+                name, base, p50, ratio, ' REGRESSION' if regressed else ''))
+        regressions = [r for r in rows if r[4]]
+        if regressions:
+            print(f"{len(regressions)} regressions beyond "
+                  f"{args.threshold:.0%}")
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,142 @@
+"""LED Animation.
+
+The LED animation of a sample, computed with NumPy only. Kept apart from
+physical.py, which needs Tk and the AI, so that split_mode.py's client on the
+Pi and led_benchmark.py don't have to import either.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from math import floor, sin, pi
+
+import numpy as np
+
+from colors import led_lut
+
+
+PIXEL_PIN = 'D12'
+NUM_PIXELS = 45
+BRIGHTNESS = 0.2
+ORDER = 'RGB'
+
+C_LEN = (0, 10, 15, 10, 10)  # Individual Column Lengths
+
+# Animation Parameters
+HALF_PERIOD = 1
+OFFSET = (0.8, 1.0, 1.2, 1.4)
+PEAK_DURATIONS = (1, 1, 1.7, 1.7)
+ANIMATION_FPS = 60
+
+# Brightness is folded into the colormap, so the driver runs at full
+# brightness and frames can be written to it as they are.
+LUT = led_lut(BRIGHTNESS)
+
+
+def sample_activations(out: int, h0: list, h1: list) -> np.ndarray:
+    """Makes h0, h1 and out into the activation of every pixel."""
+    activations = np.zeros(NUM_PIXELS, dtype=int)
+
+    # First assign values to h0 and h1
+    activations[:C_LEN[1]] = h0
+    activations[C_LEN[1]:C_LEN[1] + C_LEN[2]] = h1
+
+    # Then assign 1 to the correct final output values
+    activations[C_LEN[1] + C_LEN[2] + out] = 255
+    activations[(out + 1) * -1] = 255
+    return activations
+
+
+def brightness_calc(curr_time: float, half_period=2., offset=0.,
+                    peak_duration=0.) -> float:
+    """Calculates the color value multiplier at a given time.
+
+    Args:
+        curr_time: The current time. Must be greater than 0. 0 is the starting
+            time of the current animation.
+        half_period: How long the animation lasts in ms. Defaults to 2 s
+        offset: How many s to wait after the beginning of the animation before
+            starting. Defaults to 0 s.
+        peak_duration: How long to hold the peak value in ms. Defaults to 0 s
+
+    Returns:
+        A value between 0 and 1.
+    """
+    if peak_duration == 0.:
+        # It's a simple sine function
+        return max(0, sin(((pi * curr_time) - (offset * pi)) / half_period))
+    else:
+        # Then it becomes piecewise function
+        x_0 = offset                    # Start of animation
+        x_1 = x_0 + (half_period / 2)   # End of rising part
+        x_2 = x_1 + peak_duration       # End of peak hold
+        x_3 = x_2 + (half_period / 2)   # End of animation
+
+        if x_0 <= curr_time < x_1:
+            # The first part (i.e. the rising portion is done like usual
+            return brightness_calc(curr_time, half_period, offset, 0)
+        elif x_1 <= curr_time < x_2:
+            # During the peak duration, always output 1
+            return 1.
+        elif x_2 <= curr_time < x_3:
+            # The descending part of the curve
+            return brightness_calc(curr_time, half_period,
+                                   offset + peak_duration, 0)
+        else:
+            # otherwise, stay at 0
+            return 0.
+
+
+def brightness_envelope(times: np.ndarray, half_period=2., offset=0.,
+                        peak_duration=0.) -> np.ndarray:
+    """Vectorized brightness_calc() over an array of times.
+
+    Returns:
+        The color value multipliers, between 0 and 1, at the given times.
+    """
+    x_1 = offset + (half_period / 2)    # End of rising part
+    x_2 = x_1 + peak_duration           # End of peak hold
+    x_3 = x_2 + (half_period / 2)       # End of animation
+    rising = np.sin(pi * (times - offset) / half_period)
+    falling = np.sin(pi * (times - offset - peak_duration) / half_period)
+    out = np.select([times < offset, times < x_1, times < x_2, times < x_3],
+                    [0., rising, 1., falling], 0.)
+    return out.clip(min=0.)
+
+
+_ENVELOPE = None
+
+
+def pixel_envelope(fps: int = ANIMATION_FPS) -> np.ndarray:
+    """Brightness of every pixel at every frame of the animation.
+
+    The same for every sample, so it is only calculated once.
+
+    Returns:
+        A [frames, NUM_PIXELS] array of multipliers between 0 and 1.
+    """
+    global _ENVELOPE
+    if _ENVELOPE is None or _ENVELOPE[0] != fps:
+        duration = HALF_PERIOD + OFFSET[3] + PEAK_DURATIONS[3]
+        times = np.arange(floor(duration * fps) + 1) / fps
+        columns = np.stack([brightness_envelope(times, HALF_PERIOD,
+                                                OFFSET[i], PEAK_DURATIONS[i])
+                            for i in range(4)], axis=1)
+        # Each column's brightness for each of its pixels
+        _ENVELOPE = (fps, np.repeat(columns, C_LEN[1:], axis=1))
+    return _ENVELOPE[1]
+
+
+def build_animation(activations: np.ndarray,
+                    fps: int = ANIMATION_FPS) -> np.ndarray:
+    """Precomputes the whole LED animation of a sample.
+
+    Args:
+        activations: Activation of every pixel, between 0 and 255.
+        fps: Frame rate of the animation.
+
+    Returns:
+        A [frames, NUM_PIXELS, 3] uint8 array of pixel colors.
+    """
+    # Values between 0 and 255, used as colormap indices
+    px_vals = np.floor(activations[None] * pixel_envelope(fps))
+    return LUT[px_vals.astype(np.intp)]
@@ -0,0 +1,125 @@
+"""LED Benchmark.
+
+Measures what the physical animation costs per frame, split into computing
+the frame and pushing it to the strip, on a simulated strip so it runs on an
+ordinary Linux box. The per-frame computation and per-pixel writes physical.py
+used to do are measured next to the precomputed animation and bulk writes.
+
+Usage, from the src directory:
+    python led_benchmark.py --samples 20
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+from argparse import ArgumentParser
+from math import floor
+from time import perf_counter
+
+import numpy as np
+
+from led_strip import SimulatedStrip
+from led_animation import (build_animation, brightness_calc, C_LEN,
+                           HALF_PERIOD, OFFSET, PEAK_DURATIONS, ANIMATION_FPS,
+                           LUT, NUM_PIXELS)
+
+
+LUT_TUPLES = [tuple(c) for c in LUT.tolist()]
+
+
+def legacy_frame(activations: list, curr_time: float) -> list:
+    """Computes one frame the way physical.main used to, every frame."""
+    px_vals = activations.copy()
+    for i in range(4):
+        brightness = brightness_calc(curr_time, HALF_PERIOD, OFFSET[i],
+                                     PEAK_DURATIONS[i])
+        px_vals[sum(C_LEN[:i + 1]):sum(C_LEN[:i + 2])] = [
+            floor(i * brightness)
+            for i in px_vals[sum(C_LEN[:i + 1]):sum(C_LEN[:i + 2])]
+        ]
+    return [LUT_TUPLES[v] for v in px_vals]
+
+
+def random_activations(rng) -> np.ndarray:
+    """Activations shaped like physical.prepare_next() makes them."""
+    activations = rng.integers(0, 256, NUM_PIXELS)
+    activations[C_LEN[1] + C_LEN[2]:] = 0
+    out = rng.integers(0, 10)
+    activations[C_LEN[1] + C_LEN[2] + out] = 255
+    activations[(out + 1) * -1] = 255
+    return activations
+
+
+def benchmark(samples: int = 20, fps: int = ANIMATION_FPS,
+              seed: int = 0) -> dict:
+    """Runs the benchmark.
+
+    Returns:
+        Per frame cost in seconds of each way of computing and pushing.
+    """
+    rng = np.random.default_rng(seed)
+    strip = SimulatedStrip(NUM_PIXELS, record=False)
+    totals = dict.fromkeys(['legacy compute', 'precomputed build',
+                            'precomputed playback', 'per-pixel push',
+                            'bulk push'], 0.)
+    frames_total = 0
+
+    for _ in range(samples):
+        activations = random_activations(rng)
+
+        start = perf_counter()
+        frames = build_animation(activations, fps)
+        totals['precomputed build'] += perf_counter() - start
+        times = np.arange(len(frames)) / fps
+        frames_total += len(frames)
+
+        act_list = activations.tolist()
+        start = perf_counter()
+        legacy = [legacy_frame(act_list, t) for t in times]
+        totals['legacy compute'] += perf_counter() - start
+
+        start = perf_counter()
+        for i in range(len(frames)):
+            frame = frames[i]
+        totals['precomputed playback'] += perf_counter() - start
+
+        start = perf_counter()
+        for colors in legacy:
+            for i in range(NUM_PIXELS):
+                strip[i] = colors[i]
+            strip.show()
+        totals['per-pixel push'] += perf_counter() - start
+
+        start = perf_counter()
+        for frame in frames:
+            strip.write(frame)
+            strip.show()
+        totals['bulk push'] += perf_counter() - start
+
+    return {k: v / frames_total for k, v in totals.items()}
+
+
+def parse_args():
+    p = ArgumentParser(description='benchmarks computing and pushing the LED '
+                                   'animation frames')
+    p.add_argument('--samples', type=int, default=20,
+                   help='number of sample animations')
+    p.add_argument('--fps', type=int, default=ANIMATION_FPS)
+    p.add_argument('--json', type=str, default=None,
+                   help='path to write the results to')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = benchmark(args.samples, args.fps)
+    for k, v in results.items():
+        print(f"{k:<22}{v * 1e6:>10.1f} us/frame")
+    legacy = results['legacy compute'] + results['per-pixel push']
+    new = results['precomputed build'] + results['precomputed playback'] \
+        + results['bulk push']
+    print(f"Per frame: {legacy * 1e6:.1f} us before, {new * 1e6:.1f} us "
+          f"after ({legacy / new:.1f}x)")
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
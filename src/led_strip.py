@@ -0,0 +1,145 @@
+"""LED Strip.
+
+Output abstraction for the LEDs. NeoPixelStrip drives the real strip on the
+Pi, SimulatedStrip keeps the pixels in memory and can record every shown
+frame with its timestamp, so the LED code can run and be benchmarked
+anywhere.
+
+Both take whole frames as [num_pixels, 3] uint8 arrays with write(), instead
+of one pixel at a time.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from time import perf_counter
+
+import numpy as np
+
+
+class NeoPixelStrip:
+    def __init__(self, num_pixels: int = 45, pin: str = 'D12',
+                 brightness: float = 1., order: str = 'RGB'):
+        """Creates the NeoPixel driver.
+
+        board and neopixel are only imported here, so importing this module
+        does not need a Pi.
+
+        Args:
+            num_pixels: Number of pixels on the strip.
+            pin: Name of the board pin the strip is connected to.
+            brightness: Driver brightness. Keep it at 1 and fold brightness
+                into the colors (see colors.led_lut()) so whole frames can
+                be copied into the driver buffer.
+            order: Byte order of the pixels, e.g. 'RGB' or 'GRB', or 'RGBW'
+                or 'GRBW' for strips with a white LED, which is left off.
+
+        Raises:
+            ValueError: If order is not an ordering of RGB or RGBW.
+        """
+        if sorted(order) not in (sorted('RGB'), sorted('RGBW')):
+            raise ValueError("order must be an ordering of 'RGB' or 'RGBW', "
+                             "not {!r}".format(order))
+        import board
+        import neopixel
+
+        self.num_pixels = num_pixels
+        self.pixels = neopixel.NeoPixel(getattr(board, pin), num_pixels,
+                                        brightness=brightness,
+                                        auto_write=False, pixel_order=order)
+        self._order = ['RGBW'.index(c) for c in order]
+        # Frames with the white channel added, in RGB(W) order
+        self._frame = np.zeros((num_pixels, len(order)), dtype=np.uint8)
+        self._buf = self._driver_buffer(brightness)
+
+    def _driver_buffer(self, brightness: float):
+        """The buffer the driver transmits, if frames can be copied into it.
+
+        At full brightness, the pixelbuf based driver transmits its
+        _post_brightness_buffer as-is. That buffer is private to the driver,
+        so a pixel is first set through the public API to check that it
+        shows up where write() would put it.
+
+        Returns:
+            A memoryview of the pixel bytes, or None to set the pixels
+            through the public API.
+        """
+        buf = getattr(self.pixels, '_post_brightness_buffer', None)
+        offset = getattr(self.pixels, '_offset', 0)
+        bpp = len(self._order)
+        if brightness != 1. or buf is None \
+                or len(buf) - offset != self.num_pixels * bpp:
+            return None
+        view = memoryview(buf)[offset:]
+        test = tuple(range(1, bpp + 1))
+        self.pixels[0] = test
+        matches = bytes(view[:bpp]) == bytes(test[i] for i in self._order)
+        self.pixels[0] = (0,) * bpp
+        return view if matches else None
+
+    def write(self, frame: np.ndarray):
+        """Sets all pixels from a [num_pixels, 3] uint8 RGB array."""
+        self._frame[:, :3] = frame
+        if self._buf is not None:
+            self._buf[:] = np.ascontiguousarray(
+                self._frame[:, self._order]).tobytes()
+        else:
+            self.pixels[:] = [tuple(c) for c in self._frame.tolist()]
+
+    def fill(self, color):
+        self.pixels.fill(tuple(color))
+
+    def show(self):
+        self.pixels.show()
+
+
+class SimulatedStrip:
+    def __init__(self, num_pixels: int = 45, record: bool = False,
+                 clock=perf_counter):
+        """In-memory strip that can record the shown frames.
+
+        Args:
+            num_pixels: Number of pixels on the strip.
+            record: Whether to keep a copy of every shown frame. The
+                recording grows without limit, so only use it for runs of a
+                known length, like tests and benchmarks.
+            clock: Function returning the current time in seconds.
+        """
+        self.num_pixels = num_pixels
+        self.record = record
+        self.clock = clock
+        self.buffer = np.zeros((num_pixels, 3), dtype=np.uint8)
+        self.frames = []
+        self.timestamps = []
+        self.shows = 0
+
+    def write(self, frame: np.ndarray):
+        self.buffer[:] = frame
+
+    def fill(self, color):
+        self.buffer[:] = color
+
+    def __setitem__(self, index, color):
+        """Per pixel writes, like neopixel.NeoPixel."""
+        self.buffer[index] = color
+
+    def show(self):
+        self.shows += 1
+        if self.record:
+            self.frames.append(self.buffer.copy())
+            self.timestamps.append(self.clock())
+
+    def recording(self) -> (np.ndarray, np.ndarray):
+        """The recorded frames and the times they were shown at."""
+        return (np.array(self.frames, dtype=np.uint8).reshape(
+                    -1, self.num_pixels, 3),
+                np.array(self.timestamps))
+
+
+def make_strip(simulate: bool = False, num_pixels: int = 45, **kwargs):
+    """Creates the real strip, or a simulated one if simulate is True.
+
+    The simulated strip doesn't record, as the scripts run until stopped.
+    """
+    if simulate:
+        return SimulatedStrip(num_pixels, record=False)
+    return NeoPixelStrip(num_pixels, **kwargs)
@@ -3,5 +3,6 @@ try:
 except ImportError:
     pass
 from .numpy_model import NumpyModel
+from .incremental_model import IncrementalModel
 
-__all__ = ['FCNetwork', 'NumpyModel']
+__all__ = ['FCNetwork', 'NumpyModel', 'IncrementalModel']
@@ -0,0 +1,98 @@
+"""Incremental Model.
+
+The numpy model for inputs that change a few pixels at a time, like a number
+being drawn. The pre-activations of fc0 are kept between updates, and a
+change to some input pixels only adds the weight columns of those pixels
+times their change, instead of redoing the whole 784-wide matmul. The layers
+after fc0 are only run when their outputs are asked for.
+"""
+import numpy as np
+
+
+class IncrementalModel:
+    def __init__(self, state_dict: dict, refresh_every: int = 10000):
+        """Creates the model from a numpy or torch state dict.
+
+        Args:
+            state_dict: State dict of the FCNetwork.
+            refresh_every: Number of updates after which the fc0
+                pre-activations are recomputed from scratch, so rounding
+                errors can't add up.
+        """
+        params = {k: np.asarray(v.detach().cpu().numpy()
+                                if hasattr(v, 'detach') else v,
+                                dtype=np.float64)
+                  for k, v in state_dict.items()}
+        # Transposed, so the weights of a set of pixels are contiguous rows
+        self.w0 = np.ascontiguousarray(params['fc0.0.weight'].T)
+        self.b0 = params['fc0.0.bias']
+        self.w1 = params['fc1.0.weight']
+        self.b1 = params['fc1.0.bias']
+        self.w2 = params['fc2.weight']
+        self.b2 = params['fc2.bias']
+        self.in_connections = self.w0.shape[0]
+        self.refresh_every = refresh_every
+
+        self.x = np.zeros(self.in_connections)
+        self.pre0 = self.b0.copy()
+        self._outputs = None
+        self._updates = 0
+
+    def reset(self, x: np.ndarray = None):
+        """Sets the whole input, with a full fc0 matmul.
+
+        Args:
+            x: Input with values between 0 and 1, of any shape with
+                in_connections elements. None sets it to all zeros.
+        """
+        if x is None:
+            self.x[:] = 0.
+        else:
+            self.x[:] = np.asarray(x, dtype=np.float64).reshape(-1)
+        self.pre0 = self.x @ self.w0 + self.b0
+        self._outputs = None
+        self._updates = 0
+
+    def update(self, indices: np.ndarray, values: np.ndarray) -> bool:
+        """Changes some input pixels.
+
+        Args:
+            indices: Flat indices of the pixels. If an index is given more
+                than once, its last value is used.
+            values: Their new values, between 0 and 1.
+
+        Returns:
+            Whether any pixel actually changed.
+        """
+        old = self.x.copy()
+        # With repeated indices, the last value is the one assigned
+        self.x[np.asarray(indices, dtype=np.intp)] = values
+        delta = self.x - old
+        changed = np.flatnonzero(delta)
+        if not len(changed):
+            return False
+        self._updates += 1
+        if self._updates >= self.refresh_every:
+            self.reset(self.x)
+        else:
+            self.pre0 += delta[changed] @ self.w0[changed]
+            self._outputs = None
+        return True
+
+    def outputs(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """Outputs of every layer for the current input.
+
+        Returns:
+            The same as NumpyModel, for a batch of one: the outputs of fc0,
+            fc1 and fc2 with shapes [1, 10], [1, 15] and [1, 10].
+        """
+        if self._outputs is None:
+            x1 = np.maximum(self.pre0, 0.)
+            x2 = np.maximum(self.w1 @ x1 + self.b1, 0.)
+            x3 = self.w2 @ x2 + self.b2
+            self._outputs = (x1[None], x2[None], x3[None])
+        return self._outputs
+
+    def predict(self) -> int:
+        """The predicted class of the current input."""
+        return int(self.outputs()[2].argmax())
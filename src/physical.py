@@ -8,42 +8,35 @@ Author:
 Created on:
     19 May 2020.
 """
-import board
-import neopixel
 import numpy as np
-from math import floor, sin, pi
-from time import sleep, time
+from math import floor
 from inference import AI
-from colors import LINEAR_TUPLE
+from led_animation import (build_animation, sample_activations, LUT, C_LEN,
+                           HALF_PERIOD, ANIMATION_FPS, NUM_PIXELS, PIXEL_PIN,
+                           ORDER)
 from argparse import ArgumentParser
 from startup_sequence import startup
+from led_strip import make_strip
+from image_atlas import ImageAtlas
+from utils.prefetch import Prefetcher
+from utils.frame_scheduler import FrameScheduler
 from PIL import Image, ImageTk
 import tkinter as tk
 import signal
 import sys
 
 
-PIXEL_PIN = board.D12
-NUM_PIXELS = 45
-BRIGHTNESS = 0.2
-ORDER = neopixel.RGB
-
-C_LEN = (0, 10, 15, 10, 10)  # Individual Column Lengths
-
-# Animation Parameters
-HALF_PERIOD = 1
-OFFSET = (0.8, 1.0, 1.2, 1.4)
-PEAK_DURATIONS = (1, 1, 1.7, 1.7)
-
-PIXELS = neopixel.NeoPixel(PIXEL_PIN, NUM_PIXELS, brightness=BRIGHTNESS,
-                           auto_write=False, pixel_order=ORDER)
-
-
 def parse_args():
     p = ArgumentParser(description='light up physical LEDs to represent a '
                                    'neural network')
     p.add_argument('ROOT', type=str, help='path to the MNIST dataset')
     p.add_argument('MODEL', type=str, help='path to the NN model')
+    p.add_argument('--fps', type=int, default=ANIMATION_FPS,
+                   help='frame rate of the LED animations')
+    p.add_argument('--simulate', action='store_true',
+                   help='use a simulated LED strip instead of the NeoPixels')
+    p.add_argument('--atlas', type=str, default=None,
+                   help='display image atlas built with image_atlas.py')
 
     return p.parse_args()
 
@@ -72,74 +65,45 @@ def get_next_values(ai) -> (np.ndarray, int, list, list):
     return img, out, h1, h2
 
 
-def animation_running(curr_time: float, half_period=2., offset=0.,
-                      peak_duration=0.) -> bool:
-    """Calculates based on the given parameters if the animation is finished.
-
-    This function is given the parameters of the final column of LEDs.
-
-    Returns:
-        True if animation is not yet finished.
-    """
-    return curr_time <= (half_period + offset + peak_duration)
-
+def prepare_next(ai, fps: int = ANIMATION_FPS, atlas: ImageAtlas = None):
+    """Prepares the display image and LED animation of the next sample.
 
-def brightness_calc(curr_time: float, half_period=2., offset=0.,
-                    peak_duration=0.) -> float:
-    """Calculates the color value multiplier at a given time.
+    Runs on the prefetch thread, so it must not touch Tk or the LEDs.
 
     Args:
-        curr_time: The current time. Must be greater than 0. 0 is the starting
-            time of the current animation.
-        half_period: How long the animation lasts in ms. Defaults to 2 s
-        offset: How many s to wait after the beginning of the animation before
-            starting. Defaults to 0 s.
-        peak_duration: How long to hold the peak value in ms. Defaults to 0 s
+        ai: The AI to run inference with.
+        fps: Frame rate of the LED animation.
+        atlas: Pre-rendered display images of the test set. If given, the
+            display image is read from it instead of made with PIL.
 
     Returns:
-        A value between 0 and 1.
+        The resized and rotated display image, as PGM data if an atlas is
+        given and as a PIL Image otherwise, and the animation as a
+        [frames, NUM_PIXELS, 3] uint8 array.
     """
-    if peak_duration == 0.:
-        # It's a simple sine function
-        return max(0, sin(((pi * curr_time) - (offset * pi)) / half_period))
+    # infer_next() wraps around at the end of the test set
+    index = ai.counter % len(ai.data)
+    img, out, h0, h1 = get_next_values(ai)
+    if atlas is not None:
+        img = atlas.pgm(index)
     else:
-        # Then it becomes piecewise function
-        x_0 = offset                    # Start of animation
-        x_1 = x_0 + (half_period / 2)   # End of rising part
-        x_2 = x_1 + peak_duration       # End of peak hold
-        x_3 = x_2 + (half_period / 2)   # End of animation
-
-        if x_0 <= curr_time < x_1:
-            # The first part (i.e. the rising portion is done like usual
-            return brightness_calc(curr_time, half_period, offset, 0)
-        elif x_1 <= curr_time < x_2:
-            # During the peak duration, always output 1
-            return 1.
-        elif x_2 <= curr_time < x_3:
-            # The descending part of the curve
-            return brightness_calc(curr_time, half_period,
-                                   offset + peak_duration, 0)
-        else:
-            # otherwise, stay at 0
-            return 0.
-
-
-def fade_on():
+        img = Image.fromarray(img).resize((320, 320),
+                                          Image.NEAREST).rotate(90)
+    return img, build_animation(sample_activations(out, h0, h1), fps)
+
+
+def fade_on(strip, scheduler: FrameScheduler):
     """Fades to the LED default color state."""
-    target_color = LINEAR_TUPLE[0]
-    start_time = time()
+    target_color = LUT[0].tolist()
     duration = HALF_PERIOD / 2
-    elapsed_time = 0.
-    while elapsed_time <= duration:
+    for _, elapsed_time in scheduler.run(duration):
         current_color = [floor(color * (elapsed_time / duration))
                          for color in target_color]
-        PIXELS.fill(current_color)
-        PIXELS.show()
-        sleep(0.0005)
-        elapsed_time = time() - start_time
+        strip.fill(current_color)
+        strip.show()
 
 
-def main(root, model):
+def main(root, model, strip, prefetch=4, fps=ANIMATION_FPS, atlas=None):
     # First initialize the LEDs and the screen
     window = tk.Tk()
     window.attributes('-fullscreen', True)
@@ -147,78 +111,53 @@ def main(root, model):
     window.config(cursor="none")
     canvas = tk.Canvas(window, width=480, height=320, highlightthickness=0,
                        background='black')
-    black_image = Image.new('RGB', (320, 320), 'black')
-    canvas_image = canvas.create_image(80, 0, anchor='nw',
-                                       image=ImageTk.PhotoImage(black_image))
+    # Display images from the atlas are blitted into this one photo image
+    photo = tk.PhotoImage(width=320, height=320)
+    canvas_image = canvas.create_image(80, 0, anchor='nw', image=photo)
     canvas.pack()
     window.update()
 
-    fade_on()
+    scheduler = FrameScheduler(fps)
+    fade_on(strip, scheduler)
 
-    # Then initialize the AI
+    # Then initialize the AI, which prepares samples on a background thread
     ai = AI(root, model)
+    if atlas is not None:
+        atlas = ImageAtlas(atlas)
+    prefetcher = Prefetcher(lambda: prepare_next(ai, fps, atlas), prefetch)
 
-    # Initial start condition
-    playing = False
-
-    while True:
-        if not playing:
-            # When done with the animation, get next values
-            img, out, h0, h1 = get_next_values(ai)
-
-            # Check to see if the image is an image or a numpy array
-            if not isinstance(img, Image.Image):
-                # If it isn't, then turn it into one and rotate and resize it
-                img = Image.fromarray(img)
-                img = img.resize((320, 320), Image.NEAREST)
-                img = img.rotate(90)
+    try:
+        while True:
+            # When done with the animation, get the prefetched next values
+            img, frames = prefetcher.get()
+            if isinstance(img, bytes):
+                # PGM data from the atlas, decoded by Tk itself
+                photo.configure(data=img, format='PPM')
+            else:
                 img = ImageTk.PhotoImage(img)
                 canvas.itemconfig(canvas_image, image=img)
-                window.update()
-
-            # Make h0, h1, out into a linear array of values
-            activations = [0] * 45
-
-            # First assign values to h0 and h1
-            activations[:C_LEN[1]] = h0
-            activations[C_LEN[1]:C_LEN[1] + C_LEN[2]] = h1
-
-            # Then assign 1 to the correct final output values
-            activations[C_LEN[1] + C_LEN[2] + out] = 255
-            activations[(out + 1) * -1] = 255
-
-            start_time = time()
-            playing = True
-        else:
-            px_vals = activations.copy()
-            curr_time = time() - start_time
-            for i in range(4):
-                # Iterate by column
-                brightness = brightness_calc(curr_time,
-                                             HALF_PERIOD,
-                                             OFFSET[i],
-                                             PEAK_DURATIONS[i])
-                px_vals[sum(C_LEN[:i + 1]):sum(C_LEN[:i + 2])] = [
-                    floor(i * brightness)
-                    for i in px_vals[sum(C_LEN[:i + 1]):sum(C_LEN[:i + 2])]
-                ]
-                # px_vals is now a value between 0 and 255
-
-            for i in range(len(px_vals)):
-                PIXELS[i]=LINEAR_TUPLE[px_vals[i]]
-
-            PIXELS.show()
-            playing = animation_running(curr_time, HALF_PERIOD, OFFSET[3],
-                                        PEAK_DURATIONS[3])
-            sleep(0.0005)
+            window.update()
+
+            # Frames are precomputed at the scheduler's frame rate, so
+            # playback only indexes them. Dropped frames are skipped.
+            for frame, _ in scheduler.run():
+                if frame >= len(frames):
+                    break
+                strip.write(frames[frame])
+                strip.show()
+    finally:
+        print(prefetcher.report())
+        print(scheduler.report())
+        prefetcher.stop()
 
 
 if __name__ == '__main__':
     args = parse_args()
-    startup()
+    strip = make_strip(args.simulate, NUM_PIXELS, pin=PIXEL_PIN, order=ORDER)
+    startup(strip, args.fps)
     try:
-        main(args.ROOT, args.MODEL)
+        main(args.ROOT, args.MODEL, strip, fps=args.fps, atlas=args.atlas)
     except (KeyboardInterrupt, SystemExit):
-        PIXELS.fill((0, 0, 0))
-        PIXELS.show()
+        strip.fill((0, 0, 0))
+        strip.show()
         sys.exit()
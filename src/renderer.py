@@ -0,0 +1,310 @@
+"""Renderer.
+
+Headless batch renderer for the network visualization. Rasterizes the same
+layout as visualizer.NetworkVisualization (neuron circles, connection lines
+and the input image) with NumPy straight into RGB frame arrays, so no display
+or Tk is needed.
+
+The layout is rasterized once into flat pixel index arrays. A frame is drawn
+as palette indices with a handful of fancy-index assignments, one per item
+type, and turned into RGB with a single palette lookup. Frames show the end
+state of the visualizer animation and are written as a PNG sequence or an
+animated GIF, with the rendering spread over a process pool.
+
+Usage, from the src directory:
+    python renderer.py ../best-model.npy OUT --root MNIST --workers 4
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from math import floor, ceil
+from pathlib import Path
+from time import time
+
+import numpy as np
+from PIL import Image
+
+from colors import LINEAR_LUT, DIVERGING_LUT
+from inference import connection_activations
+
+
+# Tk's default canvas background, #d9d9d9
+BACKGROUND = (217, 217, 217)
+
+# Palette: the diverging colormap, the linear colormap, the background,
+# black and a gray ramp for the input image
+_LINEAR = 256
+_BACKGROUND = 512
+_BLACK = 513
+_GRAY = 514
+PALETTE = np.concatenate([DIVERGING_LUT, LINEAR_LUT,
+                          np.array([BACKGROUND, (0, 0, 0)], dtype=np.uint8),
+                          np.repeat(np.arange(256, dtype=np.uint8)[:, None],
+                                    3, axis=1)])
+
+
+class NetworkRenderer:
+    def __init__(self, num_l1, num_l2, fc1_weights, fc2_weights,
+                 scale: float = 1.):
+        """Rasterizes the layout of the network visualization.
+
+        Args:
+            num_l1: Number of neurons in the first layer.
+            num_l2: Number of neurons in the second layer.
+            fc1_weights: Weights of the second linear layer.
+            fc2_weights: Weights of the last linear layer.
+            scale: Scale of the frames relative to the visualizer's 1000 x
+                800 canvas.
+        """
+        self.scale = scale
+        self.width = int(1000 * scale)
+        self.height = int(800 * scale)
+        self.fc_weights = [fc1_weights, fc2_weights]
+
+        # Same layout as NetworkVisualization
+        x_sep = 60
+        diameter = 50
+        neurons_per_layer = [num_l1, num_l2, 10]
+        boxes = [self._neuron_boxes(n, row, x_sep, diameter)
+                 for row, n in enumerate(neurons_per_layer)]
+
+        # Flat pixel indices of every item and the item each belongs to
+        fills, fill_owners, outlines = [], [], []
+        for i, box in enumerate(b for layer in boxes for b in layer):
+            fill, outline = self._disk(*(c * scale for c in box))
+            fills.append(fill)
+            fill_owners.append(np.full(len(fill), i))
+            outlines.append(outline)
+        self.neuron_pixels = np.concatenate(fills)
+        self.neuron_owners = np.concatenate(fill_owners)
+        self.outline_pixels = np.concatenate(outlines)
+
+        lines, line_owners = [], []
+        for layer in range(2):
+            for prev in boxes[layer]:
+                start = (floor((prev[0] + prev[2]) / 2), prev[3])
+                for after in boxes[layer + 1]:
+                    end = (floor((after[0] + after[2]) / 2), after[1])
+                    pixels = self._line(*(c * scale for c in (*start, *end)),
+                                        1.5 * scale)
+                    lines.append(pixels)
+                    line_owners.append(np.full(len(pixels), len(lines) - 1))
+        self.line_pixels = np.concatenate(lines)
+        self.line_owners = np.concatenate(line_owners)
+
+        # The input image goes into the otherwise empty top left corner
+        self.image_scale = max(1, int(5 * scale))
+        self.image_offset = int(10 * scale)
+
+    def _neuron_boxes(self, n: int, row: int, x_sep: int,
+                      diameter: int) -> list:
+        """Bounding boxes of the neurons of a layer, as in create_neurons."""
+        if n % 2 == 0:
+            num_on_each_side = n / 2 - 1
+            offset = x_sep * num_on_each_side
+            offset += diameter + ((x_sep - diameter) / 2)
+        else:
+            num_on_each_side = floor(n / 2)
+            offset = x_sep * num_on_each_side
+            offset += diameter / 2
+
+        initial_x = int(1000 / 2 - offset)
+        initial_y = int((800 / 4) * (row + 1))
+        initial_y -= int(diameter / 2)
+        return [(initial_x + x_sep * i, initial_y,
+                 initial_x + x_sep * i + diameter, initial_y + diameter)
+                for i in range(n)]
+
+    def _clip(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Flat indices of the pixels that lie inside the frame."""
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) \
+            & (ys < self.height)
+        return np.unique(ys[inside] * self.width + xs[inside])
+
+    def _disk(self, x0, y0, x1, y1) -> (np.ndarray, np.ndarray):
+        """Pixels of the fill and the 1 pixel outline of an oval."""
+        cx, cy, r = (x0 + x1) / 2, (y0 + y1) / 2, (x1 - x0) / 2
+        ys, xs = np.mgrid[floor(y0):ceil(y1) + 1, floor(x0):ceil(x1) + 1]
+        dist = np.hypot(xs + 0.5 - cx, ys + 0.5 - cy)
+        inside = dist <= r
+        outline = inside & (dist > r - 1)
+        return (self._clip(xs[inside & ~outline], ys[inside & ~outline]),
+                self._clip(xs[outline], ys[outline]))
+
+    def _line(self, x0, y0, x1, y1, width) -> np.ndarray:
+        """Pixels of a straight line with the given width."""
+        length = max(np.hypot(x1 - x0, y1 - y0), 1.)
+        t = np.linspace(0., 1., int(ceil(length)) * 2 + 1)
+        # Unit normal, to give the line its width
+        nx, ny = -(y1 - y0) / length, (x1 - x0) / length
+        offsets = np.linspace(-width / 2, width / 2, max(2, ceil(width) + 1))
+        xs = x0 + t[None] * (x1 - x0) + offsets[:, None] * nx
+        ys = y0 + t[None] * (y1 - y0) + offsets[:, None] * ny
+        return self._clip(np.floor(xs).astype(int).ravel(),
+                          np.floor(ys).astype(int).ravel())
+
+    def render(self, image: np.ndarray, pred: int, h1: np.ndarray,
+               h2: np.ndarray, ca: np.ndarray = None) -> np.ndarray:
+        """Renders the final state of the animation of one sample.
+
+        Args:
+            image: The [28, 28] uint8 input image.
+            pred: The predicted class.
+            h1: Outputs of the first layer.
+            h2: Outputs of the second layer.
+            ca: Connection activations of both layers, flattened and
+                concatenated. Calculated from h1 and h2 if not given.
+
+        Returns:
+            A [height, width, 3] uint8 RGB frame.
+        """
+        # Palette indices of the frame
+        canvas = np.full(self.height * self.width, _BACKGROUND,
+                         dtype=np.int16)
+
+        if ca is None:
+            ca = np.concatenate([
+                connection_activations(h.reshape(1, -1), w).ravel()
+                for h, w in zip((h1, h2), self.fc_weights)])
+        # 254 is the last tick of an animation step
+        line_colors = (np.floor(ca * 254) + 128).astype(np.int16)
+        # Strong connections are drawn over the weak ones
+        strong = (np.abs(ca) > 0.2)[self.line_owners]
+        canvas[self.line_pixels[~strong]] = \
+            line_colors[self.line_owners[~strong]]
+        canvas[self.line_pixels[strong]] = \
+            line_colors[self.line_owners[strong]]
+
+        layers = []
+        for h in (h1, h2):
+            h = np.asarray(h, dtype=float).ravel()
+            layers.append(h / h.max() if h.max() > 0 else h)
+        values = np.concatenate([*layers, np.zeros(10)])
+        values[-10 + int(pred)] = 1.
+        neuron_colors = (np.floor(values * 254) + _LINEAR).astype(np.int16)
+        canvas[self.neuron_pixels] = neuron_colors[self.neuron_owners]
+        canvas[self.outline_pixels] = _BLACK
+
+        canvas = canvas.reshape(self.height, self.width)
+        s, o = self.image_scale, self.image_offset
+        big = np.repeat(np.repeat(image, s, 0), s, 1)
+        canvas[o:o + big.shape[0], o:o + big.shape[1]] = \
+            big.astype(np.int16) + _GRAY
+        return PALETTE.take(canvas, axis=0)
+
+
+_renderer = None
+
+
+def _init_worker(num_l1, num_l2, fc1_weights, fc2_weights, scale):
+    """Rasterizes the layout once per pool process."""
+    global _renderer
+    _renderer = NetworkRenderer(num_l1, num_l2, fc1_weights, fc2_weights,
+                                scale)
+
+
+def _render_chunk(start: int, images, preds, h1, h2, out_dir: str = None):
+    """Renders a chunk of samples.
+
+    Frames are written as PNGs if out_dir is given, otherwise returned.
+    """
+    ca = np.concatenate([
+        connection_activations(h1, _renderer.fc_weights[0]).reshape(
+            len(h1), -1),
+        connection_activations(h2, _renderer.fc_weights[1]).reshape(
+            len(h2), -1)], axis=1)
+    frames = []
+    for i in range(len(images)):
+        frame = _renderer.render(images[i], preds[i], h1[i], h2[i], ca[i])
+        if out_dir is not None:
+            Image.fromarray(frame).save(
+                os.path.join(out_dir, 'frame_{:05d}.png'.format(start + i)),
+                compress_level=1)
+        else:
+            frames.append(frame)
+    return start, frames
+
+
+def render_dataset(ai, out_path: str, start: int = 0, count: int = None,
+                   workers: int = None, chunk_size: int = 100,
+                   scale: float = 1., gif: bool = False,
+                   frame_duration: int = 500) -> int:
+    """Renders a range of the test set.
+
+    Args:
+        ai: The inference.AI to get results from.
+        out_path: Directory for the PNG sequence, or the GIF file.
+        start: Index of the first sample.
+        count: Number of samples. Defaults to the rest of the test set.
+        workers: Number of rendering processes. Defaults to the CPU count.
+        chunk_size: Number of samples per task.
+        scale: Scale of the frames.
+        gif: Whether to write an animated GIF instead of PNGs. All frames
+            are kept in memory, so use a small scale or count.
+        frame_duration: Duration of each GIF frame in ms.
+
+    Returns:
+        The number of frames rendered.
+    """
+    if count is None:
+        count = len(ai.data) - start
+    if not gif:
+        Path(out_path).mkdir(parents=True, exist_ok=True)
+
+    gif_frames = dict()
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(ai.layer_1_neurons,
+                                       ai.layer_2_neurons, ai.fc1_weight,
+                                       ai.fc2_weight, scale)) as pool:
+        futures = []
+        for chunk_start in range(start, start + count, chunk_size):
+            n = min(chunk_size, start + count - chunk_start)
+            # Inference is fast, so it stays in this process
+            images, preds, h1, h2 = ai.infer_batch(chunk_start, n)
+            futures.append(pool.submit(_render_chunk, chunk_start, images,
+                                       preds, h1, h2,
+                                       None if gif else out_path))
+        for future in futures:
+            chunk_start, frames = future.result()
+            for i, frame in enumerate(frames):
+                gif_frames[chunk_start + i] = Image.fromarray(frame)
+
+    if gif:
+        frames = [gif_frames[i] for i in sorted(gif_frames)]
+        frames[0].save(out_path, save_all=True, append_images=frames[1:],
+                       duration=frame_duration, loop=0)
+    return count
+
+
+def parse_args():
+    p = ArgumentParser(description='renders the network visualization '
+                                   'without a display')
+    p.add_argument('MODEL', type=str, help='model state_dict to be loaded')
+    p.add_argument('OUT', type=str,
+                   help='output directory, or file when writing a GIF')
+    p.add_argument('--root', type=str, default='MNIST',
+                   help='path to the MNIST data root')
+    p.add_argument('--start', type=int, default=0)
+    p.add_argument('--count', type=int, default=None,
+                   help='number of samples, defaults to the whole test set')
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--scale', type=float, default=1.)
+    p.add_argument('--gif', action='store_true',
+                   help='write an animated GIF instead of PNGs')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    from inference import AI
+
+    args = parse_args()
+    ai = AI(args.root, args.MODEL)
+    start_time = time()
+    n = render_dataset(ai, args.OUT, args.start, args.count, args.workers,
+                       scale=args.scale, gif=args.gif)
+    total = time() - start_time
+    print(f"Rendered {n} frames in {total:.1f}s "
+          f"({total / n * 1000:.1f}ms per frame)")
@@ -0,0 +1,62 @@
+"""Scaling Benchmark.
+
+Measures how data-parallel CPU training scales with the number of processes,
+in samples/sec and time to reach a target validation accuracy.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+from argparse import ArgumentParser
+from datetime import datetime
+from os.path import join
+
+from distributed_trainer import DistributedTrainer
+
+
+def parse_args():
+    p = ArgumentParser(description='benchmarks data-parallel training with '
+                                   'different numbers of processes')
+    p.add_argument('ROOT', type=str, help='path to the MNIST data root')
+    p.add_argument('OUT', type=str, help='directory for checkpoints and the '
+                                         'benchmark results')
+    p.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4, 8],
+                   help='process counts to benchmark')
+    p.add_argument('--epochs', type=int, default=20,
+                   help='maximum number of epochs per run')
+    p.add_argument('--batch_size', type=int, default=64,
+                   help='global batch size')
+    p.add_argument('--target', type=float, default=0.94,
+                   help='validation accuracy to measure the time to')
+    p.add_argument('--no_pin', action='store_true',
+                   help='do not pin processes to CPUs')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    out_dir = join(args.OUT, datetime.now().strftime('%Y-%m-%d-%H_%M_%S'))
+    results = []
+
+    for n in args.procs:
+        t = DistributedTrainer(args.ROOT, out_dir + f'_{n}procs')
+        stats = t.train(args.batch_size, 10, 15, (False, False, False), 'sgd',
+                        {'momentum': 0.9409782496856666,
+                         'lr': 0.0038795787201773},
+                        args.epochs, num_procs=n, pin_cpus=not args.no_pin,
+                        target_acc=args.target, stop_at_target=True)
+        results.append(stats)
+
+    base = results[0]['samples_per_sec']
+    print("\n| Procs |  Samples/s | Speedup | Time to {:.0%} |".format(
+        args.target))
+    print("|-------|------------|---------|--------------|")
+    for r in results:
+        ttt = r['time_to_target']
+        print("| {:>5} | {:>10.1f} | {:>6.2f}x | {:>12} |".format(
+            r['processes'], r['samples_per_sec'],
+            r['samples_per_sec'] / base,
+            f"{ttt:.1f}s" if ttt is not None else "not reached"))
+
+    with open(out_dir + '_scaling.json', 'w') as fp:
+        json.dump(results, fp, indent=2)
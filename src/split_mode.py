@@ -0,0 +1,454 @@
+"""Split Mode.
+
+Splits the physical visualization in two. The host runs inference and the
+animation math and streams the results to a thin client on the Pi, which
+only pushes the received bytes to the LED strip and the screen.
+
+Everything is sent over UDP, one packet per LED frame and one per sample for
+the display image. Each packet has a header with a sequence number and the
+time it was sent. UDP was chosen over TCP since a late LED frame is useless:
+a lost packet is simply skipped instead of stalling the frames behind it.
+The client holds packets in a jitter buffer and plays them out a fixed delay
+after they were sent, which evens out network jitter.
+
+The client reports packet loss, from gaps in the sequence numbers, and the
+latency from the host sending a frame to it being shown. Latencies are
+measured with the wall clock of both machines, so they are only meaningful
+if the clocks are synchronized, e.g. with NTP, or on localhost.
+
+Usage, from the src directory:
+    On the host:            python split_mode.py host --client PI_ADDRESS
+                                --root MNIST --model model.npy
+    On the Pi:              python split_mode.py client
+    Localhost stand-in:     python split_mode.py local --duration 10
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import heapq
+import multiprocessing as mp
+import socket
+import struct
+from argparse import ArgumentParser
+from collections import deque
+from math import isqrt
+from threading import Event, Lock, Thread
+from time import time
+
+import numpy as np
+
+from led_strip import make_strip
+from image_atlas import nearest_index, DISPLAY_SIZE
+from led_animation import (build_animation, sample_activations,
+                           ANIMATION_FPS, NUM_PIXELS, PIXEL_PIN, ORDER)
+from utils.frame_scheduler import FrameScheduler
+from utils.prefetch import Prefetcher
+
+PORT = 5005
+MAGIC = b'MNPX'
+# Magic, packet type, sequence number, sample, frame, send time
+HEADER = struct.Struct('!4sBIIHd')
+SAMPLE, FRAME = 0, 1
+MAX_PACKET = 2048
+
+
+class FrameSender:
+    def __init__(self, address: tuple, drop_rate: float = 0.,
+                 seed: int = None, clock=time):
+        """Sends packets to the client.
+
+        Args:
+            address: (host, port) of the client.
+            drop_rate: Fraction of packets to drop on purpose, to emulate a
+                lossy network.
+            seed: Seed of the packet drops.
+            clock: Function returning the wall clock time in seconds.
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.address = address
+        self.drop_rate = drop_rate
+        self.clock = clock
+        self._rng = np.random.default_rng(seed)
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+
+    def send(self, kind: int, sample: int, frame: int, payload: bytes):
+        """Sends a packet with the next sequence number."""
+        seq = self.seq
+        self.seq = (self.seq + 1) % 2 ** 32
+        if self.drop_rate and self._rng.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        packet = HEADER.pack(MAGIC, kind, seq, sample % 2 ** 32, frame,
+                             self.clock()) + payload
+        self.sock.sendto(packet, self.address)
+        self.sent += 1
+        self.bytes_sent += len(packet)
+
+    def close(self):
+        self.sock.close()
+
+    def report(self) -> str:
+        return "Host: {} packets ({:.1f} kB) sent, {} dropped on purpose." \
+            .format(self.sent, self.bytes_sent / 1000, self.dropped)
+
+
+def stream(sender: FrameSender, samples, fps: int = ANIMATION_FPS,
+           duration: float = None) -> FrameScheduler:
+    """Streams the samples to the client, paced at the frame rate.
+
+    Args:
+        sender: The sender to send the packets with.
+        samples: Iterable of (image, frames), with the rotated 28 x 28 uint8
+            display image and the [frames, NUM_PIXELS, 3] uint8 animation.
+        fps: Frame rate of the animations.
+        duration: Seconds after which to stop. None streams all samples.
+
+    Returns:
+        The scheduler the frames were paced with.
+    """
+    scheduler = FrameScheduler(fps)
+    start = time()
+    for sample, (image, frames) in enumerate(samples):
+        sender.send(SAMPLE, sample, 0, np.ascontiguousarray(image).tobytes())
+        for frame, _ in scheduler.run():
+            if duration is not None and time() - start > duration:
+                return scheduler
+            if frame >= len(frames):
+                break
+            sender.send(FRAME, sample, frame, frames[frame].tobytes())
+    return scheduler
+
+
+def ai_samples(root: str, model: str, fps: int = ANIMATION_FPS,
+               prefetch: int = 4):
+    """Yields the display image and animation of every test sample."""
+    # Imported here, so the client doesn't load the AI, torch or Tk
+    from inference import AI
+    from physical import get_next_values
+
+    ai = AI(root, model)
+
+    def produce():
+        img, out, h0, h1 = get_next_values(ai)
+        # Same orientation as the image atlas
+        return (np.rot90(np.asarray(img, dtype=np.uint8)),
+                build_animation(sample_activations(out, h0, h1), fps))
+
+    prefetcher = Prefetcher(produce, prefetch)
+    try:
+        while True:
+            yield prefetcher.get()
+    finally:
+        prefetcher.stop()
+
+
+def synthetic_samples(fps: int = ANIMATION_FPS, seed: int = 0):
+    """Yields random samples, so the stream can run without a model."""
+    from led_benchmark import random_activations
+
+    rng = np.random.default_rng(seed)
+    while True:
+        yield (rng.integers(0, 256, (28, 28), dtype=np.uint8),
+               build_animation(random_activations(rng), fps))
+
+
+def host(client: str, port: int = PORT, root: str = None, model: str = None,
+         fps: int = ANIMATION_FPS, duration: float = None,
+         drop_rate: float = 0.):
+    """Runs the host, streaming synthetic samples if no model is given."""
+    if model is None:
+        samples = synthetic_samples(fps)
+    else:
+        samples = ai_samples(root, model, fps)
+    sender = FrameSender((client, port), drop_rate)
+    try:
+        scheduler = stream(sender, samples, fps, duration)
+        print(scheduler.report())
+    finally:
+        print(sender.report())
+        sender.close()
+
+
+class SplitClient:
+    def __init__(self, strip, port: int = PORT, fps: int = ANIMATION_FPS,
+                 delay: float = 0.05, display=None, clock=time):
+        """Receives packets from the host and plays them out.
+
+        Args:
+            strip: The LED strip, from led_strip.make_strip().
+            port: UDP port to listen on.
+            fps: Frame rate of the playout.
+            delay: Seconds between a packet being sent and played out. Should
+                cover the network jitter.
+            display: Function showing the rotated 28 x 28 display image
+                bytes sent by the host, or None to not show the images.
+            clock: Function returning the wall clock time in seconds.
+        """
+        self.strip = strip
+        self.fps = fps
+        self.delay = delay
+        self.display = display
+        self.clock = clock
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('', port))
+        self.sock.settimeout(0.2)
+
+        # Heap of packets, ordered by their send time
+        self._buffer = []
+        self._lock = Lock()
+        self._stop = Event()
+        # Smallest difference between the receive and send time seen, which
+        # maps the host clock to the client clock
+        self._offset = None
+        self._last_seq = -1
+
+        # Statistics
+        self.received = 0
+        self.invalid = 0
+        self.reordered = 0
+        self.late = 0
+        self.superseded = 0
+        self.shown = 0
+        self.max_depth = 0
+        self._first_seq = None
+        self._max_seq = None
+        self.network_latency = deque(maxlen=100000)
+        self.latency = deque(maxlen=100000)
+
+        self._thread = Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def _receive(self):
+        while not self._stop.is_set():
+            try:
+                data = self.sock.recv(MAX_PACKET)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = self.clock()
+            if len(data) < HEADER.size \
+                    or data[:len(MAGIC)] != MAGIC:
+                self.invalid += 1
+                continue
+            _, kind, seq, sample, frame, sent = HEADER.unpack_from(data)
+            self.received += 1
+            if self._first_seq is None:
+                self._first_seq = self._max_seq = seq
+            elif seq > self._max_seq:
+                self._max_seq = seq
+            else:
+                self.reordered += 1
+            self.network_latency.append(now - sent)
+            with self._lock:
+                if self._offset is None or now - sent < self._offset:
+                    self._offset = now - sent
+                heapq.heappush(self._buffer, (sent, seq, kind, sample, frame,
+                                              data[HEADER.size:]))
+                self.max_depth = max(self.max_depth, len(self._buffer))
+
+    def _pop_due(self, now: float) -> list:
+        """Takes the packets whose playout time has come from the buffer."""
+        due = []
+        with self._lock:
+            while self._buffer and self._buffer[0][0] + self._offset \
+                    + self.delay <= now:
+                due.append(heapq.heappop(self._buffer))
+        return due
+
+    def run(self, duration: float = None) -> FrameScheduler:
+        """Plays out the received packets.
+
+        Args:
+            duration: Seconds after which to stop. None runs until
+                interrupted.
+
+        Returns:
+            The scheduler of the playout.
+        """
+        scheduler = FrameScheduler(self.fps)
+        for _ in scheduler.run(duration):
+            image = frame = None
+            for sent, seq, kind, _, _, payload in self._pop_due(self.clock()):
+                if seq < self._last_seq:
+                    # Arrived after a newer packet was already played out
+                    self.late += 1
+                    continue
+                self._last_seq = seq
+                if kind == SAMPLE:
+                    image = payload
+                else:
+                    if frame is not None:
+                        self.superseded += 1
+                    frame, frame_sent = payload, sent
+
+            if image is not None and self.display is not None:
+                self.display(image)
+            if frame is not None:
+                self.strip.write(np.frombuffer(frame, dtype=np.uint8)
+                                 .reshape(-1, 3))
+                self.strip.show()
+                self.shown += 1
+                self.latency.append(self.clock() - frame_sent)
+        return scheduler
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+    def stats(self) -> dict:
+        """Packet loss and latencies of the stream.
+
+        Lost packets are the sequence numbers never received. Latencies are
+        in seconds, from the host sending a packet to it being received
+        (network) and to the frame being shown (end to end).
+        """
+        expected = 0
+        if self._first_seq is not None:
+            expected = self._max_seq - self._first_seq + 1
+        lost = max(expected - self.received, 0)
+
+        def percentiles(values):
+            if not values:
+                return {'p50': 0., 'p95': 0., 'max': 0.}
+            p50, p95 = np.percentile(values, [50, 95])
+            return {'p50': p50, 'p95': p95, 'max': max(values)}
+
+        return {'received': self.received,
+                'lost': lost,
+                'loss': lost / expected if expected else 0.,
+                'invalid': self.invalid,
+                'reordered': self.reordered,
+                'late': self.late,
+                'superseded': self.superseded,
+                'shown': self.shown,
+                'max_buffer_depth': self.max_depth,
+                'network_latency': percentiles(self.network_latency),
+                'latency': percentiles(self.latency)}
+
+    def report(self) -> str:
+        s = self.stats()
+        return ("Client: {} packets received, {} lost ({:.2%}), {} late, {} "
+                "reordered. {} frames shown, {} superseded, buffer depth up "
+                "to {}.\nLatency: network p50 {:.2f}ms, p95 {:.2f}ms; end to "
+                "end p50 {:.2f}ms, p95 {:.2f}ms, max {:.2f}ms.".format(
+                    s['received'], s['lost'], s['loss'], s['late'],
+                    s['reordered'], s['shown'], s['superseded'],
+                    s['max_buffer_depth'],
+                    s['network_latency']['p50'] * 1000,
+                    s['network_latency']['p95'] * 1000,
+                    s['latency']['p50'] * 1000, s['latency']['p95'] * 1000,
+                    s['latency']['max'] * 1000))
+
+
+def tk_display():
+    """Opens the fullscreen window and returns a function showing images.
+
+    The images are the rotated 28 x 28 display images sent by the host, and
+    are upscaled to the display size before being handed to Tk as PGM data.
+    """
+    import tkinter as tk
+
+    window = tk.Tk()
+    window.attributes('-fullscreen', True)
+    window.configure(background='black')
+    window.config(cursor="none")
+    canvas = tk.Canvas(window, width=480, height=320, highlightthickness=0,
+                       background='black')
+    photo = tk.PhotoImage(width=DISPLAY_SIZE, height=DISPLAY_SIZE)
+    canvas.create_image(80, 0, anchor='nw', image=photo)
+    canvas.pack()
+    window.update()
+    header = 'P5 {} {} 255\n'.format(DISPLAY_SIZE, DISPLAY_SIZE).encode()
+
+    def show(payload: bytes):
+        side = isqrt(len(payload))
+        idx = nearest_index(side, DISPLAY_SIZE)
+        img = np.frombuffer(payload, dtype=np.uint8).reshape(side, side)
+        photo.configure(data=header + img[idx[:, None], idx].tobytes(),
+                        format='PPM')
+        window.update()
+
+    return show
+
+
+def client(port: int = PORT, fps: int = ANIMATION_FPS, delay: float = 0.05,
+           duration: float = None, simulate: bool = False,
+           display: bool = True, on_ready=None):
+    """Runs the client until interrupted or the duration has passed.
+
+    on_ready is called without arguments once the socket is bound, so a host
+    started from it can't send frames before the client receives them.
+    """
+    strip = make_strip(simulate, NUM_PIXELS, pin=PIXEL_PIN, order=ORDER)
+    receiver = SplitClient(strip, port, fps, delay,
+                           tk_display() if display else None)
+    try:
+        if on_ready is not None:
+            on_ready()
+        scheduler = receiver.run(duration)
+        print(scheduler.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+        print(receiver.report())
+        strip.fill((0, 0, 0))
+        strip.show()
+
+
+def parse_args():
+    p = ArgumentParser(description='streams the physical visualization from '
+                                   'a host to a thin client on the Pi')
+    p.add_argument('MODE', choices=['host', 'client', 'local'],
+                   help='run the host, the client, or both on localhost')
+    p.add_argument('--client', type=str, default='127.0.0.1',
+                   help='address of the client, for the host')
+    p.add_argument('--port', type=int, default=PORT)
+    p.add_argument('--root', type=str, default=None,
+                   help='path to the MNIST dataset, for the host')
+    p.add_argument('--model', type=str, default=None,
+                   help='path to the NN model, for the host. Streams random '
+                        'samples if not given')
+    p.add_argument('--fps', type=int, default=ANIMATION_FPS,
+                   help='frame rate of the LED animations')
+    p.add_argument('--delay', type=float, default=0.05,
+                   help='jitter buffer delay of the client in seconds')
+    p.add_argument('--duration', type=float, default=None,
+                   help='seconds to run for')
+    p.add_argument('--drop_rate', type=float, default=0.,
+                   help='fraction of packets the host drops on purpose')
+    p.add_argument('--simulate', action='store_true',
+                   help='use a simulated LED strip instead of the NeoPixels')
+    p.add_argument('--no_display', action='store_true',
+                   help='do not show the display images')
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.MODE == 'host':
+        host(args.client, args.port, args.root, args.model, args.fps,
+             args.duration, args.drop_rate)
+    elif args.MODE == 'client':
+        client(args.port, args.fps, args.delay, args.duration, args.simulate,
+               not args.no_display)
+    else:
+        # The host runs in its own process, like it would on its own machine
+        host_process = mp.get_context('spawn').Process(
+            target=host, args=('127.0.0.1', args.port, args.root, args.model,
+                               args.fps, args.duration, args.drop_rate))
+        receiver_duration = None if args.duration is None \
+            else args.duration + 1
+        try:
+            client(args.port, args.fps, args.delay, receiver_duration,
+                   simulate=True, display=not args.no_display,
+                   on_ready=host_process.start)
+        finally:
+            if host_process.pid is not None:
+                host_process.join()
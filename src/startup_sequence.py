@@ -9,47 +9,50 @@ Author:
 Created on:
     May 12, 2021
 """
-import board
-import neopixel
-from math import sin, pi, floor
-from time import sleep, time
+import numpy as np
+from time import sleep
+
+from led_strip import make_strip
+from utils.frame_scheduler import FrameScheduler
 
 SLEEP_DURATION = 1
-PIXEL_PIN = board.D12
+PIXEL_PIN = 'D12'
 NUM_PIXELS = 45
 BRIGHTNESS = 0.2
-ORDER = neopixel.RGB
+ORDER = 'RGB'
 
 LED_COLUMNS = (0, 10, 25, 35, 45)
 
-PIXELS = neopixel.NeoPixel(PIXEL_PIN, NUM_PIXELS, brightness=BRIGHTNESS,
-                           auto_write=False, pixel_order=ORDER)
 
+def startup(strip=None, fps=60):
+    """Runs the startup wave.
 
-def startup():
+    Args:
+        strip: The LED strip, from led_strip.make_strip(). Its driver runs at
+            full brightness, so BRIGHTNESS is applied here.
+        fps: Frame rate of the animation.
+    """
+    if strip is None:
+        strip = make_strip(num_pixels=NUM_PIXELS, pin=PIXEL_PIN, order=ORDER)
     sleep(3)
-    start_time = time()
-    time_delta = 0.
+    scheduler = FrameScheduler(fps)
+    column_sizes = np.diff(LED_COLUMNS)
     # 1.477 is where sin(pi * x - 1.5) intercepts the y-axis
-    while time_delta < 1.477:
-        time_delta = time() - start_time
-        for column in range(4):
-            # Calculate brightness of a column for the given frame
-            frame_brightness = floor(255. * sin((pi * time_delta)
-                                                - (float(column) * 0.5)))
-            # Make sure it's positive
-            frame_brightness = max(frame_brightness, 0)
-            for pixel_num in range(LED_COLUMNS[column],
-                                   LED_COLUMNS[column + 1]):
-                # set all pixels of the column one by one
-                PIXELS[pixel_num] = (frame_brightness, frame_brightness,
-                                     frame_brightness)
-        PIXELS.show()
-        sleep(0.0005)
+    for _, time_delta in scheduler.run(1.477):
+        # Calculate brightness of every column for the given frame, and make
+        # sure it's positive
+        column_brightness = np.sin(np.pi * time_delta
+                                   - np.arange(4) * 0.5).clip(min=0)
+        pixel_brightness = np.floor(255. * BRIGHTNESS * np.repeat(
+            column_brightness, column_sizes))
+        # Set all pixels at once, in all three channels
+        strip.write(np.repeat(pixel_brightness.astype(np.uint8)[:, None], 3,
+                              axis=1))
+        strip.show()
+    print(scheduler.report())
 
     # Turn off all LEDs just in case
-    for i in range(LED_COLUMNS[-1]):
-        PIXELS[i] = (0, 0, 0)
+    strip.fill((0, 0, 0))
 
 
 if __name__ == '__main__':
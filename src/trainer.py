@@ -18,6 +18,8 @@ from os.path import join, exists, isdir
 from os import mkdir
 
 from model import FCNetwork
+from utils.early_stopping import EarlyStopping
+from utils.metric_sink import MetricSink
 
 
 class Trainer:
@@ -39,8 +41,10 @@ class Trainer:
 
     def train(self, batch_size: int, first_layer: int, second_layer: int,
               leaky: tuple, optimizer: str, optimizer_args: dict,
-              epochs: int):
+              epochs: int, early_stopping: EarlyStopping = None,
+              sink: MetricSink = None):
         """Performs training on the network.
+
         Args:
             batch_size: Batch size for training and validation.
             first_layer: Number of nodes in the first layer.
@@ -49,6 +53,11 @@ class Trainer:
             optimizer: The optimizer to use. Either "sgd" or "adam".
             optimizer_args: Arguments for the optimizer
             epochs: Number of epochs to run for.
+            early_stopping: Convergence monitor. If given, training stops once
+                it reports a plateau or its budget is used up. If None,
+                training runs for the full number of epochs.
+            sink: Optional metric sink the step loss and the validation
+                accuracy are logged to. It is flushed but not closed.
         """
         print("Initializing training...")
         print(f"Results saved in {self.result_dir}")
@@ -67,7 +76,8 @@ class Trainer:
 
         loss_crit = CrossEntropyLoss()
 
-        prev_epoch_val_acc = 0
+        if early_stopping is not None:
+            early_stopping.start()
 
         for epoch in range(epochs):
             header = "| Iteration |       Loss |        Acc |"
@@ -85,6 +95,9 @@ class Trainer:
                     cls = cls.cuda()
                 h1, h2, out = network(img)
                 loss = loss_crit(out, cls)
+                if sink is not None:
+                    sink.log_step({'loss': loss.detach()},
+                                  epoch * len(train_loader) + i + 1)
 
                 # Do backprop
                 if i % 100 == 0:
@@ -111,14 +124,31 @@ class Trainer:
                     h1, h2, out = network(img)
 
                     validation_acc += self.calc_batch_accuracy(out, cls)
-                validation_acc /= i
+                validation_acc /= len(test_loader)
                 print(f"Epoch {epoch + 1} validation accuracy: "
                       f"{validation_acc}")
+                if sink is not None:
+                    sink.log({'accuracy': validation_acc},
+                             (epoch + 1) * len(train_loader))
 
-            if prev_epoch_val_acc - validation_acc > 0.04:
-                print("Overfitted to the training set.")
+            if early_stopping is not None \
+                    and early_stopping.step(validation_acc,
+                                            network.state_dict()):
                 break
 
+        if early_stopping is not None:
+            if early_stopping.best_state is not None:
+                # Restore and save the best weights seen during training
+                network.load_state_dict(early_stopping.best_state)
+                torch.save(network.state_dict(),
+                           join(self.result_dir, 'best.pth'))
+            print(early_stopping.report(epochs))
+
+        if sink is not None:
+            sink.flush()
+
+        return network
+
     @staticmethod
     def calc_batch_accuracy(output: torch.Tensor,
                             target: torch.tensor) -> float:
@@ -141,4 +171,5 @@ if __name__ == '__main__':
                      current_time_str))
     t.train(50, 10, 15, (False, False, False), 'sgd',
             {'momentum': 0.9409782496856666,
-             'lr': 0.0038795787201773}, 250)
+             'lr': 0.0038795787201773}, 250,
+            EarlyStopping(patience=3, min_delta=0.001, restore_best=True))
@@ -0,0 +1,114 @@
+"""Early Stopping.
+
+Convergence monitor used to stop training once the validation accuracy has
+plateaued, or once an epoch or wall-clock budget has been used up.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from copy import deepcopy
+from time import time
+
+
+class EarlyStopping:
+    def __init__(self, patience: int = 3, min_delta: float = 0.001,
+                 restore_best: bool = True, max_epochs: int = None,
+                 max_time: float = None):
+        """Monitors the validation accuracy and decides when to stop.
+
+        Args:
+            patience: Number of epochs without an improvement of at least
+                min_delta before training is stopped. None disables plateau
+                detection.
+            min_delta: Minimum increase in validation accuracy to count as an
+                improvement.
+            restore_best: Whether the best weights seen should be kept so they
+                can be restored once training stops.
+            max_epochs: Epoch budget. None means no epoch budget.
+            max_time: Wall-clock budget in seconds. None means no time budget.
+        """
+        self.patience = patience
+        self.min_delta = min_delta
+        self.restore_best = restore_best
+        self.max_epochs = max_epochs
+        self.max_time = max_time
+
+        self.best_acc = float('-inf')
+        self.best_epoch = 0
+        self.best_state = None
+        self.epochs_run = 0
+        self.bad_epochs = 0
+        self.reason = None
+        self.start_time = None
+        self.epoch_times = []
+
+    def start(self):
+        """Marks the start of training."""
+        self.start_time = time()
+
+    def step(self, validation_acc: float, state_dict: dict = None) -> bool:
+        """Registers the result of an epoch.
+
+        Args:
+            validation_acc: Validation accuracy of the epoch that just ended.
+            state_dict: Network state dict. Only copied if restore_best is set
+                and the epoch is the best one so far.
+
+        Returns:
+            True if training should stop.
+        """
+        if self.start_time is None:
+            self.start()
+        now = time()
+        self.epoch_times.append(now - self.start_time
+                                - sum(self.epoch_times))
+        self.epochs_run += 1
+
+        if validation_acc > self.best_acc + self.min_delta:
+            self.best_acc = validation_acc
+            self.best_epoch = self.epochs_run
+            self.bad_epochs = 0
+            if self.restore_best and state_dict is not None:
+                self.best_state = deepcopy(state_dict)
+        else:
+            self.bad_epochs += 1
+
+        if self.patience is not None and self.bad_epochs >= self.patience:
+            self.reason = f"no improvement for {self.bad_epochs} epochs"
+        elif self.max_epochs is not None \
+                and self.epochs_run >= self.max_epochs:
+            self.reason = "epoch budget reached"
+        elif self.max_time is not None \
+                and now - self.start_time >= self.max_time:
+            self.reason = "time budget reached"
+
+        return self.reason is not None
+
+    @property
+    def elapsed(self) -> float:
+        """Wall-clock time since training started in seconds."""
+        return sum(self.epoch_times)
+
+    def savings(self, planned_epochs: int) -> (int, float):
+        """Epochs and estimated wall-clock time saved versus the full run.
+
+        The time saved is estimated from the mean epoch time.
+
+        Args:
+            planned_epochs: Number of epochs training was originally set to.
+        """
+        epochs_saved = max(0, planned_epochs - self.epochs_run)
+        if self.epochs_run == 0:
+            return epochs_saved, 0.
+        mean_epoch_time = self.elapsed / self.epochs_run
+        return epochs_saved, epochs_saved * mean_epoch_time
+
+    def report(self, planned_epochs: int) -> str:
+        """Human readable summary of the run."""
+        epochs_saved, time_saved = self.savings(planned_epochs)
+        reason = self.reason if self.reason is not None else "completed"
+        return (f"Stopped after {self.epochs_run}/{planned_epochs} epochs "
+                f"({reason}) in {self.elapsed:.1f}s.\n"
+                f"Best validation accuracy: {self.best_acc:.4f} at epoch "
+                f"{self.best_epoch}.\n"
+                f"Saved {epochs_saved} epochs, approx. {time_saved:.1f}s.")
@@ -0,0 +1,102 @@
+"""Frame Scheduler.
+
+Runs animations at a fixed frame rate. Instead of recomputing state as fast
+as possible, the scheduler sleeps until the deadline of the next frame, which
+leaves the CPU to inference and Tk in between. When it falls behind, the
+missed frames are skipped and counted as dropped instead of being rendered
+late.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+from math import sqrt
+from time import perf_counter, sleep
+
+
+class FrameScheduler:
+    def __init__(self, fps: float = 60., clock=perf_counter, sleep_fn=sleep):
+        """Creates a scheduler.
+
+        Args:
+            fps: Target frame rate.
+            clock: Function returning the current time in seconds.
+            sleep_fn: Function sleeping for the given number of seconds.
+        """
+        self.fps = fps
+        self.interval = 1. / fps
+        self.clock = clock
+        self.sleep = sleep_fn
+
+        # Statistics over all runs
+        self.frames = 0
+        self.dropped_frames = 0
+        self.run_time = 0.
+        # Running sums, so long running animations don't grow a list
+        self._lateness_sum = 0.
+        self._lateness_sq_sum = 0.
+        self._max_lateness = 0.
+
+    def run(self, duration: float = None):
+        """Yields frames at the target frame rate.
+
+        Args:
+            duration: Seconds after which the run ends. None runs until the
+                caller stops iterating.
+
+        Yields:
+            (frame, elapsed) with the index of the frame on the frame grid and
+            the seconds since the start of the run. Frame indices skip the
+            frames that were dropped.
+        """
+        start = self.clock()
+        frame = 0
+        try:
+            while True:
+                deadline = start + frame * self.interval
+                now = self.clock()
+                if now < deadline:
+                    self.sleep(deadline - now)
+                    now = self.clock()
+
+                # Skip the frames whose deadlines have already passed
+                behind = int((now - deadline) / self.interval)
+                if behind > 0:
+                    self.dropped_frames += behind
+                    frame += behind
+                    deadline += behind * self.interval
+
+                elapsed = now - start
+                if duration is not None and elapsed > duration:
+                    break
+                lateness = now - deadline
+                self._lateness_sum += lateness
+                self._lateness_sq_sum += lateness ** 2
+                self._max_lateness = max(self._max_lateness, lateness)
+                self.frames += 1
+                yield frame, elapsed
+                frame += 1
+        finally:
+            self.run_time += self.clock() - start
+
+    def stats(self) -> dict:
+        """Achieved frame rate, jitter and dropped frames.
+
+        Jitter is the standard deviation of how late frames started.
+        """
+        jitter = 0.
+        if self.frames:
+            mean = self._lateness_sum / self.frames
+            jitter = sqrt(max(self._lateness_sq_sum / self.frames
+                              - mean ** 2, 0.))
+        return {'frames': self.frames,
+                'dropped_frames': self.dropped_frames,
+                'fps': self.frames / self.run_time if self.run_time else 0.,
+                'jitter': jitter,
+                'max_lateness': self._max_lateness}
+
+    def report(self) -> str:
+        s = self.stats()
+        return ("{} frames at {:.1f} FPS (target {:.1f}), {} dropped. Jitter: "
+                "{:.2f}ms, max lateness: {:.2f}ms.".format(
+                    s['frames'], s['fps'], self.fps, s['dropped_frames'],
+                    s['jitter'] * 1000, s['max_lateness'] * 1000))
@@ -0,0 +1,163 @@
+"""Metric Sink.
+
+Buffered, asynchronous metric logging. Per-step metrics are accumulated as
+tensors on the device they were computed on, so logging a step does not force
+a device sync. Every flush_interval steps the aggregated (mean) values are
+handed to a background thread, which converts them to floats and writes them
+to the backend.
+
+Backends:
+    WandbBackend: Logs to a wandb run, or anything else with a log() method
+        such as hpoptim.local_wandb.LocalRun.
+    JsonLinesBackend: Appends one JSON line per flush to a file.
+    NullBackend: Drops everything. Useful for benchmarking.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import json
+import queue
+import threading
+from time import perf_counter
+
+
+class NullBackend:
+    def write(self, metrics: dict, step: int):
+        pass
+
+    def close(self):
+        pass
+
+
+class WandbBackend:
+    def __init__(self, run):
+        """Backend for a wandb run or a local stand-in."""
+        self.run = run
+
+    def write(self, metrics: dict, step: int):
+        self.run.log(metrics, step=step)
+
+    def close(self):
+        pass
+
+
+class JsonLinesBackend:
+    def __init__(self, path: str):
+        """Backend that appends JSON lines to the file at path."""
+        self._fp = open(path, 'a')
+
+    def write(self, metrics: dict, step: int):
+        self._fp.write(json.dumps({**metrics, '_step': step}) + '\n')
+
+    def close(self):
+        self._fp.close()
+
+
+def _to_float(value) -> float:
+    """Converts a tensor, numpy value or number to a float."""
+    if hasattr(value, 'item'):
+        return value.item()
+    return float(value)
+
+
+class MetricSink:
+    def __init__(self, backend=None, flush_interval: int = 100):
+        """Creates the sink and starts its background writer.
+
+        Args:
+            backend: Backend to write to. Defaults to NullBackend.
+            flush_interval: Number of steps over which step metrics are
+                averaged before being written.
+        """
+        self.backend = backend if backend is not None else NullBackend()
+        self.flush_interval = flush_interval
+
+        self._sums = dict()
+        self._count = 0
+        self._last_step = 0
+
+        # Overhead statistics
+        self.steps = 0
+        self.step_flushes = 0
+        self.writes = 0
+        self.main_thread_time = 0.
+        self.writer_time = 0.
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def _writer(self):
+        """Background thread writing queued metrics to the backend."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            start_time = perf_counter()
+            metrics, step, count = item
+            metrics = {k: _to_float(v) / count for k, v in metrics.items()}
+            self.backend.write(metrics, step)
+            self.writes += 1
+            self.writer_time += perf_counter() - start_time
+            self._queue.task_done()
+
+    def log_step(self, metrics: dict, step: int):
+        """Accumulates per-step metrics without syncing.
+
+        Args:
+            metrics: Metric values. Tensors should be detached.
+            step: Global step number.
+        """
+        start_time = perf_counter()
+        for k, v in metrics.items():
+            if k in self._sums:
+                self._sums[k] = self._sums[k] + v
+            else:
+                self._sums[k] = v
+        self._count += 1
+        self._last_step = step
+        self.steps += 1
+        if self._count >= self.flush_interval:
+            self.flush()
+        self.main_thread_time += perf_counter() - start_time
+
+    def log(self, metrics: dict, step: int):
+        """Logs metrics as-is, e.g. once per epoch.
+
+        Pending step metrics are flushed first so the steps stay in order.
+        """
+        start_time = perf_counter()
+        self.flush()
+        self._queue.put((dict(metrics), step, 1))
+        self.main_thread_time += perf_counter() - start_time
+
+    def flush(self):
+        """Hands the accumulated step metrics to the background writer."""
+        if self._count == 0:
+            return
+        self._queue.put((self._sums, self._last_step, self._count))
+        self.step_flushes += 1
+        self._sums = dict()
+        self._count = 0
+
+    def close(self):
+        """Flushes everything, then stops the writer and the backend."""
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self.backend.close()
+
+    def report(self) -> str:
+        """Summary of the logging overhead removed.
+
+        Each step logged directly would cost one sync (item()) and one backend
+        call on the training thread.
+        """
+        avoided = self.steps - self.step_flushes
+        return ("Logged {} steps with {} backend writes ({} syncs and "
+                "writes avoided on the training thread).\n"
+                "Training thread time in sink: {:.3f}s, background writer "
+                "time: {:.3f}s".format(self.steps, self.writes, avoided,
+                                       self.main_thread_time,
+                                       self.writer_time))
@@ -0,0 +1,111 @@
+"""Prefetch.
+
+Producer/consumer pipeline that computes the next samples to show on a
+background thread. Inference, image resizing and activation post-processing
+happen ahead of time, so the thread driving Tk or the LEDs only pops a ready
+sample from a bounded queue and renders it.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import queue
+import threading
+from time import perf_counter
+
+
+class Prefetcher:
+    def __init__(self, produce, depth: int = 4):
+        """Starts the background producer.
+
+        Args:
+            produce: Function without arguments that returns the next sample.
+                It runs on the producer thread, so it must not touch Tk.
+            depth: Number of samples computed ahead of time.
+        """
+        self.produce = produce
+        self.depth = depth
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+
+        # Metrics
+        self.produced = 0
+        self.consumed = 0
+        self.producer_time = 0.
+        self.max_producer_time = 0.
+        self.wait_time = 0.
+        self.empty_gets = 0  # times the consumer had to wait for a sample
+        self.depth_sum = 0
+
+        self._thread = threading.Thread(target=self._producer, daemon=True)
+        self._thread.start()
+
+    def _producer(self):
+        while not self._stop.is_set():
+            start_time = perf_counter()
+            try:
+                item = (self.produce(), None)
+            except Exception as e:
+                # Raised again on the consumer thread
+                item = (None, e)
+            produce_time = perf_counter() - start_time
+            self.producer_time += produce_time
+            self.max_producer_time = max(self.max_producer_time, produce_time)
+            self.produced += 1
+
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if item[1] is not None:
+                break
+
+    def get(self):
+        """Pops the next sample, waiting for it if none is ready."""
+        self.depth_sum += self._queue.qsize()
+        start_time = perf_counter()
+        try:
+            item, error = self._queue.get_nowait()
+        except queue.Empty:
+            self.empty_gets += 1
+            item, error = self._queue.get()
+        self.wait_time += perf_counter() - start_time
+        self.consumed += 1
+        if error is not None:
+            raise error
+        return item
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of samples currently ready."""
+        return self._queue.qsize()
+
+    def stop(self):
+        """Stops the producer thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        return {'queue_depth': self.queue_depth,
+                'mean_queue_depth': self.depth_sum / self.consumed
+                if self.consumed else 0.,
+                'produced': self.produced,
+                'consumed': self.consumed,
+                'mean_producer_latency': self.producer_time / self.produced
+                if self.produced else 0.,
+                'max_producer_latency': self.max_producer_time,
+                'consumer_wait_time': self.wait_time,
+                'empty_gets': self.empty_gets}
+
+    def report(self) -> str:
+        s = self.stats()
+        return ("Prefetch: {} samples produced, {} consumed. Queue depth "
+                "{:.1f} of {} on average, empty {} times. Producer latency: "
+                "{:.1f}ms mean, {:.1f}ms max. Consumer waited {:.2f}s in "
+                "total.".format(s['produced'], s['consumed'],
+                                s['mean_queue_depth'], self.depth,
+                                s['empty_gets'],
+                                s['mean_producer_latency'] * 1000,
+                                s['max_producer_latency'] * 1000,
+                                s['consumer_wait_time']))
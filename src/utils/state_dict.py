@@ -0,0 +1,20 @@
+"""State Dict.
+
+Loads a model state dict saved by torch or converted to numpy by to_numpy.py.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+"""
+import numpy as np
+
+
+def load_state_dict(path: str) -> dict:
+    """Loads a numpy .npy or torch .pth state dict.
+
+    torch is only imported for .pth files, so numpy state dicts can be
+    loaded on the Pi.
+    """
+    if path.endswith('.npy'):
+        return np.load(path, allow_pickle=True).item()
+    import torch
+    return torch.load(path, map_location=torch.device('cpu'))
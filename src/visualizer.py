@@ -6,8 +6,10 @@ import tkinter as tk
 from PIL import Image, ImageTk
 import numpy as np
 from math import floor
+from time import perf_counter
 
-from inference import AI
+from inference import AI, connection_activations
+from utils.prefetch import Prefetcher
 from colors import LINEAR, DIVERGING
 from importlib.util import find_spec
 import os
@@ -30,13 +32,17 @@ class ImageFrame(tk.Frame):
                                                      image=self.img)
         self.canvas.pack()
 
-    def update_image(self, image: np.ndarray):
+    def update_image(self, image):
         """Updates the image with the given image array.
 
         Args:
-            image: A numpy array with size [28, 28]
+            image: A numpy array with size [28, 28] or an already resized
+                280 x 280 PIL Image.
         """
-        img = Image.fromarray(image).resize((280, 280), Image.NEAREST)
+        if isinstance(image, Image.Image):
+            img = image
+        else:
+            img = Image.fromarray(image).resize((280, 280), Image.NEAREST)
         self.img = ImageTk.PhotoImage(image=img)
         self.canvas.itemconfig(self.canvas_image, image=self.img)
 
@@ -60,8 +66,23 @@ class PredictionOutput(tk.Frame):
 
 
 class NetworkVisualization(tk.Frame):
-    def __init__(self, num_l1, num_l2, fc1_weights, fc2_weights, master=None):
-        """Class for frames that show the network visualization"""
+    # Each of the 5 animation steps is 255 ticks long
+    TICKS_PER_STEP = 255
+    NUM_STEPS = 5
+
+    def __init__(self, num_l1, num_l2, fc1_weights, fc2_weights, master=None,
+                 fps: int = 30, animation_time: float = 1.):
+        """Class for frames that show the network visualization.
+
+        Only canvas items whose color actually changed are reconfigured, and
+        the animation runs at a fixed frame rate. Ticks are derived from the
+        elapsed time, so a slow frame skips ahead instead of slowing the
+        animation down.
+
+        Args:
+            fps: Frame rate of the animation.
+            animation_time: Duration of the whole animation in seconds.
+        """
         self.height = 800
         self.width = 1000
         super().__init__(master=master, width=self.width, height=self.height)
@@ -72,6 +93,21 @@ class NetworkVisualization(tk.Frame):
         self.current_pred = 0
         self.current_tick = 0
 
+        self.frame_interval = 1. / fps
+        self.animation_time = animation_time
+        self._applied = dict()  # item id -> last applied fill
+        self._strong = set()  # connections drawn above the others
+        self._anim_start = 0.
+        self._last_frame = None
+        self._last_step = 0
+
+        # Performance counters
+        self.frames = 0
+        self.dropped_frames = 0
+        self.item_updates = 0
+        self.frame_time = 0.
+        self.max_frame_time = 0.
+
         self.canvas = tk.Canvas(self, width=self.width, height=self.height)
 
         neurons_per_layer = [num_l1, num_l2, 10]
@@ -113,6 +149,7 @@ class NetworkVisualization(tk.Frame):
                                                      smooth=True,
                                                      splinesteps=50,
                                                      width=1.5))
+                self._applied[lines[-1]] = DIVERGING[128]
 
         return lines
 
@@ -141,104 +178,189 @@ class NetworkVisualization(tk.Frame):
                 ((start_x, start_y), (start_x + diameter, start_y + diameter)),
                 fill=LINEAR[0], tag='neuron'
             ))
+            self._applied[out[-1]] = LINEAR[0]
         return out
 
-    def update_neurons(self, h1, h2, pred):
-        """Update values of the neurons.
+    def _set_fill(self, item: int, fill: str):
+        """Reconfigures an item only if its fill changed."""
+        if self._applied[item] != fill:
+            self.canvas.itemconfig(item, fill=fill)
+            self._applied[item] = fill
+            self.item_updates += 1
+
+    def _restack(self, strong: set):
+        """Draws the strong connections above the weak ones.
+
+        Only connections whose strength changed get their tag changed, and
+        the stacking order is then changed in two calls for all of them.
+        """
+        for item in self._strong - strong:
+            self.canvas.dtag(item, 'strong')
+        for item in strong - self._strong:
+            self.canvas.addtag_withtag('strong', item)
+        self._strong = strong
+        if strong:
+            self.canvas.tag_raise('strong')
+            # Connections must never cover the neurons
+            self.canvas.tag_raise('neuron')
+
+    def prepare(self, h1, h2) -> (list, list, set):
+        """Post-processes layer outputs into the values the animation uses.
+
+        Does not touch Tk, so it can run on a background thread.
 
         Args:
             h1 (torch.Tensor): Tensor representing outputs of layer 1.
             h2 (torch.Tensor): Tensor representing outputs of layer 2.
-            pred (int): Int representing what the output answer is.
-        """
-        if self._job is not None:
-            self.after_cancel(self._job)
-            self._job = None
 
-        self.current_h = [h1.reshape(len(self.layers[0])),
-                          h2.reshape(len(self.layers[1]))]
-        self.ca = []
-        self.current_pred = pred
-        self.current_tick = 0
+        Returns:
+            The normalized layer outputs, the connection activations and the
+            set of strong connection items.
+        """
+        current_h = [h1.reshape(len(self.layers[0])),
+                     h2.reshape(len(self.layers[1]))]
+        ca = []
+        strong = set()
 
         for i in range(2):
             # Reshapse to a flat layer, normalizes it, turns it to a value out
             # of 255, then turns it into a numpy array.
-            h = self.current_h[i]
+            h = current_h[i]
             if not USE_NUMPY:
                 h = h.numpy()
 
-            # Get connection activations
-            fw = self.fc_weights[i]
-            activations = h * fw
-            activations /= np.max(np.abs(activations)) * 2
-            activations = activations.flatten()
-            self.ca.append(activations)
-            for j, val in enumerate(activations):
-                item_id = self.connections[i][j]
-                if abs(val) > 0.2:
-                    self.canvas.tag_raise(item_id)
-                else:
-                    self.canvas.tag_lower(item_id)
+            # Get connection activations, in the order the connections were
+            # created in
+            activations = connection_activations(
+                h.reshape(1, -1), self.fc_weights[i]).flatten()
+            ca.append(activations)
+            strong.update(self.connections[i][j]
+                          for j in np.flatnonzero(np.abs(activations) > 0.2))
             h /= h.max()
 
             # Turns it into an integer value, clips it to 0 to 255, and turns it
             # into a python list.
             # h = h.clip(0, 1.).tolist()
-            self.current_h[i] = h
+            current_h[i] = h
+
+        return current_h, ca, strong
+
+    def update_neurons(self, h1, h2, pred, prepared=None):
+        """Update values of the neurons.
+
+        Args:
+            h1 (torch.Tensor): Tensor representing outputs of layer 1.
+            h2 (torch.Tensor): Tensor representing outputs of layer 2.
+            pred (int): Int representing what the output answer is.
+            prepared (tuple): Output of prepare() if it was already called,
+                in which case h1 and h2 are ignored.
+        """
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+
+        if prepared is None:
+            prepared = self.prepare(h1, h2)
+        self.current_h, self.ca, strong = prepared
+        self.current_pred = pred
+        self.current_tick = 0
+
+        self._restack(strong)
 
         for layer in self.layers:
             for neuron in layer:
-                self.canvas.itemconfig(neuron, fill=LINEAR[0])
+                self._set_fill(neuron, LINEAR[0])
 
         for layer in self.connections:
             for connection in layer:
-                self.canvas.itemconfig(connection, fill=DIVERGING[128])
+                self._set_fill(connection, DIVERGING[128])
 
+        self._anim_start = perf_counter()
+        self._last_frame = None
+        self._last_step = 0
         self._animate_neurons()
 
-    def _animate_neurons(self):
-        """Animates the neurons."""
-        step = floor(self.current_tick / 255)
-        t_val = self.current_tick % 255
+    def _render_step(self, step: int, t_val: int):
+        """Sets the colors of one animation step at tick t_val of it."""
         if step == 4:
             # Final layer animation, aka output layer
             for i in range(10):
                 if i == self.current_pred:
-                    self.canvas.itemconfig(
-                        self.layers[2][i],
-                        fill=LINEAR[floor(1. * t_val)])
+                    self._set_fill(self.layers[2][i],
+                                   LINEAR[floor(1. * t_val)])
                 else:
-                    self.canvas.itemconfig(self.layers[2][i], fill=LINEAR[0])
+                    self._set_fill(self.layers[2][i], LINEAR[0])
         elif step in (0, 2):
             # Normal neurons
             layer = int(step / 2)
-            for j, n in enumerate(self.current_h[layer]):
-                self.canvas.itemconfig(self.layers[layer][j],
-                                       fill=LINEAR[floor(n * t_val)])
+            indices = np.floor(self.current_h[layer] * t_val).astype(int)
+            for item, idx in zip(self.layers[layer], indices):
+                self._set_fill(item, LINEAR[idx])
 
         elif step in (1, 3):
             # Animations for connections
             layer = int((step - 1) / 2)
-            for j, val in enumerate(self.ca[layer]):
-                self.canvas.itemconfig(self.connections[layer][j],
-                                       fill=DIVERGING[floor(val * t_val) + 128])
-
-        # Add to tick if still animating
-        if step < 5:
-            self.current_tick += 12
-            self._job = self.after(1, self._animate_neurons)
+            indices = np.floor(self.ca[layer] * t_val).astype(int) + 128
+            for item, idx in zip(self.connections[layer], indices):
+                self._set_fill(item, DIVERGING[idx])
+
+    def _animate_neurons(self):
+        """Renders one frame of the animation."""
+        now = perf_counter()
+        if self._last_frame is not None:
+            late = now - self._last_frame - self.frame_interval
+            if late > self.frame_interval / 2:
+                self.dropped_frames += round(late / self.frame_interval)
+        self._last_frame = now
+
+        total_ticks = self.TICKS_PER_STEP * self.NUM_STEPS
+        self.current_tick = min(
+            int((now - self._anim_start) / self.animation_time * total_ticks),
+            total_ticks)
+        step = self.current_tick // self.TICKS_PER_STEP
+        t_val = self.current_tick % self.TICKS_PER_STEP
+
+        # Finish the steps skipped over by a late frame
+        for skipped in range(self._last_step, step):
+            self._render_step(skipped, self.TICKS_PER_STEP - 1)
+        self._last_step = step
+        if step < self.NUM_STEPS:
+            self._render_step(step, t_val)
+
+        frame_time = perf_counter() - now
+        self.frames += 1
+        self.frame_time += frame_time
+        self.max_frame_time = max(self.max_frame_time, frame_time)
+
+        if step < self.NUM_STEPS:
+            # Schedule the next frame on the frame grid
+            delay = self.frame_interval - frame_time
+            self._job = self.after(max(1, int(delay * 1000)),
+                                   self._animate_neurons)
         else:
             # Done animating the current set
             self.current_tick = 0
+            self._job = None
+
+    def stats(self) -> dict:
+        """Frame time and dropped frame counters of the animation."""
+        return {'frames': self.frames,
+                'dropped_frames': self.dropped_frames,
+                'item_updates': self.item_updates,
+                'mean_frame_time': self.frame_time / self.frames
+                if self.frames else 0.,
+                'max_frame_time': self.max_frame_time}
 
 
 class VisualizerUI:
-    def __init__(self, mnist_root):
+    def __init__(self, mnist_root, fps=30, prefetch=4):
         """Creates a prediction visualizer GUI.
 
         Args:
             mnist_root (str): Path to the mnist root file.
+            fps (int): Frame rate of the network animation.
+            prefetch (int): Number of samples prepared ahead of time on a
+                background thread.
         """
         self.root = tk.Tk()
         self.root.title("MNIST FCNetwork Inference")
@@ -290,13 +412,17 @@ class VisualizerUI:
                                                 self.ai.layer_2_neurons,
                                                 self.ai.fc1_weight,
                                                 self.ai.fc2_weight,
-                                                self.bf)
+                                                self.bf, fps)
         self.network_vis.grid(row=2, column=0, columnspan=2)
         self.bf.pack()
         self.playing = False
         self._job = []
 
+        self.prefetcher = Prefetcher(self._produce, prefetch)
+
         self.root.mainloop()
+        self.prefetcher.stop()
+        print(self.report())
 
     def play(self):
         """Plays endlessly until play is pressed again"""
@@ -310,20 +436,39 @@ class VisualizerUI:
             self.play_var.set('Stop')
             self._job = self.root.after(1, self.get_next)
 
-    def get_next(self):
-        """Predicts the next values."""
+    def _produce(self):
+        """Computes the next sample. Runs on the prefetch thread."""
         img, pred, h1, h2 = self.ai.infer_next()
+        img = Image.fromarray(img).resize((280, 280), Image.NEAREST)
+        return img, pred, self.network_vis.prepare(h1, h2)
+
+    def get_next(self):
+        """Shows the next prefetched values."""
+        img, pred, prepared = self.prefetcher.get()
         self.image_frame.update_image(img)
         self.pred_frame.update_prediction(str(pred))
-        self.network_vis.update_neurons(h1, h2, pred)
+        self.network_vis.update_neurons(None, None, pred, prepared)
 
         if self.playing:
             self._job = self.root.after(2000, self.get_next)
 
+    def report(self) -> str:
+        """Summary of the animation performance counters."""
+        s = self.network_vis.stats()
+        return ("{} frames, {} dropped, {} canvas item updates. Frame time: "
+                "{:.2f}ms mean, {:.2f}ms max.".format(
+                    s['frames'], s['dropped_frames'], s['item_updates'],
+                    s['mean_frame_time'] * 1000, s['max_frame_time'] * 1000)) \
+            + '\n' + self.prefetcher.report()
+
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
     p.add_argument('-r', type=str, default=None)
+    p.add_argument('--fps', type=int, default=30,
+                   help='frame rate of the network animation')
+    p.add_argument('--prefetch', type=int, default=4,
+                   help='number of samples prepared ahead of time')
     args = p.parse_args()
 
-    v = VisualizerUI(args.r)
+    v = VisualizerUI(args.r, args.fps, args.prefetch)